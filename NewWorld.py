@@ -4,16 +4,24 @@ OpenHTF-based tool to run tests
 
 import os
 import argparse
+import functools
 import logging
 import subprocess
 import sys
-import time
 import webbrowser
 import smbus
 import re
 import serial
 import json_serial
+import serial_broker
+import mic_analysis
+import mic_capture
+import phase_groups
+import station
+import summary
+import sysfs_gpio
 from random import randint
+from typing import List, Dict, Any
 
 import openhtf as htf
 from openhtf.output.callbacks import json_factory
@@ -38,6 +46,39 @@ import Camera
 # MIC board test files
 import micstest
 
+# reply timeouts in s for slow jig commands, the old polling reader waited up to ~6 s for them
+JIG_TIMEOUTS = {"PwrOn": 6, "TestEncoder": 6, "TestLightSns": 6}
+# time in s for operator to press DUT button
+BUTTON_TIMEOUT = 10
+MUTE_EVENTS = [{"Buttons": "Changed", "LedSense": 1, "MicEn": 0, "MicEnN": 1},
+               {"Buttons": "Changed", "LedSense": 0, "MicEn": 1, "MicEnN": 0}]
+ALICE_EVENTS = [{"Buttons": "Changed", "KeyFunc": 0},
+                {"Buttons": "Changed", "KeyFunc": 1}]
+
+
+def button_test(serial_port: json_serial.JsonSerialPort, sequence: List[Dict[str, Any]],
+                timeout: float = BUTTON_TIMEOUT) -> List[Dict[str, Any]]:
+    """
+    pings jig of slot and collects DUT button events until sequence is received or timeout
+    :param serial_port: jig port of slot
+    :param sequence: expected button events
+    :param timeout: time for button press in s
+    :return: jig reply first, then button events, empty if jig does not answer
+    """
+    # events are served by background reader, subscription is made before press is possible
+    serial_port.start_reader()
+    subscription = serial_port.subscribe(predicate=serial_port.is_event)
+    reply = serial_port.request({"Cmd": "Ping"})
+    if reply is None:
+        serial_port.unsubscribe(subscription)
+        return []
+    frames = [reply.data]
+    for event in serial_port.iter_json(idle_timeout=timeout, timeout=timeout, subscription=subscription):
+        frames.append(event.data)
+        if json_serial.has_sequence(frames[1:], sequence):
+            break
+    return frames
+
 
 class TestTypes(Enum):
     LED_BOARD_TEST = 'LedBoardTest'
@@ -53,45 +94,36 @@ class TestTypes(Enum):
 
 
 # ----------------MIC Board-------------------------------------------------
-def mic_board_test():
-    # Yellow LED init
-    os.system('echo 25 > /sys/class/gpio/export')
-    time.sleep(0.1)
-    os.system('echo out > /sys/class/gpio/gpio25/direction')
-    # Red LED init
-    os.system('echo 24 > /sys/class/gpio/export')
-    time.sleep(0.1)
-    os.system('echo out > /sys/class/gpio/gpio24/direction')
-    # Green LED init
-    os.system('echo 22 > /sys/class/gpio/export')
-    time.sleep(0.1)
-    os.system('echo out > /sys/class/gpio/gpio22/direction')
-    # Button init
-    os.system('echo 27 > /sys/class/gpio/export')
-    time.sleep(0.1)
-    os.system('echo in > /sys/class/gpio/gpio27/direction')
-    serial_port = json_serial.JsonSerialPort()
-    jig_status = serial_port.full_one_cycle_with_key({"Cmd": "Ping"})
-    if jig_status == 'ok':
-        UARTcmd.GreenLED('ON')
-        UARTcmd.RedLED('OFF')
-    else:
-        UARTcmd.GreenLED('OFF')
-        UARTcmd.RedLED('ON')
+def mic_board_test(slot: station.Slot = None, once: bool = False):
+    """
+    runs microphones board test plan
+    :param slot: station slot with jig port, GPIO pins and DUT id, single jig station if None
+    :param once: test one DUT, otherwise DUTs are tested continuously with warm port and GPIOs
+    """
+    if slot is None:
+        slot = station.Slot("MIC")
+    # LEDs and start button, value files stay open for all DUTs
+    gpio = sysfs_gpio.GpioBank(slot.gpio, inputs=("button",))
+    serial_port = json_serial.get_port(slot.port_id)
+    # jig Ping after every DUT is answered from cache, PwrOn/PwrOff drop power dependent responses
+    serial_port.cache = json_serial.ResponseCache({"Ping": 30})
+    # all power rails are read with one Get command shared by power measurement phases
+    rails = json_serial.BatchedGet(serial_port, ["5vV", "3v3V", "3v3InV"])
+
+    def status_leds(ok: bool):
+        """
+        shows jig status on green and red LEDs of slot
+        :param ok: jig answers
+        :return:
+        """
+        gpio["green"].write(1 if ok else 0)
+        gpio["red"].write(0 if ok else 1)
+
+    status_leds(json_serial.is_ok(serial_port.full_one_cycle_with_key({"Cmd": "Ping"})))
 
     TestName = ' MicrophonesBoardTest'
     os.system('mkdir ' + os.getcwd() + '/' + TestName)
     mic_board = TestPlan(TestName, True)
-    testresults = [
-        'echo \"\e[1m  - 5V:      Not Start\e[0m"\n',
-        'echo \"\e[1m  - 3.3V:    Not Start\e[0m"\n',
-        'echo \"\e[1m  - 3.3Vmic: Not Start\e[0m"\n',
-        'echo \"\e[1m- Encoder Test:        Not Start\e[0m"\n',
-        'echo \"\e[1m- Light Sensor Test:   Not Start\e[0m"\n',
-        'echo \"\e[1m- \"Mute\" Button Test:  Not Start\e[0m"\n',
-        'echo \"\e[1m- \"Alice\" Button Test: Not Start\e[0m"\n',
-        'echo \"\e[1m- Microphones Test:    Not Start\e[0m"\n'
-    ]
     teststatus = "NOT STARTED"
     HERE = os.path.abspath(os.path.dirname(__file__))
     FORM_LAYOUT = {
@@ -144,23 +176,25 @@ DUT id will be gererated automatically from income data
 DUT id will be gererated automatically from income data
        """
         # greet.greet_button()
-        test.dut_id = 'YMAC200531' + str(randint(10000, 99999))
-        UARTcmd.YellowLED('ON')
-        pressbutton = 'none'
-        while pressbutton != '0\n':
-            command = ['cat', '/sys/class/gpio/gpio27/value']
-            pipopen = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            pressbutton = pipopen.stdout.read()
-            pressbutton = pressbutton.decode(encoding='utf-8')
-        UARTcmd.YellowLED('OFF')
+        test.dut_id = slot.dut_id or 'YMAC200531' + str(randint(10000, 99999))
+        gpio["yellow"].write(1)
+        # sleeps until button edge interrupt, button is pressed when value is 0
+        button = gpio["button"]
+        pressed = button.wait_for(0)
+        gpio["yellow"].write(0)
+        if not pressed:
+            # no test is started without button press, otherwise continuous run makes phantom test records
+            raise RuntimeError("start button is not available: %s" % (button.error or "no press"))
         devidin = test.dut_id
         test.measurements.DUT_ID = devidin
 
     @mic_board.testcase('Power On')
-    @htf.measures(htf.Measurement('PowerOn').with_validator(lambda PwrOn: PwrOn == "ok"))
+    @htf.measures(htf.Measurement('PowerOn').with_validator(lambda PwrOn: json_serial.is_ok(PwrOn)))
     def PowerOn(test):
-        serial_port = json_serial.JsonSerialPort()
-        PwrOn = serial_port.full_one_cycle_with_key({"Cmd": "PwrOn"})
+        rails.reset()
+        serial_port = json_serial.get_port(slot.port_id)
+        PwrOn = serial_port.full_one_cycle_with_key({"Cmd": "PwrOn"},
+                                                    timeout=JIG_TIMEOUTS["PwrOn"])
         test.measurements.PowerOn = PwrOn
 
     # @mic_board.testcase('STM32 Status')
@@ -179,14 +213,7 @@ DUT id will be gererated automatically from income data
     def MIC5V(test, greet):
         """Voltage measurement in the 5V power circuit"""
         test.logger.info('Measure 5V')
-        serial_port = json_serial.JsonSerialPort()
-        MIC5Vmeas = serial_port.full_one_cycle_with_key({"Cmd": "Get", "Params": ["5vV"]}, "5vV")
-        nonlocal testresults
-        if isinstance(MIC5Vmeas, int) and 4800 < MIC5Vmeas < 5200:
-            code = 32
-        else:
-            code = 31
-        testresults[0] = 'echo \"\e[' + str(code) + ';1m  - 5V:      ' + str(MIC5Vmeas) + '\e[0m"\n'
+        MIC5Vmeas = rails.get("5vV")
         test.measurements.MIC5V_measurement = MIC5Vmeas
 
     @mic_board.testcase('Power circuit 3.3V')
@@ -195,14 +222,7 @@ DUT id will be gererated automatically from income data
     def MIC3V3(test, greet):
         """Voltage measurement in the 3.3V power circuit"""
         test.logger.info('Measure 3V3')
-        serial_port = json_serial.JsonSerialPort()
-        MIC3V3meas = serial_port.full_one_cycle_with_key({"Cmd": "Get", "Params": ["3v3V"]}, "3v3V")
-        nonlocal testresults
-        if isinstance(MIC3V3meas, int) and 3100 < MIC3V3meas > 3500:
-            code = 32
-        else:
-            code = 31
-        testresults[1] = ('echo \"\e[' + str(code) + ';1m  - 3.3V:    ' + str(MIC3V3meas) + '\e[0m"\n')
+        MIC3V3meas = rails.get("3v3V")
         test.measurements.MIC3V3_measurement = MIC3V3meas
 
     @mic_board.testcase('Power circuit 3.3V intrernal')
@@ -211,61 +231,103 @@ DUT id will be gererated automatically from income data
     def MIC3V3mic(test, greet):
         """Voltage measurement in the 3.3V internal power circuit"""
         test.logger.info('Measure 3V3mic')
-        serial_port = json_serial.JsonSerialPort()
-        MIC3V3micmeas = serial_port.full_one_cycle_with_key({"Cmd": "Get", "Params": ["3v3InV"]}, "3v3InV")
-        nonlocal testresults
-        if isinstance(MIC3V3micmeas, int) and 3100 < MIC3V3micmeas < 3500:
-            code = 32
-        else:
-            code = 31
-        testresults[2] = ('echo \"\e[' + str(code) + ';1m  - 3.3Vmic: ' + str(MIC3V3micmeas) + '\e[0m"\n')
+        MIC3V3micmeas = rails.get("3v3InV")
         test.measurements.MIC3V3mic_measurement = MIC3V3micmeas
 
-    @mic_board.testcase('Encoder Test')
-    @htf.measures(htf.Measurement('Encoder_test').with_validator(lambda MICencoderTestmeas: MICencoderTestmeas == 'ok'))
-    def MICencoderTest(test):
-        serial_port = json_serial.JsonSerialPort()
-        MICencoderTestmeas = serial_port.full_one_cycle_with_key({"Cmd": "TestEncoder"})
-        nonlocal testresults
-        if MICencoderTestmeas == 'ok':
-            testresults[3] = ('echo \"\e[32;1m- Encoder Test:      Pass\e[0m"\n')
+    # UART is idle while mics are recorded, so serial tests run at the same time
+    mic_group = phase_groups.PhaseGroup('Sound Test group')
+
+    # TestMics is sent first, serial members wait for it so playback and recording are not delayed by them
+    @mic_group.member('Sound Test', resources=("audio",), signals=("TestMics sent",))
+    def MICsoundTest(test):
+        """Microphone Recording Analysis"""
+        test.logger.info('Start microphones test')
+        teststorage = os.getcwd() + '/' + TestName + '/' + TestName + '.time' + \
+                      str(test.test_record.start_time_millis) + '.id' + test.dut_id
+        testwav = 'id' + test.dut_id + 'time' + str(test.test_record.start_time_millis) + '.wav'
+        os.makedirs(teststorage)
+        card = mic_capture.find_card()
+        if card is not None:
+            # sound card is shared by all station slots
+            with station.resource("audio"):
+                # jig starts playback, serial port is free for other members while mics are recorded
+                with mic_group.hold("serial"):
+                    json_serial.get_port(slot.port_id).send({"Cmd": "TestMics", "a": 300})
+                    mic_group.signal("TestMics sent")
+                capture = mic_capture.record(card, teststorage + '/' + testwav)
+            if capture.error:
+                raise RuntimeError(capture.error)
+            test.logger.info('Mics recorded in %.1f s%s' % (capture.elapsed,
+                                                            ', stopped early' if capture.stopped_early else ''))
+            test.logger.info('Mic levels: %s' % capture.measurement()[1])
+            # missing reference fails the test even if levels are fine
+            if not os.path.isfile(mic_analysis.REFERENCE):
+                MICsoundTestmeas = ['No example file']
+            else:
+                # micstest gives verdict, level check only stops recording early on failed channel.
+                # mic_analysis limits are not calibrated against micstest yet
+                capture.wav.close(wait=True)
+                MICsoundTestmeas = micstest.process_file(teststorage + '/', testwav)
+            test.logger.info(MICsoundTestmeas[-1])
         else:
-            testresults[3] = ('echo \"\e[31;1m- Encoder Test:      Fail\e[0m"\n')
-        test.measurements.Encoder_test = MICencoderTestmeas
+            MICsoundTestmeas = ['No sound card']
+            test.logger.error(MICsoundTestmeas[0])
+
+        nonlocal teststatus
+        teststatus = test.test_record.outcome
+        return MICsoundTestmeas
+
+    @mic_group.member('Encoder Test', resources=("serial",), after_signals=("TestMics sent",))
+    def MICencoderTest(test):
+        serial_port = json_serial.get_port(slot.port_id)
+        MICencoderTestmeas = serial_port.full_one_cycle_with_key({"Cmd": "TestEncoder"},
+                                                                 timeout=JIG_TIMEOUTS["TestEncoder"])
+        return MICencoderTestmeas
+
+    @mic_group.member('Light Sensor Test', resources=("serial",), after_signals=("TestMics sent",))
+    def MIClightSensorTest(test):
+        serial_port = json_serial.get_port(slot.port_id)
+        MIClightSensorTestmeas = serial_port.full_one_cycle_with_key({"Cmd": "TestLightSns"},
+                                                                     timeout=JIG_TIMEOUTS["TestLightSns"])
+        return MIClightSensorTestmeas
+
+    @mic_board.testcase('Sound, Encoder and Light Sensor Test')
+    @htf.TestPhase(timeout_s=60 * 60)
+    def MICsoundGroupTest(test):
+        """Microphone recording with encoder and light sensor tests at the same time, results are in next phases"""
+        mic_group.run(test, raise_error=False)
+
+    # every member gets its own phase with its outcome and measurement, error of one member does not mark others
+    @mic_board.testcase('Encoder Test')
+    @htf.measures(htf.Measurement('Encoder_test').with_validator(lambda MICencoderTestmeas:
+                                                                 json_serial.is_ok(MICencoderTestmeas)))
+    def MICencoderTestResult(test):
+        test.measurements.Encoder_test = mic_group.result('Encoder Test')
 
     @mic_board.testcase('Light Sensor Test')
     @htf.measures(htf.Measurement('LightSensorTest').with_validator(lambda MIClightSensorTestmeas:
-                                                                    MIClightSensorTestmeas == 'ok'))
-    def MIClightSensorTest(test):
-        serial_port = json_serial.JsonSerialPort()
-        MIClightSensorTestmeas = serial_port.full_one_cycle_with_key({"Cmd": "TestLightSns"})
-        nonlocal testresults
-        if MIClightSensorTestmeas == 'ok':
-            testresults[4] = ('echo \"\e[32;1m- Light Sensor Test: Pass\e[0m"\n')
-        else:
-            testresults[4] = ('echo \"\e[31;1m- Light Sensor Test: Fail\e[0m"\n')
-        test.measurements.LightSensorTest = MIClightSensorTestmeas
+                                                                    json_serial.is_ok(MIClightSensorTestmeas)))
+    def MIClightSensorTestResult(test):
+        test.measurements.LightSensorTest = mic_group.result('Light Sensor Test')
+
+    @mic_board.testcase('Sound Test')
+    @htf.measures(htf.Measurement('SoundTest').with_validator(lambda MICsoundTestmeas: MICsoundTestmeas[0] == 'OK'))
+    def MICsoundTestResult(test):
+        test.measurements.SoundTest = mic_group.result('Sound Test')
 
     @mic_board.testcase('\'Mute\' Button Test')
     @htf.measures(htf.Measurement('MuteButtonTest').with_validator(
         lambda MICMuteButtonTestmeas: MICMuteButtonTestmeas == 'Button \"Mute\" is OK'))
     def MICMuteButtonTest(test):
-        # serial_port = json_serial.JsonSerialPort()
-        MICMuteButtonTestmeas = UARTcmd.buttontest()
-        nonlocal testresults
-        index = MICMuteButtonTestmeas.find('{"Result": "Ok"}')
-        if index != -1:
-            Mutepush = re.findall('{"Buttons":"Changed","LedSense":1,"MicEn":0,"MicEnN":1}\r\n'
-                                  '{"Buttons":"Changed","LedSense":0,"MicEn":1,"MicEnN":0}', MICMuteButtonTestmeas)
-            if len(Mutepush) > 0:
+        frames = button_test(json_serial.get_port(slot.port_id), MUTE_EVENTS)
+        if {"Result": "Ok"} in frames:
+            Mutepush = json_serial.has_sequence(frames, MUTE_EVENTS)
+            if Mutepush:
                 MICMuteButtonTestmeas = 'Button \"Mute\" is OK'
-                testresults[5] = ('echo \"\e[32;1m- \"Mute\" Button Test:  Pass\e[0m"\n')
-            elif len(Mutepush) == 0:
+            else:
                 MICMuteButtonTestmeas = 'Button \"Mute\" does not response correctly'
-                testresults[5] = ('echo \"\e[31;1m- \"Mute\" Button Test:  Fail\e[0m"\n')
         else:
             MICMuteButtonTestmeas = "No STM response"
-            testresults[5] = ('echo \"\e[31;1m- \"Mute\" Button Test:  Fail\e[0m"\n')
 
         test.measurements.MuteButtonTest = MICMuteButtonTestmeas
 
@@ -273,100 +335,32 @@ DUT id will be gererated automatically from income data
     @htf.measures(htf.Measurement('AliceButtonTest').with_validator(
         lambda MICAliceButtonTestmeas: MICAliceButtonTestmeas == 'Button \"Alice\" is OK'))
     def MICAliceButtonTest(test):
-        MICAliceButtonTestmeas = UARTcmd.buttontest()
-        nonlocal testresults
-        Alicepush = re.findall('{"Buttons":"Changed","KeyFunc":0}\r\n{"Buttons":"Changed","KeyFunc":1}',
-                               MICAliceButtonTestmeas)
-        if len(Alicepush) > 0:
+        Alicepush = json_serial.has_sequence(button_test(json_serial.get_port(slot.port_id), ALICE_EVENTS),
+                                             ALICE_EVENTS)
+        if Alicepush:
             MICAliceButtonTestmeas = 'Button \"Alice\" is OK'
-            testresults[6] = ('echo \"\e[32;1m- \"Alice\" Button Test: Pass\e[0m"\n')
         else:
             MICAliceButtonTestmeas = 'Button \"Alice\" does not response correctly'
-            testresults[6] = ('echo \"\e[31;1m- \"Alice\" Button Test: Fail\e[0m"\n')
 
         test.measurements.AliceButtonTest = MICAliceButtonTestmeas
 
-    @mic_board.testcase('Sound Test')
-    @mic_board.plug(greet=GreetPlug)
-    @htf.TestPhase(timeout_s=60 * 60)
-    @htf.measures(htf.Measurement('SoundTest').with_validator(lambda MICsoundTestmeas: MICsoundTestmeas[0] == 'OK'))
-    def MICsoundTest(test, greet):
-        """Microphone Recording Analysis"""
-        test.logger.info('Start microphones test')
-        teststorage = os.getcwd() + '/' + TestName + '/' + TestName + '.time' + \
-                      str(test.test_record.start_time_millis) + '.id' + test.dut_id
-        testwav = 'id' + test.dut_id + 'time' + str(test.test_record.start_time_millis) + '.wav'
-        os.makedirs(teststorage)
-        command = ['arecord', '-l']
-        pipopen = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        bashstr = str(pipopen.stdout.read())
-        index = bashstr.find('card')
-        if index != -1:
-            card = re.findall(r'(\d+)', bashstr)
-            UARTcmd.cmdget({"Cmd": "TestMics", "a": 300}, responseFlag=False)
-            recordstr = 'arecord -D hw:%s,0 -c 8 -f S16_LE -r 16000 -d 12 ' % card[0]
-            recordstr = recordstr + teststorage + '/' + testwav
-            os.system(recordstr)
-        examplepath = '/home/yandex/elenchus/hwtest/Example.wav'
-        micfilepath = teststorage + '/'
-        filepath = micfilepath + testwav
-
-        if os.path.isfile(filepath):
-            if os.path.isfile(examplepath):
-                MICsoundTestmeas = micstest.process_file(teststorage + '/', testwav)
-                test.logger.info(MICsoundTestmeas[1])
-            else:
-                MICsoundTestmeas = ['No example file']
-                test.logger.error(MICsoundTestmeas[0])
-        else:
-            MICsoundTestmeas = ['No test file']
-            test.logger.error(MICsoundTestmeas[0])
-
-        nonlocal testresults
-        nonlocal teststatus
-        teststatus = test.test_record.outcome
-        if MICsoundTestmeas[0] == 'OK':
-            testresults[7] = ('echo \"\e[32;1m- Microphones Test:  Pass\e[0m"\n')
-        else:
-            testresults[7] = ('echo \"\e[31;1m- Microphones Test:  Fail\e[0m"\n')
-        test.measurements.SoundTest = MICsoundTestmeas
-
     # @htf.TestPhase(run_if=lambda: False)
     @mic_board.testcase('DUT Power Off')
     @htf.plugs.plug(prompts=UserInput)
-    @htf.measures(htf.Measurement('PowerOFF').with_validator(lambda PowerOffresp: PowerOffresp == 'ok'))
+    @htf.measures(htf.Measurement('PowerOFF').with_validator(lambda PowerOffresp: json_serial.is_ok(PowerOffresp)))
     def DUTPowerOff(test, prompts):
-        serial_port = json_serial.JsonSerialPort()
+        serial_port = json_serial.get_port(slot.port_id)
         PowerOffresp = serial_port.full_one_cycle_with_key({"Cmd": "PwrOff"})
         test.measurements.PowerOFF = PowerOffresp
-        nonlocal testresults
         outcomes = [p.outcome for p in test.test_record.phases]
         # res=[r.measured_value for r in test.test_record]
-        os.system('echo 25 > /sys/class/gpio/export')
-        os.system('echo out > /sys/class/gpio/gpio25/direction')
-        os.system('echo 0 > /sys/class/gpio/gpio25/value')
-        if outcomes[2] == PhaseOutcome.PASS and outcomes[3] == PhaseOutcome.PASS and outcomes[4] == PhaseOutcome.PASS:
-            powertest = 32
-        else:
-            powertest = 31
+        gpio["yellow"].write(0)
         test.logger.info("""DUT Power Off""")
-        os.system('echo "\e[36;1mDUT Power Off\e[0m"')
+        summary.print_summary(test.test_record)
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[36;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID:' + test.dut_id + ' test status: <p><font color=red>FAIL'
         elif PhaseOutcome.PASS in outcomes:
-            os.system('echo "\e[36;1mTest Status:\e[0m" "\e[32;1mPASS\e[0m"')
             teststatus = 'DUT ID:' + test.dut_id + ' test status: <p><font color=green>PASS'
-        os.system('echo "\e[' + str(powertest) + ';1m- Power measurments:\e[0m"')
-        os.system(testresults[0])
-        os.system(testresults[1])
-        os.system(testresults[2])
-        os.system(testresults[3])
-        os.system(testresults[4])
-        os.system(testresults[5])
-        os.system(testresults[6])
-        os.system(testresults[7])
-        # os.system('echo "\e[36;1m'+str(test.test_record.outcome)+'\e[0m"')
 
         # my_file=open("testphase.txt", "w")
         # resprint=''.join(map(str, test.test_record.phases))
@@ -375,35 +369,21 @@ DUT id will be gererated automatically from income data
         # my_file.close()
         if PhaseOutcome.ERROR in outcomes or PhaseOutcome.FAIL in outcomes:
             prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
-        serial_port = json_serial.JsonSerialPort()
+        serial_port = json_serial.get_port(slot.port_id)
         jig_status = serial_port.full_one_cycle_with_key({"Cmd": "Ping"})
         print(jig_status)
-        if jig_status == 'ok':
-            UARTcmd.GreenLED('ON')
-            UARTcmd.RedLED('OFF')
-        else:
-            UARTcmd.GreenLED('OFF')
-            UARTcmd.RedLED('ON')
+        status_leds(json_serial.is_ok(jig_status))
 
-    mic_board.run()
-    os.system('echo 25 > /sys/class/gpio/unexport')
-    os.system('echo 24 > /sys/class/gpio/unexport')
-    os.system('echo 22 > /sys/class/gpio/unexport')
-    os.system('echo 27 > /sys/class/gpio/unexport')
+    mic_board.add_callbacks(station.record_callback, station.CycleStats(slot.name).record)
+    mic_board.run(once=once)
+    json_serial.close_all()
+    gpio.close()
 
 
 # ----------------LED Screen Board-------------------------------------------------
 
-def led_board_test():
+def led_board_test(once: bool = False):
     led_board = TestPlan('LED Screen Board Test')
-    testresults = [
-        'echo \"\e[1m- 20V: Not Start\e[0m"\n',
-        'echo \"\e[1m- 5V:  Not Start\e[0m"\n',
-        'echo \"\e[1m- STM32 Programming:   Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Off:            Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs 50% intensity:  Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs 100% intensity: Not Start\e[0m"\n',
-    ]
     HERE = os.path.abspath(os.path.dirname(__file__))
     FORM_LAYOUT = {
         'schema': {
@@ -456,12 +436,6 @@ def led_board_test():
         """Voltage measurement in the 20V power circuit"""
         test.logger.info('Measure 20V')
         MIC20Vmeas = UARTcmd.cmdget("20v")
-        nonlocal testresults
-        if isinstance(MIC20Vmeas, int) and MIC20Vmeas < 21000 and MIC20Vmeas > 19000:
-            code = 32
-        else:
-            code = 31
-        testresults[0] = 'echo \"\e[' + str(code) + ';1m  - 20V: ' + str(MIC20Vmeas) + '\e[0m"\n'
         test.measurements.LED20V_measurement = MIC20Vmeas
 
     @led_board.testcase('Power circuit 5V')
@@ -472,12 +446,6 @@ def led_board_test():
         """Voltage measurement in the 5V power circuit"""
         test.logger.info('Measure 5V')
         MIC5Vmeas = UARTcmd.cmdget("5v")
-        nonlocal testresults
-        if isinstance(MIC5Vmeas, int) and MIC5Vmeas < 5200 and MIC5Vmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[1] = 'echo \"\e[' + str(code) + ';1m  - 5V:  ' + str(MIC5Vmeas) + '\e[0m"\n'
         test.measurements.LED5V_measurement = MIC5Vmeas
 
     @led_board.testcase('STM32 Programming')
@@ -485,39 +453,25 @@ def led_board_test():
     def MICSTMPing(test):
         MICSTMProg = UARTcmd.cmdget("Ping")
         test.measurements.STM32_Programming = MICSTMProg
-        if MICSTMProg != 0:
-            testresults[2] = 'echo \"\e[32;1m- STM32 Programming: ' + str(MICSTMProg) + '\e[0m"\n'
-        else:
-            testresults[2] = 'echo \"\e[31;1m- STM32 Programming: ' + str(MICSTMProg) + '\e[0m"\n'
 
     @led_board.testcase('LED Screen Off Test')
     @led_board.plug(greet=GreetPlug)
     @htf.measures(htf.Measurement('LEDScreenOffTest'))  # dummy
     def LEDScreenOffTest(test, greet):
         """Cheching the status when all the LEDs are off"""
-        nonlocal testresults
         photoname = 'LEDoff' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         test.attach_from_file(
             os.path.join(os.path.dirname(__file__), '/home/yandex/elenchus/hwtest/LEDPhoto/%s' % photoname))
         test.measurements.LEDScreenOffTest = photoname
-        if flag == True:
-            testresults[3] = 'echo \"\e[32;1m- LED Screen Off Test: ' + photoname + '\e[0m"\n'
-        else:
-            testresults[3] = 'echo \"\e[31;1m- LED Screen Off Test: FAIL\e[0m"\n'
 
     @led_board.testcase('LED Screen 50% intensity Test')
     @led_board.plug(greet=GreetPlug)
     @htf.measures(htf.Measurement('LEDScreenHalfIntensityTest'))  # dummy
     def LEDScreenOffTest(test, greet):
         """Cheching the status when all the LEDs are turned on at 50% intensity"""
-        nonlocal testresults
         photoname = 'LEDhalf' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
-        if flag == True:
-            testresults[4] = 'echo \"\e[32;1m- LED Screen Off Test: ' + photoname + '\e[0m"\n'
-        else:
-            testresults[4] = 'echo \"\e[31;1m- LED Screen Off Test: FAIL\e[0m"\n'
         test.attach_from_file(
             os.path.join(os.path.dirname(__file__), '/home/yandex/elenchus/hwtest/LEDPhoto/%s' % photoname))
         test.measurements.LEDScreenHalfIntensityTest = photoname
@@ -527,13 +481,8 @@ def led_board_test():
     @htf.measures(htf.Measurement('LEDScreenFullIntensityTest'))  # dummy
     def LEDScreenOffTest(test, greet):
         """Cheching the status when all the LEDs are turned on at 100% intensity"""
-        nonlocal testresults
         photoname = 'LEDon' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
-        if flag == True:
-            testresults[5] = 'echo \"\e[32;1m- LED Screen Off Test: ' + photoname + '\e[0m"\n'
-        else:
-            testresults[5] = 'echo \"\e[31;1m- LED Screen Off Test: FAIL\e[0m"\n'
         test.attach_from_file(
             os.path.join(os.path.dirname(__file__), '/home/yandex/elenchus/hwtest/LEDPhoto/%s' % photoname))
         test.measurements.LEDScreenFullIntensityTest = photoname
@@ -541,48 +490,23 @@ def led_board_test():
     @led_board.testcase('DUT Power Off')
     @htf.plugs.plug(prompts=UserInput)
     def DUTPowerOff(test, prompts):
-        nonlocal testresults
         outcomes = [p.outcome for p in test.test_record.phases]
-        if outcomes[1] == PhaseOutcome.PASS and outcomes[2] == PhaseOutcome.PASS:
-            powertest = 32
-        else:
-            powertest = 31
         test.logger.info("""DUT Power Off""")
-        os.system('echo "\e[36;1mDUT Power Off\e[0m"')
+        summary.print_summary(test.test_record)
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[36;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=red>FAIL'
         elif PhaseOutcome.PASS in outcomes:
-            os.system('echo "\e[36;1mTest Status:\e[0m" "\e[32;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=green>PASS'
-        os.system('echo "\e[' + str(powertest) + ';1m- Power measurments:\e[0m"')
-        os.system(testresults[0])
-        os.system(testresults[1])
-        os.system(testresults[2])
-        os.system(testresults[3])
-        os.system(testresults[4])
-        os.system(testresults[5])
 
         prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
 
-    led_board.run()
+    led_board.add_callbacks(station.CycleStats('LED Screen Board Test').record)
+    led_board.run(once=once)
 
 
 # ----------------LED Ring Board-------------------------------------------------
-def ledring_board_test():
+def ledring_board_test(once: bool = False):
     ledring_board = TestPlan('LED Ring Board Test')
-    testresults = [
-        'echo \"\e[1m- 5V:   Not Start\e[0m"\n',
-        'echo \"\e[1m- 3.3V: Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Off:            Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Red 50% intensity:    Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Green 50% intensity:  Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Blue 50% intensity:   Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Red 100% intensity:   Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Green 100% intensity: Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs Blue 100% intensity:  Not Start\e[0m"\n',
-        'echo \"\e[1m- LEDs 100% intensity:       Not Start\e[0m"\n',
-    ]
     HERE = os.path.abspath(os.path.dirname(__file__))
     FORM_LAYOUT = {
         'schema': {
@@ -645,12 +569,6 @@ def ledring_board_test():
         """Voltage measurement in the 5V power circuit"""
         test.logger.info('Measure 5V')
         LR5Vmeas = UARTcmd.cmdget("5v")
-        nonlocal testresults
-        if isinstance(LR5Vmeas, int) and LR5Vmeas < 5200 and LR5Vmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[0] = 'echo \"\e[' + str(code) + ';1m  - 5V:  ' + str(LR5Vmeas) + '\e[0m"\n'
         test.measurements.LEDRing5V_measurement = LR5Vmeas
 
     @ledring_board.testcase('Power circuit 3.3V')
@@ -661,12 +579,6 @@ def ledring_board_test():
         """Voltage measurement in the 3.3V power circuit"""
         test.logger.info('Measure 3.3V')
         LR3V3meas = UARTcmd.cmdget("3v3")
-        nonlocal testresults
-        if isinstance(LR3V3meas, int) and LR3V3meas < 3500 and LR3V3meas > 3100:
-            code = 32
-        else:
-            code = 31
-        testresults[1] = 'echo \"\e[' + str(code) + ';1m  - 3.3V: ' + str(LR3V3meas) + '\e[0m"\n'
         test.measurements.LEDRing3V3_measurement = LR3V3meas
 
     @ledring_board.testcase('LED Ring Off Test')
@@ -674,7 +586,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingOffTest'))  # dummy
     def LEDRingOffTest(test, greet):
         """Cheching the status when all the LEDs are off"""
-        nonlocal testresults
         photoname = 'LEDRingoff' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -687,7 +598,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingRedHalfIntensityTest'))  # dummy
     def LEDRingRedHalfIntensityTest(test, greet):
         """Cheching the status when all the red LEDs are turned on at 50% intensity"""
-        nonlocal testresults
         photoname = 'LEDRedHalf' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -700,7 +610,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingGreenHalfIntensityTest'))  # dummy
     def LEDRingGreenHalfIntensityTest(test, greet):
         """Cheching the status when all the green LEDs are turned on at 50% intensity"""
-        nonlocal testresults
         photoname = 'LEDGreenHalf' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -713,7 +622,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingBlueHalfIntensityTest'))  # dummy
     def LEDRingBlueHalfIntensityTest(test, greet):
         """Cheching the status when all the blue LEDs are turned on at 50% intensity"""
-        nonlocal testresults
         photoname = 'LEDBlueHalf' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -726,7 +634,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingRedFullIntensityTest'))  # dummy
     def LEDRingRedFullIntensityTest(test, greet):
         """Cheching the status when all the red LEDs are turned on at 100% intensity"""
-        nonlocal testresults
         photoname = 'LEDRedFull' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -739,7 +646,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingGreenFullIntensityTest'))  # dummy
     def LEDRingGreenFullIntensityTest(test, greet):
         """Cheching the status when all the green LEDs are turned on at 100% intensity"""
-        nonlocal testresults
         photoname = 'LEDGreenFull' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -752,7 +658,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingBlueFullIntensityTest'))  # dummy
     def LEDRingBlueFullIntensityTest(test, greet):
         """Cheching the status when all the blue LEDs are turned on at 100% intensity"""
-        nonlocal testresults
         photoname = 'LEDBlueFull' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -765,7 +670,6 @@ def ledring_board_test():
     @htf.measures(htf.Measurement('LEDRingFullIntensityTest'))  # dummy
     def LEDRingONTest(test, greet):
         """Cheching the status when all the LEDs are turned on at 100% intensity"""
-        nonlocal testresults
         photoname = 'LEDon' + test.test_record.dut_id + '.jpeg'
         flag = Camera.LEDScreenPhoto(photoname)
         # if flag==True:
@@ -776,52 +680,24 @@ def ledring_board_test():
     @ledring_board.testcase('DUT Power Off')
     @htf.plugs.plug(prompts=UserInput)
     def DUTPowerOff(test, prompts):
-        nonlocal testresults
         outcomes = [p.outcome for p in test.test_record.phases]
-        if outcomes[2] == PhaseOutcome.PASS and outcomes[3] == PhaseOutcome.PASS:
-            powertest = 32
-        else:
-            powertest = 31
         test.logger.info("""DUT Power Off""")
-        os.system('echo "\e[36;1mDUT Power Off\e[0m"')
+        summary.print_summary(test.test_record)
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[31;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=red>FAIL'
         elif PhaseOutcome.PASS in outcomes:
-            os.system('echo "\e[32;1mTest Status:\e[0m" "\e[32;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=green>PASS'
-        os.system('echo "\e[' + str(powertest) + ';1m- Power measurments:\e[0m"')
-        os.system(testresults[0])
-        os.system(testresults[1])
-        os.system(testresults[2])
-        os.system(testresults[3])
-        os.system(testresults[4])
-        os.system(testresults[5])
-        os.system(testresults[6])
-        os.system(testresults[7])
-        os.system(testresults[8])
-        os.system(testresults[9])
 
         prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
 
-    led_board.run()
+    ledring_board.add_callbacks(station.CycleStats('LED Ring Board Test').record)
+    ledring_board.run(once=once)
 
 
 # ----------------SOM Board-------------------------------------------------
 
-def som_board_test():
+def som_board_test(once: bool = False):
     som_board = TestPlan('LED Ring Board Test')
-    testresults = [
-        'echo \"\e[1m- 5V:        Not Start\e[0m"\n',
-        'echo \"\e[1m- 3.3V:      Not Start\e[0m"\n',
-        'echo \"\e[1m- 1.8V:      Not Start\e[0m"\n',
-        'echo \"\e[1m- 1.8V EMMC: Not Start\e[0m"\n',
-        'echo \"\e[1m- Vdd CPU:   Not Start\e[0m"\n',
-        'echo \"\e[1m- VDDEE:     Not Start\e[0m"\n',
-        'echo \"\e[1m- 1.5V DDQ:  Not Start\e[0m"\n',
-        'echo \"\e[1m- USB Test: Not Start\e[0m"\n',
-        'echo \"\e[1m- DDR Test: Not Start\e[0m"\n',
-    ]
     HERE = os.path.abspath(os.path.dirname(__file__))
     FORM_LAYOUT = {
         'schema': {
@@ -884,12 +760,6 @@ def som_board_test():
         """Voltage measurement in the 5V power circuit"""
         test.logger.info('Measure 5V')
         SOM5Vmeas = UARTcmd.cmdget("5v")
-        nonlocal testresults
-        if isinstance(SOM5Vmeas, int) and SOM5Vmeas < 5200 and SOM5Vmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[0] = 'echo \"\e[' + str(code) + ';1m  - 5V:        ' + str(SOM5Vmeas) + '\e[0m"\n'
         test.measurements.SOM5V_measurement = SOM5Vmeas
 
     @som_board.testcase('Power circuit 3.3V')
@@ -900,12 +770,6 @@ def som_board_test():
         """Voltage measurement in the 3.3V power circuit"""
         test.logger.info('Measure 3.3V')
         SOM3V3meas = UARTcmd.cmdget("3v3")
-        nonlocal testresults
-        if isinstance(SOM3V3meas, int) and SOM3V3meas < 3500 and SOM3V3meas > 3100:
-            code = 32
-        else:
-            code = 31
-        testresults[1] = 'echo \"\e[' + str(code) + ';1m  - 3.3V:      ' + str(SOM3V3meas) + '\e[0m"\n'
         test.measurements.SOM3V3_measurement = SOM3V3meas
 
     @som_board.testcase('Power circuit 1.8V')
@@ -916,12 +780,6 @@ def som_board_test():
         """Voltage measurement in the 1.8V power circuit"""
         test.logger.info('Measure 1.8V')
         SOM1V8meas = UARTcmd.cmdget("1v8")
-        nonlocal testresults
-        if isinstance(SOM1V8meas, int) and SOM1V8meas < 2000 and SOM1V8meas > 1600:
-            code = 32
-        else:
-            code = 31
-        testresults[2] = 'echo \"\e[' + str(code) + ';1m  - 1.8V:      ' + str(SOM1V8meas) + '\e[0m"\n'
         test.measurements.SOM1V8_measurement = SOM1V8meas
 
     @som_board.testcase('Power circuit 1.8V EMMC')
@@ -932,12 +790,6 @@ def som_board_test():
         """Voltage measurement in the 1.8V EMMC power circuit"""
         test.logger.info('Measure 1.8V EMMC')
         SOM1V8emmcmeas = UARTcmd.cmdget("1v8emmc")
-        nonlocal testresults
-        if isinstance(SOM1V8emmcmeas, int) and SOM1V8meas < 2000 and SOM1V8meas > 1600:
-            code = 32
-        else:
-            code = 31
-        testresults[3] = 'echo \"\e[' + str(code) + ';1m  - 1.8V EMMC: ' + str(SOM1V8emmcmeas) + '\e[0m"\n'
         test.measurements.SOM1V8EMMC_measurement = SOM1V8emmcmeas
 
     @som_board.testcase('Power circuit Vdd CPU')
@@ -948,12 +800,6 @@ def som_board_test():
         """Voltage measurement in the Vdd CPU power circuit"""
         test.logger.info('Measure VDDCPU')
         VDDCPU = UARTcmd.cmdget("vddcpu")
-        nonlocal testresults
-        if isinstance(VDDCPU, int) and VDDCPU < 2000 and VDDCPU > 1600:
-            code = 32
-        else:
-            code = 31
-        testresults[4] = 'echo \"\e[' + str(code) + ';1m  - Vdd CPU:   ' + str(VDDCPU) + '\e[0m"\n'
         test.measurements.VDDCPU_measurement = VDDCPU
 
     @som_board.testcase('Power circuit VDDEE')
@@ -964,12 +810,6 @@ def som_board_test():
         """Voltage measurement in the VDDEE power circuit"""
         test.logger.info('Measure VDDEE')
         VDDEE = UARTcmd.cmdget("vddee")
-        nonlocal testresults
-        if isinstance(VDDEE, int) and VDDEE < 5200 and VDDEE > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[5] = 'echo \"\e[' + str(code) + ';1m  - VDDEE:     ' + str(VDDEE) + '\e[0m"\n'
         test.measurements.VDDEE_measurement = VDDEE
 
     @som_board.testcase('Power circuit 5V DDQ')
@@ -980,12 +820,6 @@ def som_board_test():
         """Voltage measurement in the 5V DDQ power circuit"""
         test.logger.info('Measure 5V DDQ')
         SOM5VDDQmeas = UARTcmd.cmdget("5vddq")
-        nonlocal testresults
-        if isinstance(SOM5VDDQmeas, int) and SOM5VDDQmeas < 5200 and SOM5VDDQmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[6] = 'echo \"\e[' + str(code) + ';1m  - 5V DDQ:    ' + str(SOM5VDDQmeas) + '\e[0m"\n'
         test.measurements.SOM5VDDQ_measurement = SOM5VDDQmeas
 
     @som_board.testcase('USB Test')
@@ -994,75 +828,35 @@ def som_board_test():
             'finished. total time:') != -1))  # Dummy
     def USBTest(test):
         SOMUSBresponse = uBootLoadFile.uBootLoad()
-        nonlocal testresults
-        if SOMUSBresponse.find('serialno:') != -1 and SOMUSBresponse.find('finished. total time:') != -1:
-            testresults[7] = ('echo \"\e[32;1m- USB Test:  Pass\e[0m"\n')
-        else:
-            testresults[7] = ('echo \"\e[31;1m- USB Test:  Fail\e[0m"\n')
         test.measurements.USBTest = SOMUSBresponse
 
     @som_board.testcase('DDR Test')
     @htf.measures(htf.Measurement('DDRTest'))  # Dummy
     def DDRTest(test):
         DDRmeas = True
-        nonlocal testresults
-        if DDRmeas == True:
-            testresults[8] = ('echo \"\e[32;1m- USB Test:  Pass\e[0m"\n')
-        else:
-            testresults[8] = ('echo \"\e[31;1m- USB Test:  Fail\e[0m"\n')
         test.measurements.DDRTest = DDRmeas
 
     @som_board.testcase('DUT Power Off')
     @htf.plugs.plug(prompts=UserInput)
     def DUTPowerOff(test, prompts):
-        nonlocal testresults
         outcomes = [p.outcome for p in test.test_record.phases]
-        if outcomes[2] == PhaseOutcome.PASS and outcomes[3] == PhaseOutcome.PASS and outcomes[
-            4] == PhaseOutcome.PASS and outcomes[5] == PhaseOutcome.PASS and outcomes[6] == PhaseOutcome.PASS and \
-                outcomes[7] == PhaseOutcome.PASS and outcomes[8] == PhaseOutcome.PASS:
-            powertest = 32
-        else:
-            powertest = 31
         test.logger.info("""DUT Power Off""")
-        os.system('echo "\e[36;1mDUT Power Off\e[0m"')
+        summary.print_summary(test.test_record)
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[31;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=red>FAIL'
         elif PhaseOutcome.PASS in outcomes:
-            os.system('echo "\e[32;1mTest Status:\e[0m" "\e[32;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=green>PASS'
-        os.system('echo "\e[' + str(powertest) + ';1m- Power measurments:\e[0m"')
-        os.system(testresults[0])
-        os.system(testresults[1])
-        os.system(testresults[2])
-        os.system(testresults[3])
-        os.system(testresults[4])
-        os.system(testresults[5])
-        os.system(testresults[6])
-        os.system(testresults[7])
-        os.system(testresults[8])
 
         prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
 
-    som_board.run()
+    som_board.add_callbacks(station.CycleStats('SOM Board Test').record)
+    som_board.run(once=once)
 
 
 # ---------Backplane Board---------------------------------------------------------------------------------
 
-def backplane_board_test():
+def backplane_board_test(once: bool = False):
     backplane_board = TestPlan('Backplane Board Test')
-    testresults = [
-        'echo \"\e[1m- 20V:  Not Start\e[0m"\n',
-        'echo \"\e[1m- 5V:   Not Start\e[0m"\n',
-        'echo \"\e[1m- 3.3V: Not Start\e[0m"\n',
-        'echo \"\e[1m- 1.8V: Not Start\e[0m"\n',
-        'echo \"\e[1m- DC-DC Test (Res. load):   Not Start\e[0m"\n',
-        'echo \"\e[1m- DC-DC Test (Cap. load):   Not Start\e[0m"\n',
-        'echo \"\e[1m- I2C Test:                 Not Start\e[0m"\n',
-        'echo \"\e[1m- Amplifiers Configuration: Not Start\e[0m"\n',
-        'echo \"\e[1m- Amplifiers Test:          Not Start\e[0m"\n',
-        'echo \"\e[1m- RTC Test:                 Not Start\e[0m"\n',
-    ]
     HERE = os.path.abspath(os.path.dirname(__file__))
     FORM_LAYOUT = {
         'schema': {
@@ -1125,12 +919,6 @@ def backplane_board_test():
         """Voltage measurement in the 20V power circuit"""
         test.logger.info('Measure 20V')
         BP20Vmeas = UARTcmd.cmdget("20v")
-        nonlocal testresults
-        if isinstance(BP20Vmeas, int) and BP20Vmeas < 5200 and BP20Vmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[0] = 'echo \"\e[' + str(code) + ';1m  - 5V:        ' + str(BP20Vmeas) + '\e[0m"\n'
         test.measurements.BP20V_measurement = BP20Vmeas
 
     @backplane_board.testcase('Power circuit 5V')
@@ -1141,12 +929,6 @@ def backplane_board_test():
         """Voltage measurement in the 5V power circuit"""
         test.logger.info('Measure 5V')
         BP5Vmeas = UARTcmd.cmdget("5v")
-        nonlocal testresults
-        if isinstance(BP5Vmeas, int) and BP5Vmeas < 5200 and BP5Vmeas > 4800:
-            code = 32
-        else:
-            code = 31
-        testresults[1] = 'echo \"\e[' + str(code) + ';1m  - 5V:        ' + str(BP5Vmeas) + '\e[0m"\n'
         test.measurements.BP5V_measurement = BP5Vmeas
 
     @backplane_board.testcase('Power circuit 3.3V')
@@ -1157,12 +939,6 @@ def backplane_board_test():
         """Voltage measurement in the 3.3V power circuit"""
         test.logger.info('Measure 3.3V')
         BP3V3meas = UARTcmd.cmdget("3v3")
-        nonlocal testresults
-        if isinstance(BP3V3meas, int) and BP3V3meas < 3500 and BP3V3meas > 3100:
-            code = 32
-        else:
-            code = 31
-        testresults[2] = 'echo \"\e[' + str(code) + ';1m  - 3.3V:      ' + str(BP3V3meas) + '\e[0m"\n'
         test.measurements.BP3V3_measurement = BP3V3meas
 
     @backplane_board.testcase('Power circuit 1.8V')
@@ -1173,117 +949,63 @@ def backplane_board_test():
         """Voltage measurement in the 1.8V power circuit"""
         test.logger.info('Measure 1.8V')
         BP1V8meas = UARTcmd.cmdget("1v8")
-        nonlocal testresults
-        if isinstance(BP1V8meas, int) and BP1V8meas < 2000 and BP1V8meas > 1600:
-            code = 32
-        else:
-            code = 31
-        testresults[3] = 'echo \"\e[' + str(code) + ';1m  - 1.8V:      ' + str(BP1V8meas) + '\e[0m"\n'
         test.measurements.BP1V8_measurement = BP1V8meas
 
     @backplane_board.testcase('DC-DC Test on Resisitive Load')
     @htf.measures(htf.Measurement('DCDCResistiveLoadTest'))  # Dummy
     def DCDCRes(test):
         DCmeas = True
-        nonlocal testresults
-        if DCmeas == True:
-            testresults[4] = ('echo \"\e[32;1m- DC-DC Test (Res. load):   Pass\e[0m"\n')
-        else:
-            testresults[4] = ('echo \"\e[31;1m- DC-DC Test (Res. load):   Fail\e[0m"\n')
         test.measurements.DCDCResistiveLoadTest = DCmeas
 
     @backplane_board.testcase('DC-DC Test on Capacitive Load')
     @htf.measures(htf.Measurement('DCDCCapacitiveLoadTest'))  # Dummy
     def DCDCCap(test):
         DCmeas = True
-        nonlocal testresults
-        if DCmeas == True:
-            testresults[5] = ('echo \"\e[32;1m- DC-DC Test (Cap. load):   Pass\e[0m"\n')
-        else:
-            testresults[5] = ('echo \"\e[31;1m- DC-DC Test (Cap. load):   Fail\e[0m"\n')
         test.measurements.DCDCCapacitiveLoadTest = DCmeas
 
     @backplane_board.testcase('I2C Test')
     @htf.measures(htf.Measurement('I2CTest'))  # Dummy
     def I2CTest(test):
         I2Cmeas = True
-        nonlocal testresults
-        if I2Cmeas == True:
-            testresults[6] = ('echo \"\e[32;1m- I2C Test:                 Pass\e[0m"\n')
-        else:
-            testresults[6] = ('echo \"\e[31;1m- I2C Test:                 Fail\e[0m"\n')
         test.measurements.I2CTest = I2Cmeas
 
     @backplane_board.testcase('Amplifiers Configuration')
     @htf.measures(htf.Measurement('AmplifiersConfiguration'))  # Dummy
     def AmpConf(test):
         AmpConfmeas = True
-        nonlocal testresults
-        if AmpConfmeas == True:
-            testresults[7] = ('echo \"\e[32;1m- Amplifiers Configuration: Pass\e[0m"\n')
-        else:
-            testresults[7] = ('echo \"\e[31;1m- Amplifiers Configuration: Fail\e[0m"\n')
         test.measurements.AmplifiersConfiguration = AmpConfmeas
 
     @backplane_board.testcase('Amplifiers Test')
     @htf.measures(htf.Measurement('AmplifiersTest'))  # Dummy
     def AmpTest(test):
         AmpTestmeas = True
-        nonlocal testresults
-        if AmpTestmeas == True:
-            testresults[8] = ('echo \"\e[32;1m- Amplifiers Test:          Pass\e[0m"\n')
-        else:
-            testresults[8] = ('echo \"\e[31;1m- Amplifiers Test:          Fail\e[0m"\n')
         test.measurements.AmplifiersTest = AmpTestmeas
 
     @backplane_board.testcase('Real Time Clock Test')
     @htf.measures(htf.Measurement('RTCTest'))  # Dummy
     def RTCTest(test):
         RTCmeas = True
-        nonlocal testresults
-        if RTCmeas == True:
-            testresults[9] = ('echo \"\e[32;1m- RTC Test:                 Pass\e[0m"\n')
-        else:
-            testresults[9] = ('echo \"\e[31;1m- RTC Test:                 Fail\e[0m"\n')
         test.measurements.RTCTest = RTCmeas
 
     @backplane_board.testcase('DUT Power Off')
     @htf.plugs.plug(prompts=UserInput)
     def DUTPowerOff(test, prompts):
-        nonlocal testresults
         outcomes = [p.outcome for p in test.test_record.phases]
-        if outcomes[2] == PhaseOutcome.PASS and outcomes[3] == PhaseOutcome.PASS and outcomes[
-            4] == PhaseOutcome.PASS and outcomes[5] == PhaseOutcome.PASS:
-            powertest = 32
-        else:
-            powertest = 31
         test.logger.info("""DUT Power Off""")
-        os.system('echo "\e[36;1mDUT Power Off\e[0m"')
+        summary.print_summary(test.test_record)
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[31;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=red>FAIL'
         elif PhaseOutcome.PASS in outcomes:
-            os.system('echo "\e[32;1mTest Status:\e[0m" "\e[32;1mPASS\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=green>PASS'
-        os.system('echo "\e[' + str(powertest) + ';1m- Power measurments:\e[0m"')
-        os.system(testresults[0])
-        os.system(testresults[1])
-        os.system(testresults[2])
-        os.system(testresults[3])
-        os.system(testresults[4])
-        os.system(testresults[5])
-        os.system(testresults[6])
-        os.system(testresults[7])
-        os.system(testresults[8])
-        os.system(testresults[9])
 
         prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
 
-    backplane_board.run()
+    backplane_board.add_callbacks(station.CycleStats('Backplane Board Test').record)
+    backplane_board.run(once=once)
 
 
 # ---------Backplane Board---------------------------------------------------------------------------------
-def bt_chamber_test():
+def bt_chamber_test(once: bool = False):
     BTChamber = TestPlan('BT Chamber')
     FORM_LAYOUT = {
         'schema': {
@@ -1414,41 +1136,45 @@ def bt_chamber_test():
     @htf.plugs.plug(prompts=UserInput)
     def TestResults(test, prompts):
         outcomes = [p.outcome for p in test.test_record.phases]
+        summary.print_summary(test.test_record, "Test Results")
         if PhaseOutcome.FAIL in outcomes:
-            os.system('echo "\e[31;1mTest Status:\e[0m" "\e[31;1mFAIL\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=red>FAIL'
         else:
-            os.system('echo "\e[32;1mTest Status:\e[0m" "\e[32;1mPASS\e[0m"')
             teststatus = 'DUT ID' + test.dut_id + ' test status: <p><font color=green>PASS'
 
         prompts.prompt("""## """ + teststatus, prompt_type=PromptType.OKAY)
 
-    BTChamber.run()
+    BTChamber.add_callbacks(station.CycleStats('BT Chamber').record)
+    BTChamber.run(once=once)
 
 
 # ---------------------------------------------------------------------------------------------------------
 
 class PerformTest():
-    def __init__(self, server, test_type=None):
+    def __init__(self, server, test_type=None, once=False):
         super(self.__class__, self).__init__()
         logging.info("started %s" % test_type.name)
 
         if test_type == TestTypes.LED_BOARD_TEST:
-            led_board_test()
+            led_board_test(once=once)
         elif test_type == TestTypes.LEDRING_BOARD_TEST:
-            ledring_board_test()
+            ledring_board_test(once=once)
         elif test_type == TestTypes.MIC_BOARD_TEST:
-            mic_board_test()
+            mic_board_test(once=once)
         elif test_type == TestTypes.SOM_BOARD_TEST:
-            som_board_test()
+            som_board_test(once=once)
         elif test_type == TestTypes.BACKPLANE_BOARD_TEST:
-            backplane_board_test()
+            backplane_board_test(once=once)
         elif test_type == TestTypes.BT_CHAMBER_TEST:
-            bt_chamber_test()
+            bt_chamber_test(once=once)
         else:
             exit("No such test type")
 
 
+# test plans which can run on several station slots at once
+SLOT_TESTS = {TestTypes.MIC_BOARD_TEST: mic_board_test}
+
+
 def main(args=None):
     """
     start and navigate to UI, run tests, terminate UI
@@ -1464,13 +1190,33 @@ def main(args=None):
     parser.add_argument('--no_barcode', action='store_true', default=False)
     parser.add_argument('--no_ftp', action='store_true', default=False)
     parser.add_argument('--no_ui', action='store_true', default=False)
-    parser.add_argument('--once', action='store_true', default=False)
+    parser.add_argument('--once', action='store_true', default=False,
+                        help="test one DUT and exit, by default DUTs are tested continuously")
     parser.add_argument('--config_file', default=default_config())
+    parser.add_argument('--slots', default=None,
+                        help="json file with station slots (port_id, gpio, dut_id) to test several DUTs in parallel")
 
     args = parser.parse_args(args)
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s: %(message)s',
                         datefmt='%Y-%m-%d %H:%M:%S')
 
+    if args.slots:
+        test = SLOT_TESTS.get(args.test_type)
+        if test is None:
+            exit("%s does not support station slots" % args.test_type)
+        slots = station.load_slots(args.slots)
+        ports = [slot.port_id for slot in slots]
+        shared = sorted(set(port_id for port_id in ports if ports.count(port_id) > 1))
+        broker = os.environ.get("JSON_SERIAL_BROKER")
+        # slot processes may share jig port only through serial_broker
+        unserved = [port_id for port_id in shared if not (broker and serial_broker.serves(broker, port_id))]
+        if unserved:
+            exit("slots share ports %s, run serial_broker for them and set JSON_SERIAL_BROKER" % unserved)
+        multi_station = station.Station(slots)
+        multi_station.run(functools.partial(test, once=args.once))
+        print(multi_station.report())
+        return
+
     # with open(args.config_file) as config_file:
     #   conf.load_from_file(config_file)
 
@@ -1484,7 +1230,7 @@ def main(args=None):
             # time.sleep(4)
             # os.system('xdotool search --onlyvisible --class "chromium" windowfocus && xdotool key F11')
 
-        PerformTest(server, test_type=args.test_type)
+        PerformTest(server, test_type=args.test_type, once=args.once)
 
 
 def default_config():
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import serial
+from typing import List, Dict, Any, Optional
+
+from json_serial import DEFAULT_PORT, JsonFramer, JsonResponse, dicttobyte, _serial_error
+
+
+class AsyncJsonSerialPort:
+    """
+    asyncio version of JsonSerialPort: non-blocking port descriptor read with event loop reader callback,
+    so one thread can talk to many jigs at once
+    """
+
+    def __init__(self, port_id: str = DEFAULT_PORT, baudrate: int = 115200, rx_size: int = 4096):
+        self.ser = None
+        self.rx = bytearray(rx_size)
+        self.rx_view = memoryview(self.rx)
+        self.error = ""
+        self.port_id = port_id
+        self.baudrate = baudrate
+        self.framer = JsonFramer()
+        # None in queue means port is lost
+        self.responses: Optional[asyncio.Queue] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        checks if serial port is open
+        :return:
+        """
+        return self.ser is not None and self.ser.is_open
+
+    def open(self):
+        """
+        opens serial port in non-blocking mode and registers reader in running event loop
+        :return:
+        """
+        self.error = ""
+        self.close()
+        self.loop = asyncio.get_running_loop()
+        self.responses = asyncio.Queue()
+        self.lock = asyncio.Lock()
+        try:
+            self.ser = serial.Serial(self.port_id, baudrate=self.baudrate, timeout=0, write_timeout=0)
+        except serial.SerialException:
+            self.error = "Serial port open error"
+            return
+        os.set_blocking(self.ser.fileno(), False)
+        self.loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    def close(self):
+        """
+        unregisters reader and closes serial port
+        :return:
+        """
+        if self.ser is None:
+            return
+        try:
+            if self.ser.is_open:
+                self.loop.remove_reader(self.ser.fileno())
+            self.ser.close()
+        except serial.SerialException:
+            self.error = "Error closing serial port"
+        self.ser = None
+
+    def _on_readable(self):
+        """
+        event loop callback: reads available bytes and queues complete jsons
+        :return:
+        """
+        try:
+            received = os.readv(self.ser.fileno(), [self.rx_view])
+        except BlockingIOError:
+            return
+        except OSError:
+            self._lost("Serial port read error")
+            return
+        if not received:
+            # the same as sync port: readable descriptor without data is hang-up
+            self._lost("Serial port is disconnected")
+            return
+        for frame in self.framer.feed(self.rx_view[:received]):
+            response = JsonResponse.parse(frame)
+            if response is not None:
+                self.responses.put_nowait(response)
+
+    def _lost(self, error: str):
+        """
+        closes lost port, so reader is not called again, and wakes up waiting request
+        :param error: error text
+        :return:
+        """
+        self.close()
+        self.error = error
+        print(self.error)
+        self.responses.put_nowait(None)
+
+    def clear_input(self):
+        """
+        drops received responses and incomplete data
+        :return:
+        """
+        self.ser.reset_input_buffer()
+        self.framer.reset()
+        while not self.responses.empty():
+            self.responses.get_nowait()
+
+    async def write(self, data: bytes):
+        """
+        writes all data, waits for port to become writable when output buffer is full
+        :param data: bytes to write
+        :return:
+        """
+        self.error = ""
+        view = memoryview(data)
+        if not self.is_open:
+            raise serial.SerialException("Serial port is not open")
+        fd = self.ser.fileno()
+        while view:
+            try:
+                sent = os.write(fd, view)
+                view = view[sent:]
+            except BlockingIOError:
+                writable = self.loop.create_future()
+                self.loop.add_writer(fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    self.loop.remove_writer(fd)
+            except OSError as e:
+                raise _serial_error(e) from e
+
+    async def get_next_response(self, timeout: float = 1) -> Optional[JsonResponse]:
+        """
+        waits for next json during timeout
+        :param timeout: time for json waiting in s
+        :return: response or None if there is no json
+        """
+        self.error = ""
+        try:
+            response = await asyncio.wait_for(self.responses.get(), timeout)
+        except asyncio.TimeoutError:
+            self.error = "no json found"
+            return None
+        if response is None:
+            self.error = "Serial port is lost"
+        return response
+
+    async def _exchange(self, data: Dict[str, Any], count: int, timeout: float) -> List[Optional[JsonResponse]]:
+        """
+        writes data and gets count number of json responses
+        :param data: data dict to send
+        :param count: number of jsons to get
+        :param timeout: time for json waiting
+        :return:
+        """
+        if not self.is_open:
+            self.open()
+            if self.error:
+                print(self.error)
+                return [None] * count
+        async with self.lock:
+            try:
+                self.clear_input()
+                await self.write(dicttobyte(data))
+            except serial.SerialException:
+                # port is reopened by next request
+                self.close()
+                self.error = "Serial port error"
+                print(self.error)
+                return [None] * count
+            res = list()
+            for i in range(count):
+                res.append(await self.get_next_response(timeout))
+                if self.error:
+                    print(self.error)
+                if not self.is_open:
+                    return res + [None] * (count - len(res))
+            return res
+
+    async def request(self, data: Dict[str, Any], timeout: float = 1) -> Optional[JsonResponse]:
+        """
+        writes data, gets one json response
+        :param data: data dict to send
+        :param timeout: time for json waiting
+        :return: response or None
+        """
+        return (await self._exchange(data, 1, timeout))[0]
+
+    async def several_cycles(self, data: Dict[str, Any], count: int = 1, timeout: float = 1) -> List[str]:
+        """
+        writes data, gets count number of json correct strings and returns List of them
+        :param data: data dict to send
+        :param count: number of jsons to get
+        :param timeout: time for json waiting
+        :return:
+        """
+        res = await self._exchange(data, count, timeout)
+        return [response.text if response is not None else "" for response in res]
+
+    async def full_one_cycle(self, data: Dict[str, Any], timeout: float = 1) -> str:
+        """
+        writes data, gets json correct string and returns it
+        :param data: data dict to send
+        :param timeout: time for json waiting
+        :return:
+        """
+        response = await self.request(data, timeout)
+        return response.text if response is not None else ""
+
+    async def full_one_cycle_with_key(self, data: Dict[str, Any], key='result', timeout: float = 1):
+        """
+        writes data and gets data for given key
+        :param data: data dict
+        :param key: key to get in response, case insensitive
+        :param timeout: timeout in s
+        :return: response data for key
+        """
+        response = await self.request(data, timeout)
+        if response is not None and key in response:
+            return response[key]
+        self.error = "No result for %s key" % key
+        print(self.error)
+        return ""
+
+
+# simple test
+if __name__ == "__main__":
+    async def ping_all(port_ids: List[str]):
+        ports = [AsyncJsonSerialPort(port_id) for port_id in port_ids]
+        res = await asyncio.gather(*(port.full_one_cycle_with_key({"Cmd": "Ping"}) for port in ports))
+        for port in ports:
+            port.close()
+        return res
+
+    print(asyncio.run(ping_all([DEFAULT_PORT])))
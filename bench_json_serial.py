@@ -0,0 +1,203 @@
+"""
+json_serial transport benchmarks against jig simulator pty, results are printed as json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from typing import List, Dict, Any, Callable
+
+import json_serial
+from jig_simulator import JigSimulator
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    gets latency statistics in ms
+    :param samples: latencies in s
+    :return:
+    """
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {"count": len(ordered), "mean_ms": statistics.mean(ordered) * 1000, "p50_ms": pick(0.5),
+            "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+def timed(func: Callable[[], Any], count: int) -> Dict[str, Any]:
+    """
+    runs func count times and measures wall and cpu time of every call
+    :param func: function to measure
+    :param count: number of calls
+    :return: latency percentiles and cpu time per call
+    """
+    samples = list()
+    cpu_start = time.process_time()
+    for i in range(count):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    res = percentiles(samples)
+    res["cpu_us_per_call"] = (time.process_time() - cpu_start) / count * 1e6
+    return res
+
+
+def bench_open_close(simulator: JigSimulator, count: int) -> Dict[str, Any]:
+    """
+    measures port open and close overhead
+    """
+    port = json_serial.JsonSerialPort(simulator.port_id)
+
+    def cycle():
+        port.open()
+        port.close()
+
+    return timed(cycle, count)
+
+
+def bench_round_trip(simulator: JigSimulator, count: int, persistent: bool) -> Dict[str, Any]:
+    """
+    measures full_one_cycle_with_key latency with port opened per command or kept open
+    """
+    port = json_serial.JsonSerialPort(simulator.port_id, persistent=persistent)
+    res = timed(lambda: port.full_one_cycle_with_key({"Cmd": "Ping"}), count)
+    port.close()
+    return res
+
+
+def bench_several_cycles(simulator: JigSimulator, frames: int, count: int) -> Dict[str, Any]:
+    """
+    measures frames per second for several_cycles
+    """
+    simulator.encoder_steps = frames - 1
+    port = json_serial.JsonSerialPort(simulator.port_id, persistent=True)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for i in range(count):
+        port.several_cycles({"Cmd": "TestEncoder"}, frames)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    port.close()
+    return {"frames": frames * count, "frames_per_s": frames * count / elapsed,
+            "cpu_us_per_frame": cpu / (frames * count) * 1e6}
+
+
+def make_stream(frames: int, noise: float, seed: int = 1) -> bytes:
+    """
+    builds typical jig output with garbage lines
+    :param frames: number of jsons
+    :param noise: probability of garbage line before json
+    :param seed: random seed
+    :return:
+    """
+    rnd = random.Random(seed)
+    parts = list()
+    for i in range(frames):
+        if rnd.random() < noise:
+            parts.append(bytes(rnd.choice(b'abc}]:,0123456789 ') for j in range(rnd.randint(1, 16))) + b'\r\n')
+        parts.append(json_serial.dicttobyte({"Buttons": "Changed", "LedSense": i % 2, "MicEn": 1, "MicEnN": 0}))
+    return b''.join(parts)
+
+
+def bench_framer(frames: int, fragment: int, noise: float) -> Dict[str, Any]:
+    """
+    measures JsonFramer throughput on fragmented and noisy input
+    """
+    data = make_stream(frames, noise)
+    rnd = random.Random(2)
+    chunks = list()
+    pos = 0
+    view = memoryview(data)
+    while pos < len(data):
+        size = rnd.randint(1, fragment)
+        chunks.append(view[pos:pos + size])
+        pos += size
+    framer = json_serial.JsonFramer()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    found = 0
+    for chunk in chunks:
+        found += len(framer.feed(chunk))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {"bytes": len(data), "chunks": len(chunks), "frames": found, "mb_per_s": len(data) / elapsed / 1e6,
+            "frames_per_s": found / elapsed, "cpu_us_per_frame": cpu / max(found, 1) * 1e6}
+
+
+PAYLOADS = {
+    "ping": {"Cmd": "Ping"},
+    "get_rails": {"Cmd": "Get", "Params": ["5vV", "3v3V", "1v8", "1v8emmc", "vddcpu", "vddee", "5vddq"]},
+    "rails": {"5vV": 5012, "3v3V": 3301, "1v8": 1799, "1v8emmc": 1802, "vddcpu": 1795, "vddee": 5003, "5vddq": 4998},
+    "button": {"Buttons": "Changed", "LedSense": 1, "MicEn": 0, "MicEnN": 1},
+}
+
+
+def bench_codecs(count: int) -> Dict[str, Any]:
+    """
+    measures encode and decode time per frame for every installed json codec backend
+    """
+    res = dict()
+    for name, (encode, decode) in json_serial.CODECS.items():
+        res[name] = dict()
+        for payload_name, payload in PAYLOADS.items():
+            frame = encode(payload)
+            start = time.perf_counter()
+            for i in range(count):
+                encode(payload)
+            encoded = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(count):
+                decode(frame)
+            decoded = time.perf_counter() - start
+            res[name][payload_name] = {"encode_us": encoded / count * 1e6, "decode_us": decoded / count * 1e6}
+    return res
+
+
+def run(count: int, latency: float) -> Dict[str, Any]:
+    """
+    runs all benchmarks
+    :param count: number of iterations for each benchmark
+    :param latency: simulated firmware latency in s
+    :return: results
+    """
+    res: Dict[str, Any] = {"python": platform.python_version(), "platform": platform.platform(),
+                           "count": count, "latency_s": latency, "codec": json_serial.CODEC}
+    with JigSimulator(latency=latency) as simulator, contextlib.redirect_stdout(io.StringIO()):
+        res["open_close"] = bench_open_close(simulator, count)
+        res["round_trip_reopen"] = bench_round_trip(simulator, count, persistent=False)
+        res["round_trip_persistent"] = bench_round_trip(simulator, count, persistent=True)
+        res["several_cycles"] = bench_several_cycles(simulator, 50, max(count // 10, 1))
+    res["framer_clean"] = bench_framer(count * 20, 4096, 0.0)
+    res["framer_fragmented_noisy"] = bench_framer(count * 20, 7, 0.3)
+    res["codecs"] = bench_codecs(count * 50)
+    return res
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--codec', choices=list(json_serial.CODECS), default=None,
+                        help="json codec backend for transport benchmarks, the fastest installed by default")
+    parser.add_argument('--output', default='-', help="json file for results, '-' for stdout")
+    args = parser.parse_args(args)
+    json_serial.select_codec(args.codec)
+    res = run(args.count, args.latency)
+    text = json.dumps(res, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as output:
+            output.write(text + os.linesep)
+
+
+if __name__ == "__main__":
+    main()
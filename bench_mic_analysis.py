@@ -0,0 +1,127 @@
+"""
+microphone analysis benchmarks on recording of real length: micstest.process_file, which gives MIC plan verdict,
+against vectorized mic_analysis engine with cached reference, results are printed as json.
+micstest compares with its own Example.wav, so baseline is measured only where micstest and mic_analysis.REFERENCE
+are installed, e.g. on station
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import wave
+from typing import Dict, Any, Callable
+
+import numpy as np
+
+import mic_analysis
+from bench_json_serial import percentiles
+
+try:
+    import micstest
+except ImportError:
+    micstest = None
+
+RATE = 16000
+CHANNELS = 8
+
+
+def make_recording(seconds: float, seed: int = 1) -> np.ndarray:
+    """
+    builds test tone recording like TestMics one with noise
+    :param seconds: length in s
+    :param seed: random seed
+    :return: frames x channels int16 array
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(RATE * seconds)) / RATE
+    tone = 3000 * (np.sin(2 * np.pi * 1000 * t) + 0.5 * np.sin(2 * np.pi * 3000 * t))
+    return (tone[:, None] + rng.normal(0, 30, (len(t), CHANNELS))).astype('<i2')
+
+
+def write_wav(path: str, samples: np.ndarray):
+    with wave.open(path, 'wb') as file:
+        file.setnchannels(samples.shape[1])
+        file.setsampwidth(2)
+        file.setframerate(RATE)
+        file.writeframes(samples.tobytes())
+
+
+def timed(func: Callable[[], Any], count: int) -> Dict[str, Any]:
+    """
+    runs func count times
+    :param func: function to measure
+    :param count: number of calls
+    :return: latency percentiles and cpu time per call
+    """
+    samples = list()
+    cpu_start = time.process_time()
+    for i in range(count):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    res = percentiles(samples)
+    res["cpu_ms_per_call"] = (time.process_time() - cpu_start) / count * 1000
+    return res
+
+
+def run(seconds: float, count: int) -> Dict[str, Any]:
+    """
+    runs all benchmarks
+    :param seconds: recording length in s
+    :param count: number of iterations for each benchmark
+    :return: results
+    """
+    baseline = micstest is not None and os.path.isfile(mic_analysis.REFERENCE)
+    res: Dict[str, Any] = {"python": platform.python_version(), "numpy": np.__version__,
+                           "platform": platform.platform(), "seconds": seconds, "channels": CHANNELS, "count": count,
+                           "micstest": baseline}
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = tmp + '/'
+        # engine uses the same reference as micstest when it is installed
+        reference = mic_analysis.REFERENCE if baseline else os.path.join(tmp, 'Example.wav')
+        if not baseline:
+            write_wav(reference, make_recording(seconds, seed=2))
+        recording = make_recording(seconds)
+        write_wav(directory + 'dut.wav', recording)
+        if baseline:
+            res["micstest_process_file"] = timed(lambda: micstest.process_file(directory, 'dut.wav'), count)
+
+        def cold():
+            analyzer = mic_analysis.MicAnalyzer(reference, mic_analysis.ReferenceCache(tempfile.mkdtemp(dir=tmp)))
+            return analyzer.process_file(directory, 'dut.wav')
+
+        res["engine_cold_cache"] = timed(cold, count)
+        cache_dir = os.path.join(tmp, 'cache')
+        mic_analysis.MicAnalyzer(reference, mic_analysis.ReferenceCache(cache_dir)).process_file(directory, 'dut.wav')
+        res["engine_mmap_cache"] = timed(lambda: mic_analysis.MicAnalyzer(
+            reference, mic_analysis.ReferenceCache(cache_dir)).process_file(directory, 'dut.wav'), count)
+        analyzer = mic_analysis.MicAnalyzer(reference, mic_analysis.ReferenceCache(cache_dir))
+        res["engine_file"] = timed(lambda: analyzer.process_file(directory, 'dut.wav'), count)
+        res["engine_samples"] = timed(lambda: analyzer.analyse(recording), count)
+        if baseline:
+            res["same_verdict"] = micstest.process_file(directory, 'dut.wav')[0] == \
+                analyzer.process_file(directory, 'dut.wav')[0]
+    if baseline:
+        res["speedup"] = res["micstest_process_file"]["mean_ms"] / res["engine_samples"]["mean_ms"]
+    return res
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=12, help="recording length, TestMics records 12 s")
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--output', default='-', help="json file for results, '-' for stdout")
+    args = parser.parse_args(args)
+    text = json.dumps(run(args.seconds, args.count), indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as output:
+            output.write(text + os.linesep)
+
+
+if __name__ == "__main__":
+    main()
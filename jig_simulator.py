@@ -0,0 +1,216 @@
+"""
+STM32 jig firmware simulator on Linux pseudo-terminal, JsonSerialPort can be opened on its port_id
+"""
+
+import json
+import os
+import random
+import select
+import threading
+import time
+import tty
+from typing import List, Dict, Any, Optional
+
+from json_serial import JsonFramer, dicttobyte
+
+DEFAULT_VALUES = {"5vV": 5000, "3v3V": 3300, "3v3InV": 3300}
+
+
+class JigSimulator:
+    """
+    speaks jig json protocol on pty: Ping, PwrOn, PwrOff, Get with Params, TestEncoder, TestLightSns, TestMics,
+    button events
+    """
+
+    def __init__(self, values: Dict[str, Any] = None, latency: float = 0.0, jitter: float = 0.0,
+                 baudrate: int = None, fragment: int = None, noise: float = 0.0, seed: int = None,
+                 concurrent: bool = False):
+        """
+        :param values: values returned by Get command, DEFAULT_VALUES if None
+        :param latency: delay before reply in s
+        :param jitter: max random addition to latency in s
+        :param baudrate: emulated baudrate for output throttling, no throttling if None
+        :param fragment: max size of written chunk, replies are split into random chunks if set
+        :param noise: probability of garbage line before reply
+        :param seed: random seed for reproducible jitter, fragmentation and noise
+        :param concurrent: requests with Id are answered from own timer after latency and jitter, so replies of
+        pipelined requests may come out of request order
+        """
+        self.values = dict(DEFAULT_VALUES if values is None else values)
+        self.latency = latency
+        self.jitter = jitter
+        self.baudrate = baudrate
+        self.fragment = fragment
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.concurrent = concurrent
+        self.powered = False
+        # TestEncoder is answered with Result only, as MIC plan reads it; steps are streamed before Result if set
+        self.encoder_steps = 0
+        self.requests: List[Dict[str, Any]] = list()
+        self.port_id = ""
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._timers: List[threading.Timer] = list()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        opens pty pair and starts firmware thread
+        :return:
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port_id = os.ttyname(self._slave)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="jig simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        stops firmware thread and closes pty
+        :return:
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for timer in self._timers:
+            timer.cancel()
+            timer.join()
+        self._timers = list()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def _run(self):
+        """
+        firmware thread: reads requests line by line and replies
+        :return:
+        """
+        framer = JsonFramer()
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self._master, 4096)
+            except OSError:
+                return
+            for frame in framer.feed(chunk):
+                try:
+                    request = json.loads(frame)
+                except ValueError:
+                    continue
+                self.requests.append(request)
+                self._reply(request)
+
+    def _reply(self, request: Dict[str, Any]):
+        """
+        sends replies for request after latency
+        :param request: received request
+        :return:
+        """
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if self.concurrent and "Id" in request:
+            timer = threading.Timer(delay, self._answer, (request,))
+            timer.daemon = True
+            self._timers = [pending for pending in self._timers if pending.is_alive()] + [timer]
+            timer.start()
+            return
+        if delay > 0:
+            time.sleep(delay)
+        self._answer(request)
+
+    def _answer(self, request: Dict[str, Any]):
+        """
+        sends replies for request with its Id
+        :param request: received request
+        :return:
+        """
+        for response in self.handle(request):
+            if "Id" in request:
+                response["Id"] = request["Id"]
+            self.send(response)
+
+    def handle(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        builds replies for request
+        :param request: received request
+        :return: list of replies
+        """
+        cmd = request.get("Cmd")
+        if cmd == "Ping":
+            return [{"Result": "Ok"}]
+        if cmd == "PwrOn":
+            self.powered = True
+            return [{"Result": "Ok"}]
+        if cmd == "PwrOff":
+            self.powered = False
+            return [{"Result": "Ok"}]
+        if cmd == "Get":
+            return [{key: self.values.get(key, 0) if self.powered else 0 for key in request.get("Params", [])}]
+        if cmd == "TestEncoder":
+            steps = [{"Encoder": step} for step in range(self.encoder_steps)]
+            return steps + [{"Result": "Ok"}]
+        if cmd in ("TestLightSns", "TestMics"):
+            return [{"Result": "Ok"}]
+        return [{"Result": "Error", "Error": "Unknown command"}]
+
+    def press_mute(self):
+        """
+        sends "Mute" button press and release events
+        :return:
+        """
+        self.send({"Buttons": "Changed", "LedSense": 1, "MicEn": 0, "MicEnN": 1})
+        self.send({"Buttons": "Changed", "LedSense": 0, "MicEn": 1, "MicEnN": 0})
+
+    def press_alice(self):
+        """
+        sends "Alice" button press and release events
+        :return:
+        """
+        self.send({"Buttons": "Changed", "KeyFunc": 0})
+        self.send({"Buttons": "Changed", "KeyFunc": 1})
+
+    def send(self, response: Dict[str, Any]):
+        """
+        writes json line with configured noise, fragmentation and throttling
+        :param response: json to send
+        :return:
+        """
+        data = dicttobyte(response)
+        if self.noise and self.random.random() < self.noise:
+            garbage = bytes(self.random.choice(b'abc}]:,0123456789 \x00\xff') for i in range(self.random.randint(1, 16)))
+            data = garbage + b'\r\n' + data
+        with self._write_lock:
+            pos = 0
+            while pos < len(data):
+                size = self.random.randint(1, self.fragment) if self.fragment else len(data)
+                chunk = data[pos:pos + size]
+                if self.baudrate:
+                    # 10 bits per byte on 8N1 line
+                    time.sleep(len(chunk) * 10 / self.baudrate)
+                os.write(self._master, chunk)
+                pos += size
+
+
+# simple test
+if __name__ == "__main__":
+    with JigSimulator(latency=0.005) as simulator:
+        print("jig simulator on %s, Ctrl+C to stop" % simulator.port_id)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
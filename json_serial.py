@@ -1,27 +1,650 @@
 import serial
+import os
+import fnmatch
+import itertools
 import json
+import queue
+import re
 import time
-from typing import Union, List, Dict, Any
+import select
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Union, List, Dict, Any, Tuple, Iterable, Iterator, Optional, Callable
+
+
+try:
+    import termios
+    # pyserial calls termios and ioctl directly in reset_*_buffer and in_waiting
+    _PORT_ERRORS: Tuple[type, ...] = (OSError, termios.error)
+except ImportError:
+    _PORT_ERRORS = (OSError,)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# default jig port, may be set to simulator pty (see jig_simulator.py)
+DEFAULT_PORT = os.environ.get("JSON_SERIAL_PORT", "/dev/ttyS0")
+# reply timeout in s for requests without explicit timeout and learned latency
+DEFAULT_TIMEOUT = 1
+
+
+def _serial_error(error: BaseException) -> serial.SerialException:
+    """
+    converts OS error of port to SerialException, so callers reconnect as for pyserial errors
+    :param error: caught error
+    :return:
+    """
+    if isinstance(error, serial.SerialException):
+        return error
+    return serial.SerialException("%s: %s" % (type(error).__name__, error))
+
+
+def _json_encode(obj: Any) -> bytes:
+    return (json.dumps(obj) + '\r\n').encode('utf-8')
+
+
+def _orjson_encode(obj: Any) -> bytes:
+    return orjson.dumps(obj) + b'\r\n'
+
+
+def _ujson_encode(obj: Any) -> bytes:
+    return ujson.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\r\n'
+
+
+# json codec backends: name: (encode to line bytes, decode from bytes), the fastest installed one is used
+CODECS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {"json": (_json_encode, json.loads)}
+if ujson is not None:
+    CODECS["ujson"] = (_ujson_encode, ujson.loads)
+if orjson is not None:
+    CODECS["orjson"] = (_orjson_encode, orjson.loads)
+
+
+def select_codec(name: str = None) -> str:
+    """
+    selects json codec backend for encode and decode functions
+    :param name: backend name (json, ujson, orjson), the fastest installed backend if None
+    :return: selected backend name
+    """
+    global CODEC, encode, decode
+    if name is None:
+        name = next(codec for codec in ("orjson", "ujson", "json") if codec in CODECS)
+    if name not in CODECS:
+        raise ValueError("json codec %s is not installed" % name)
+    encode, decode = CODECS[name]
+    CODEC = name
+    return name
+
+
+CODEC = ""
+encode: Callable[[Any], bytes] = _json_encode
+decode: Callable[[bytes], Any] = json.loads
+select_codec(os.environ.get("JSON_SERIAL_CODEC"))
 
 
 def dicttobyte(the_dict):
     """
     converts json bytecodes
     :param the_dict:
+    :return: json line bytes with '\r\n'
+    """
+    return encode(the_dict)
+
+
+_OPEN_RE = re.compile(rb'{')
+_STRUCT_RE = re.compile(rb'[{}"\n]')
+_STRING_RE = re.compile(rb'["\\\n]')
+_NON_ASCII = bytes(range(127, 256))
+
+
+class JsonFramer:
+    """
+    incremental splitter of json objects stream: keeps string/escape/brace depth state between chunks,
+    returns every complete top level object once, drops garbage between objects.
+    works on bytes, chunk may be memoryview of reused receive buffer, objects are copied out once complete
+    """
+
+    def __init__(self, max_frame: int = 65536):
+        """
+        :param max_frame: max length of one object, longer objects are dropped as garbage
+        """
+        self.max_frame = max_frame
+        self._partial = bytearray()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.dropped = 0
+
+    def reset(self):
+        """
+        drops incomplete object
+        :return:
+        """
+        self.dropped += len(self._partial)
+        self._partial.clear()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview, str]) -> List[bytes]:
+        """
+        adds chunk of received data
+        :param chunk: received data
+        :return: list of objects completed by this chunk
+        """
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        frames = list()
+        n = len(chunk)
+        start = 0
+        pos = 0
+        if self._escape:
+            self._escape = False
+            pos = 1
+        while pos < n:
+            if not self._depth:
+                match = _OPEN_RE.search(chunk, pos)
+                if match is None:
+                    self.dropped += n - pos
+                    return frames
+                begin = match.start()
+                self.dropped += begin - pos
+                start = begin
+                pos = begin + 1
+                self._depth = 1
+                continue
+            match = (_STRING_RE if self._in_string else _STRUCT_RE).search(chunk, pos)
+            if match is None:
+                break
+            pos = match.end()
+            char = chunk[pos - 1]
+            if char == 0x0A:
+                # firmware sends one object per line, so line end inside object means broken object
+                self.dropped += pos - start
+                self.reset()
+            elif char == 0x5C:
+                if pos == n:
+                    self._escape = True
+                pos += 1
+            elif char == 0x22:
+                self._in_string = not self._in_string
+            elif char == 0x7B:
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if not self._depth:
+                    if self._partial:
+                        self._partial += chunk[start:pos]
+                        frames.append(bytes(self._partial))
+                        self._partial.clear()
+                    else:
+                        frames.append(bytes(chunk[start:pos]))
+        if self._depth:
+            self._partial += chunk[start:]
+            if len(self._partial) > self.max_frame:
+                self.reset()
+        return frames
+
+
+def parse_jsons(text: str) -> List[Dict[str, Any]]:
+    """
+    gets all valid json objects from text
+    :param text: text with json objects and possibly garbage
+    :return: list of decoded objects
+    """
+    res = list()
+    for frame in JsonFramer().feed(text):
+        try:
+            res.append(decode(frame))
+        except ValueError:
+            pass
+    return res
+
+
+def has_sequence(frames: List[Dict[str, Any]], sequence: List[Dict[str, Any]]) -> bool:
+    """
+    checks if frames contain given objects one right after another
+    :param frames: decoded objects
+    :param sequence: objects to find
+    :return:
+    """
+    for i in range(len(frames) - len(sequence) + 1):
+        if frames[i:i + len(sequence)] == sequence:
+            return True
+    return False
+
+
+def is_ok(value: Any) -> bool:
+    """
+    checks if firmware result value means success, case insensitive
+    :param value: result value
     :return:
     """
-    return (json.dumps(the_dict) + '\r\n').encode('utf-8')
+    return isinstance(value, str) and value.lower() == 'ok'
+
+
+class JsonResponse:
+    """
+    json object received from serial port, decoded once
+    """
+    __slots__ = ('raw', 'timestamp', 'data', '_keys')
+
+    def __init__(self, raw: bytes, data: Dict[str, Any], timestamp: float = None):
+        """
+        :param raw: received bytes of object
+        :param data: decoded object
+        :param timestamp: monotonic receive time
+        """
+        self.raw = raw
+        self.data = data
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self._keys = None
+
+    @classmethod
+    def parse(cls, frame: bytes, timestamp: float = None) -> Optional['JsonResponse']:
+        """
+        decodes one framed json object
+        :param frame: json bytes
+        :param timestamp: monotonic receive time
+        :return: response or None if frame is not valid json object
+        """
+        try:
+            data = decode(frame)
+        except ValueError:
+            # json and utf-8 decoding errors
+            return None
+        if not isinstance(data, dict):
+            return None
+        return cls(frame, data, timestamp)
+
+    @property
+    def text(self) -> str:
+        """
+        received json as str
+        :return:
+        """
+        return self.raw.decode('utf-8')
+
+    def key(self, key: str) -> Optional[str]:
+        """
+        finds actual key in response ignoring case
+        :param key: key to find
+        :return: key as received or None
+        """
+        if key in self.data:
+            return key
+        if self._keys is None:
+            self._keys = {k.lower(): k for k in self.data}
+        return self._keys.get(key.lower())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        gets value for key ignoring key case
+        :param key: key to get
+        :param default: value if key is absent
+        :return:
+        """
+        actual = self.key(key)
+        return default if actual is None else self.data[actual]
+
+    def __contains__(self, key: str) -> bool:
+        return self.key(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        actual = self.key(key)
+        if actual is None:
+            raise KeyError(key)
+        return self.data[actual]
+
+    def __repr__(self):
+        return 'JsonResponse(%s)' % self.text
+
+
+class Subscription:
+    """
+    bounded queue of unsolicited jsons matching predicate, filled by JsonSerialPort background reader
+    """
+
+    def __init__(self, predicate: Callable[[JsonResponse], bool], maxsize: int = 100):
+        """
+        :param predicate: selects jsons for this subscription
+        :param maxsize: max number of queued jsons, the oldest json is dropped on overflow
+        """
+        self.predicate = predicate
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, response: JsonResponse):
+        """
+        queues json, drops the oldest one if queue is full
+        :param response: json to queue
+        :return:
+        """
+        while True:
+            try:
+                self.queue.put_nowait(response)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None) -> Optional[JsonResponse]:
+        """
+        gets next json
+        :param timeout: time for json waiting in s, None to wait forever
+        :return: json or None on timeout
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_all(self) -> List[JsonResponse]:
+        """
+        gets all queued jsons without waiting
+        :return:
+        """
+        res = list()
+        while True:
+            try:
+                res.append(self.queue.get_nowait())
+            except queue.Empty:
+                return res
+
+
+class LatencyProfile:
+    """
+    rolling reply latency per command, gives timeouts from high percentile of observed latency plus margin
+    """
+
+    def __init__(self, window: int = 50, min_samples: int = 5, percentile: float = 0.99, factor: float = 1.5,
+                 margin: float = 0.05, min_timeout: float = 0.05, max_timeout: float = 10, retries: int = 1,
+                 backoff: float = 2, idempotent: Iterable[str] = ("Ping", "Get*")):
+        """
+        :param window: number of last latencies kept for each command
+        :param min_samples: default timeout is used until command has this number of latencies
+        :param percentile: percentile of observed latencies used for timeout
+        :param factor: multiplier for percentile
+        :param margin: time added to timeout in s
+        :param min_timeout: min timeout in s
+        :param max_timeout: max timeout in s, also limit for retries
+        :param retries: number of retries after learned timeout is expired
+        :param backoff: timeout multiplier for every retry
+        :param idempotent: patterns of commands which may be retried, others (PwrOn, TestEncoder...) are sent once
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.factor = factor
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.idempotent = tuple(idempotent)
+        self.latencies: Dict[str, deque] = dict()
+
+    def observe(self, cmd: str, latency: float):
+        """
+        adds reply latency
+        :param cmd: command name
+        :param latency: time from request to reply in s
+        :return:
+        """
+        samples = self.latencies.get(cmd)
+        if samples is None:
+            samples = self.latencies[cmd] = deque(maxlen=self.window)
+        samples.append(latency)
+
+    def is_idempotent(self, cmd: str) -> bool:
+        """
+        checks if command may be sent again after timeout
+        :param cmd: command name
+        :return:
+        """
+        return any(fnmatch.fnmatchcase(cmd, pattern) for pattern in self.idempotent)
+
+    def is_learned(self, cmd: str) -> bool:
+        """
+        checks if there are enough latencies to compute timeout for command
+        :param cmd: command name
+        :return:
+        """
+        return len(self.latencies.get(cmd, ())) >= self.min_samples
+
+    def timeout(self, cmd: str, default: float) -> float:
+        """
+        gets timeout for command
+        :param cmd: command name
+        :param default: timeout if command latency is not learned yet
+        :return: timeout in s
+        """
+        if not self.is_learned(cmd):
+            return default
+        ordered = sorted(self.latencies[cmd])
+        high = ordered[min(int(self.percentile * len(ordered)), len(ordered) - 1)]
+        return min(max(high * self.factor + self.margin, self.min_timeout), self.max_timeout)
+
+
+class ResponseCache:
+    """
+    LRU cache of responses for idempotent requests with ttl per command,
+    power commands invalidate responses which depend on DUT power state
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_size: int = 64,
+                 invalidate_on: Iterable[str] = ("PwrOn", "PwrOff"), survive_power: Iterable[str] = ("Ping",)):
+        """
+        :param ttls: cmd: time to live in s, only these commands are cached
+        :param max_size: max number of cached responses, least recently used response is dropped
+        :param invalidate_on: commands which drop cached responses
+        :param survive_power: commands which responses do not depend on DUT power and are not dropped
+        """
+        self.ttls = dict(ttls)
+        self.max_size = max_size
+        self.invalidate_on = set(invalidate_on)
+        self.survive_power = set(survive_power)
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(data: Dict[str, Any]) -> str:
+        """
+        gets canonical key for request
+        :param data: request dict
+        :return:
+        """
+        return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+    def get(self, data: Dict[str, Any]) -> Optional[JsonResponse]:
+        """
+        gets cached response for request
+        :param data: request dict
+        :return: response or None if it is not cached or expired
+        """
+        cmd = data.get("Cmd")
+        if cmd not in self.ttls:
+            return None
+        key = self.make_key(data)
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, data: Dict[str, Any], response: JsonResponse):
+        """
+        caches response if command is cacheable
+        :param data: request dict
+        :param response: response for request
+        :return:
+        """
+        cmd = data.get("Cmd")
+        ttl = self.ttls.get(cmd)
+        if ttl is None:
+            return
+        key = self.make_key(data)
+        self.entries[key] = (cmd, time.monotonic() + ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def sent(self, data: Dict[str, Any]):
+        """
+        called for every request sent to port in any way, power commands drop responses
+        :param data: request dict
+        :return:
+        """
+        if data.get("Cmd") in self.invalidate_on:
+            self.invalidate()
+
+    def invalidate(self, everything: bool = False):
+        """
+        drops cached responses which depend on DUT power state
+        :param everything: drop all responses
+        :return:
+        """
+        if everything:
+            self.entries.clear()
+            return
+        for key in [key for key, entry in self.entries.items() if entry[0] not in self.survive_power]:
+            del self.entries[key]
+
+
+class PendingRequest:
+    """
+    request sent in pipelined mode and waiting for reply with the same id
+    """
+
+    def __init__(self, port: 'JsonSerialPort', request_id: int, timeout: float):
+        """
+        :param port: port request is sent to
+        :param request_id: id of request
+        :param timeout: time for reply waiting in s
+        """
+        self.port = port
+        self.request_id = request_id
+        self.deadline = time.monotonic() + timeout
+        self.future = Future()
+
+    def done(self) -> bool:
+        """
+        checks if reply is received or request is cancelled
+        :return:
+        """
+        return self.future.done()
+
+    def cancel(self):
+        """
+        stops waiting for reply, late reply will be dropped
+        :return:
+        """
+        self.port.forget_request(self.request_id)
+        self.future.cancel()
+
+    def result(self) -> Optional[JsonResponse]:
+        """
+        waits for reply until request deadline
+        :return: reply or None on timeout or cancel
+        """
+        try:
+            return self.future.result(max(self.deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            self.cancel()
+            self.port.error = "no reply for request %d" % self.request_id
+            return None
+        except Exception:
+            return None
 
 
 class JsonSerialPort:
 
-    def __init__(self, port_id: str = "/dev/ttyS0", baudrate: int = 115200, timeout: float = 0.5):
+    def __init__(self, port_id: str = DEFAULT_PORT, baudrate: int = 115200, timeout: float = 0.5,
+                 persistent: bool = False, event_keys: Iterable[str] = ("Buttons",), id_key: str = "Id",
+                 rx_size: int = 4096):
         self.ser = None
-        self.buf = ""
+        # receive buffer is allocated once, data is read into it and framed without intermediate copies
+        self.rx = bytearray(rx_size)
+        self.rx_view = memoryview(self.rx)
+        self.framer = JsonFramer()
+        self.frames = deque()
         self.error = ""
         self.port_id = port_id
         self.timeout = timeout
         self.baudrate = baudrate
+        # persistent port is opened lazily and kept open between cycles
+        self.persistent = persistent
+        self._sessions = 0
+        self._pending = b""
+        self.lock = threading.RLock()
+        # background reader: jsons with event keys go to subscriptions, other jsons are replies
+        self.event_keys = tuple(event_keys)
+        self.subscriptions: List[Subscription] = list()
+        self.replies = queue.Queue(100)
+        self._reader: Optional[threading.Thread] = None
+        self._reader_stop = threading.Event()
+        # pipelined requests are tagged with id and matched with replies by id
+        self.id_key = id_key
+        self._ids = itertools.count(1)
+        self._requests: Dict[int, PendingRequest] = dict()
+        # optional instrumentation, see serial_metrics.SerialMetrics
+        self.metrics = None
+        # optional adaptive timeouts learned from reply latency
+        self.latency_profile: Optional[LatencyProfile] = None
+        # optional cache for idempotent requests
+        self.cache: Optional[ResponseCache] = None
+        # optional traffic log, see serial_recorder.SerialRecorder
+        self.recorder = None
+        self._cycle_start = 0.0
+        self._cycle_open = 0.0
+        self._written = 0.0
+        self._first_byte: Optional[float] = None
+
+    def __enter__(self):
+        self._sessions += 1
+        self.ensure_open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._sessions -= 1
+        if not self.in_session:
+            self.close()
+
+    @property
+    def in_session(self) -> bool:
+        """
+        port stays open between cycles if it is persistent or used as context manager
+        :return:
+        """
+        return self.persistent or self._sessions > 0 or self.reader_running
+
+    @property
+    def reader_running(self) -> bool:
+        """
+        checks if background reader thread is running
+        :return:
+        """
+        return self._reader is not None and self._reader.is_alive()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        checks if serial port is open
+        :return:
+        """
+        return self.ser is not None and self.ser.is_open
 
     def open(self):
         """
@@ -38,6 +661,25 @@ class JsonSerialPort:
                                      write_timeout=self.timeout)
         except (serial.SerialException, AttributeError):
             self.error = "Serial port open error"
+        if self.metrics is not None:
+            self.metrics.count("opens" if not self.error else "open_errors")
+
+    def ensure_open(self):
+        """
+        opens serial port only if it is not opened yet
+        :return:
+        """
+        self.error = ""
+        if not self.is_open:
+            self.open()
+
+    def reconnect(self):
+        """
+        closes and reopens serial port after serial error, drops buffered data
+        :return:
+        """
+        self.clear_input()
+        self.open()
 
     def write(self, data: Union[bytes, str], encode: bool = True, eol: bool = True):
         """
@@ -48,35 +690,146 @@ class JsonSerialPort:
         :return:
         """
         self.error = ""
-        if self.ser.is_open:
+        if self.is_open:
             try:
-                self.ser.reset_input_buffer()
+                if self.reader_running:
+                    # reader owns input, only stale replies are dropped, events are kept
+                    self._clear_replies()
+                else:
+                    self.ser.reset_input_buffer()
+                    self.clear_input()
                 self.ser.reset_output_buffer()
-                data = data + '\r\n' if eol else data
-                bytes_to_send: bytes = data.encode('utf-8') if encode else data
-                res = self.ser.write(bytes_to_send)
-                if res != len(data):
-                    self.error = "write function failed\n"
-            except serial.SerialTimeoutException:
-                self.error = 'Cannot write data\n'
+            except _PORT_ERRORS as e:
+                raise _serial_error(e) from e
+            data = data + '\r\n' if eol else data
+            self._write_bytes(data.encode('utf-8') if encode else data)
+
+    def _write_bytes(self, data: bytes):
+        """
+        writes bytes to open port, all writes go here, so they are recorded and counted
+        :param data: bytes to write
+        :return:
+        """
+        if self.recorder is not None:
+            # recorded before write, reply may be read by background reader before write returns
+            self.recorder.tx(data)
+        try:
+            res = self.ser.write(data)
+        except serial.SerialTimeoutException:
+            self.error = 'Cannot write data\n'
+            return
+        except _PORT_ERRORS as e:
+            raise _serial_error(e) from e
+        if res != len(data):
+            self.error = "write function failed\n"
+        # write time is kept without metrics too, latency profile measures from it
+        self._written = time.monotonic()
+        if self.metrics is not None:
+            self.metrics.count("bytes_out", res or 0)
+            self._first_byte = None
 
-    def read_str(self) -> str:
+    def wait_readable(self, timeout: float) -> bool:
+        """
+        waits until input data is available or timeout expires without polling
+        :param timeout: max time to wait in s
+        :return: True if there is data to read
         """
-        reads all data in input buffer and converts to str
+        if not self.is_open:
+            raise serial.SerialException("Serial port is not open")
+        try:
+            if self.ser.in_waiting:
+                return True
+        except _PORT_ERRORS as e:
+            raise _serial_error(e) from e
+        try:
+            fd = self.ser.fileno()
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            fd = None
+        if fd is not None:
+            try:
+                ready, _, _ = select.select([fd], [], [], max(timeout, 0))
+            except (_PORT_ERRORS + (ValueError,)) as e:
+                raise _serial_error(e) from e
+            return bool(ready)
+        # no file descriptor (e.g. Windows): block on one byte with port timeout limited to deadline
+        port_timeout = self.ser.timeout
+        self.ser.timeout = max(timeout, 0)
+        try:
+            first = self.ser.read(1)
+        finally:
+            self.ser.timeout = port_timeout
+        self._pending = first
+        return bool(first)
+
+    def _readinto(self, view: memoryview) -> int:
+        """
+        reads bytes into view: directly from port descriptor if possible
+        :param view: part of receive buffer
+        :return: number of bytes read
+        """
+        try:
+            fd = self.ser.fileno()
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            return self.ser.readinto(view)
+        try:
+            received = os.readv(fd, [view])
+        except BlockingIOError:
+            return 0
+        except _PORT_ERRORS as e:
+            raise _serial_error(e) from e
+        if not received:
+            # the same as pyserial: readable descriptor without data is hang-up
+            raise serial.SerialException("device reports readiness to read but returned no data "
+                                         "(device disconnected or multiple access on port?)")
+        return received
+
+    def read_into(self, timeout: float) -> memoryview:
+        """
+        reads bytes which are already in input buffer into receive buffer, waits for the first byte up to timeout
+        :param timeout: max time to wait in s
+        :return: view of received bytes in receive buffer, valid until next read, empty if nothing arrived
+        """
+        self._pending = b""
+        if not self.wait_readable(timeout):
+            return self.rx_view[:0]
+        received = len(self._pending)
+        self.rx[:received] = self._pending
+        self._pending = b""
+        try:
+            size = min(self.ser.in_waiting or (0 if received else 1), len(self.rx) - received)
+        except _PORT_ERRORS as e:
+            raise _serial_error(e) from e
+        if size:
+            received += self._readinto(self.rx_view[received:received + size])
+        if self.recorder is not None and received:
+            self.recorder.rx(self.rx_view[:received])
+        if self.metrics is not None and received:
+            self.metrics.count("bytes_in", received)
+            if self._first_byte is None:
+                self._first_byte = time.monotonic()
+        return self.rx_view[:received]
+
+    def read_available(self, timeout: float) -> bytes:
+        """
+        reads bytes which are already in input buffer, waits for the first byte up to timeout
+        :param timeout: max time to wait in s
+        :return: received bytes, empty if nothing arrived
+        """
+        return bytes(self.read_into(timeout))
+
+    def read_str(self, timeout: float = None) -> str:
+        """
+        reads data available in input buffer and converts to str
+        :param timeout: max time to wait for data in s, port timeout by default
         :return: response converted to str
         """
         self.error = ""
-        response: bytes = self.ser.readall()
+        response: bytes = self.read_available(self.timeout if timeout is None else timeout)
         try:
             responsestr: str = response.decode(encoding='utf-8')
         except UnicodeDecodeError:
-            responsestr = ""
-            # todo check ord and chr
-            for b in response:
-                if b < 127:
-                    responsestr += chr(b)
-                elif not self.error:
-                    self.error = "Decoding error\n"
+            responsestr = response.translate(None, _NON_ASCII).decode(encoding='ascii')
+            self.error = "Decoding error\n"
         return responsestr
 
     def readall(self) -> bytes:
@@ -86,45 +839,247 @@ class JsonSerialPort:
         """
         return self.ser.readall()
 
-    def get_next_json(self, timeout: float = 1):
+    def clear_input(self):
         """
-        trys to get valid json during timeout
-        :param timeout:
+        drops received frames and incomplete data
         :return:
         """
+        self.framer.reset()
+        self.frames.clear()
+        self._clear_replies()
+
+    def _clear_replies(self):
+        """
+        drops replies queued by background reader
+        :return:
+        """
+        while True:
+            try:
+                self.replies.get_nowait()
+            except queue.Empty:
+                return
+
+    def _pop_response(self) -> Optional[JsonResponse]:
+        """
+        gets first valid json from received frames
+        :return: response or None if there is no complete json
+        """
+        while self.frames:
+            response = JsonResponse.parse(self.frames.popleft())
+            if response is not None:
+                return response
+            if self.metrics is not None:
+                self.metrics.count("decode_errors")
+        return None
+
+    def get_next_response(self, timeout: float = 1) -> Optional[JsonResponse]:
+        """
+        trys to get valid json during timeout, returns as soon as complete json is received
+        :param timeout: time for json waiting in s
+        :return: response or None if there is no json
+        """
         self.error = ""
-        current_time = 0
-        time_delta = 0.1
-        while current_time < timeout:
-            chunk = self.read_str()
-            self.buf += chunk
-            if '{' in self.buf:
-                start = self.buf.index('{')
-                # todo it must be last check
-                if '}' in self.buf:
-                    end = self.buf.rindex('}')
-                    try:
-                        json_try = self.buf[start: end + 1]
-                        json.loads(json_try, encoding='utf-8')
-                        self.buf = self.buf[end + 1:]
-                        return json_try
-                    except json.decoder.JSONDecodeError:
-                        pass
-            time.sleep(time_delta)
-            current_time += time_delta
-        self.error = "no json found"
-        return ""
+        if self.reader_running:
+            try:
+                return self.replies.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                self.error = "no json found"
+                return None
+        deadline = time.monotonic() + timeout
+        response = self._pop_response()
+        while response is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.error = "no json found"
+                return None
+            chunk = self.read_into(remaining)
+            if chunk:
+                self.frames.extend(self.framer.feed(chunk))
+                response = self._pop_response()
+        return response
+
+    def get_next_json(self, timeout: float = 1) -> str:
+        """
+        trys to get valid json during timeout
+        :param timeout: time for json waiting in s
+        :return: json string or empty string
+        """
+        response = self.get_next_response(timeout)
+        return response.text if response is not None else ""
+
+    def is_event(self, response: JsonResponse) -> bool:
+        """
+        checks if json is unsolicited firmware event, not a reply
+        :param response: received json
+        :return:
+        """
+        return any(key in response for key in self.event_keys)
+
+    def subscribe(self, key: str = None, predicate: Callable[[JsonResponse], bool] = None,
+                  maxsize: int = 100) -> Subscription:
+        """
+        subscribes to jsons received by background reader
+        :param key: get jsons with this key (case insensitive)
+        :param predicate: get jsons for which predicate is True
+        :param maxsize: max number of queued jsons
+        :return: subscription to get jsons from
+        """
+        if predicate is None:
+            predicate = (lambda response: key in response) if key is not None else (lambda response: True)
+        elif key is not None:
+            predicate = (lambda response, check=predicate: key in response and check(response))
+        subscription = Subscription(predicate, maxsize)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        removes subscription
+        :param subscription: subscription to remove
+        :return:
+        """
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def _dispatch(self, response: JsonResponse):
+        """
+        routes json from background reader to subscriptions and reply queue
+        :param response: received json
+        :return:
+        """
+        for subscription in self.subscriptions:
+            if subscription.predicate(response):
+                subscription.put(response)
+        if self.is_event(response):
+            return
+        request_id = response.get(self.id_key)
+        if request_id is not None:
+            # reply for pipelined request, late replies for forgotten requests are dropped
+            pending = self._requests.pop(request_id, None)
+            if pending is not None and not pending.future.cancelled():
+                pending.future.set_result(response)
+        else:
+            try:
+                self.replies.put_nowait(response)
+            except queue.Full:
+                self.replies.get_nowait()
+                self.replies.put_nowait(response)
+
+    def _reader_loop(self):
+        """
+        background reader thread: reads port and dispatches complete jsons
+        :return:
+        """
+        framer = JsonFramer()
+        while not self._reader_stop.is_set():
+            try:
+                chunk = self.read_into(0.1)
+            except (serial.SerialException, OSError, TypeError, AttributeError):
+                # port is lost: reconnect and go on after short pause
+                self._reader_stop.wait(0.1)
+                with self.lock:
+                    if not self._reader_stop.is_set():
+                        framer.reset()
+                        self.open()
+                continue
+            if chunk:
+                for frame in framer.feed(chunk):
+                    response = JsonResponse.parse(frame)
+                    if response is not None:
+                        self._dispatch(response)
+
+    def start_reader(self):
+        """
+        opens port and starts background reader thread, port stays open until stop_reader
+        :return:
+        """
+        with self.lock:
+            if self.reader_running:
+                return
+            self.ensure_open()
+            self.clear_input()
+            self._reader_stop.clear()
+            self._reader = threading.Thread(target=self._reader_loop, name="reader %s" % self.port_id, daemon=True)
+            self._reader.start()
+
+    def stop_reader(self):
+        """
+        stops background reader thread
+        :return:
+        """
+        self._reader_stop.set()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join()
+        self._reader = None
+
+    def submit(self, data: Dict[str, Any], timeout: float = 1) -> PendingRequest:
+        """
+        sends request tagged with new id without waiting for reply, starts background reader if necessary
+        :param data: data dict to send
+        :param timeout: time for reply waiting in s
+        :return: pending request to get reply from
+        """
+        self.start_reader()
+        pending = PendingRequest(self, next(self._ids), timeout)
+        tagged = dict(data)
+        tagged[self.id_key] = pending.request_id
+        self._sending(data)
+        with self.lock:
+            # registered before write, so fast reply is not dropped as late one
+            self._requests[pending.request_id] = pending
+            self.error = ""
+            try:
+                if not self.is_open:
+                    raise serial.SerialException("Serial port is not open")
+                self._write_bytes(dicttobyte(tagged))
+            except serial.SerialException:
+                self.error = 'Cannot write data\n'
+            if self.error:
+                self.forget_request(pending.request_id)
+                pending.future.set_exception(serial.SerialException(self.error))
+        return pending
+
+    def forget_request(self, request_id: int):
+        """
+        stops waiting for reply for request id
+        :param request_id: id of request
+        :return:
+        """
+        self._requests.pop(request_id, None)
+
+    def pipeline(self, requests: Iterable[Dict[str, Any]], depth: int = 4,
+                 timeout: float = 1) -> List[Optional[JsonResponse]]:
+        """
+        sends requests keeping up to depth requests waiting for reply
+        :param requests: data dicts to send
+        :param depth: max number of requests in flight
+        :param timeout: time for reply waiting for each request in s
+        :return: replies in order of requests, None for requests without reply
+        """
+        in_flight = deque()
+        res = list()
+        for data in requests:
+            if len(in_flight) >= depth:
+                res.append(in_flight.popleft().result())
+            in_flight.append(self.submit(data, timeout))
+        while in_flight:
+            res.append(in_flight.popleft().result())
+        return res
 
     def close(self):
         """
         closes serial port
         :return:
         """
+        self.stop_reader()
         self.error = ""
         try:
             self.ser.close()
         except serial.SerialException:
             self.error = "Error closing serial port"
+        except AttributeError:
+            pass
 
     def flush_input(self):
         """
@@ -132,7 +1087,117 @@ class JsonSerialPort:
         :return:
         """
         self.ser.reset_input_buffer()
-        self.buf = ""
+        self.clear_input()
+
+    def _begin_cycle(self):
+        """
+        opens port for one cycle, keeps already opened port in session mode
+        :return:
+        """
+        if self.metrics is not None:
+            self._cycle_start = time.monotonic()
+        if self.in_session:
+            self.ensure_open()
+        else:
+            self.open()
+        if self.error:
+            print(self.error)
+        if self.metrics is not None:
+            self._cycle_open = time.monotonic()
+
+    def _is_idempotent(self, data: Dict[str, Any]) -> bool:
+        """
+        checks if request may be sent again, patterns of latency profile or default ones are used
+        :param data: data dict to send
+        :return:
+        """
+        profile = self.latency_profile if self.latency_profile is not None else LatencyProfile()
+        return profile.is_idempotent(str(data.get("Cmd", "")))
+
+    def _sending(self, data: Dict[str, Any]):
+        """
+        called before every request is written, in cycle, pipeline, send or stream
+        :param data: data dict to send
+        :return:
+        """
+        if self.cache is not None:
+            self.cache.sent(data)
+
+    def _record_cycle(self, data: Dict[str, Any], responses: List[Optional[JsonResponse]]):
+        """
+        passes timestamps of finished cycle to metrics
+        :param data: sent data dict
+        :param responses: received responses
+        :return:
+        """
+        frame = responses[-1].timestamp if responses and responses[-1] is not None else None
+        self.metrics.command(str(data.get("Cmd", "")), self._cycle_start, self._cycle_open, self._written,
+                             self._first_byte, frame, time.monotonic())
+
+    def _end_cycle(self):
+        """
+        closes port after cycle if it is not in session mode
+        :return:
+        """
+        if not self.in_session:
+            self.close()
+
+    def _exchange(self, data: Dict[str, Any], count: int, timeout: float) -> List[Optional[JsonResponse]]:
+        """
+        writes data and gets count number of json responses, reconnects once on serial error,
+        request is sent again after reconnect only if it was not written or it is idempotent
+        :param data: data dict to send
+        :param count: number of jsons to get
+        :param timeout: time for json waiting
+        :return:
+        """
+        self._sending(data)
+        data_bytes = dicttobyte(data)
+        for attempt in range(2):
+            if not self.is_open:
+                # open failed or port was lost, persistent port is reopened here
+                self.reconnect()
+                if not self.is_open:
+                    print(self.error)
+                    continue
+            written = False
+            try:
+                self.write(data_bytes, False, False)
+                written = True
+                if self.error:
+                    print(self.error)
+                res = list()
+                for i in range(count):
+                    res.append(self.get_next_response(timeout))
+                    if self.error:
+                        print(self.error)
+                return res
+            except serial.SerialException:
+                self.reconnect()
+                if self.error:
+                    print(self.error)
+                # command with side effects (PwrOn, TestEncoder...) may be already running on jig
+                if written and not self._is_idempotent(data):
+                    break
+        self.error = "Serial port error"
+        print(self.error)
+        return [None] * count
+
+    def several_responses(self, data: Dict[str, Any], count: int = 1, timeout: float = 1) -> List[JsonResponse]:
+        """
+        opens port, writes data, gets count number of json responses
+        :param data: data dict to send
+        :param count: number of jsons to get
+        :param timeout: time for json waiting
+        :return: list of received responses, missing responses are skipped
+        """
+        with self.lock:
+            self._begin_cycle()
+            res = self._exchange(data, count, timeout)
+            self._end_cycle()
+            if self.metrics is not None:
+                self._record_cycle(data, res)
+        return [response for response in res if response is not None]
 
     def several_cycles(self, data: Dict[str, Any], count: int = 1, timeout: int = 1) -> List[str]:
         """
@@ -142,62 +1207,281 @@ class JsonSerialPort:
         :param count: number of jsons to get
         :return:
         """
-        self.open()
-        if self.error:
-            print(self.error)
-        data_bytes = dicttobyte(data)
-        self.write(data_bytes, False, False)
-        if self.error:
-            print(self.error)
-        res = list()
-        for i in range(count):
-            temp = self.get_next_json(timeout)
+        with self.lock:
+            self._begin_cycle()
+            responses = self._exchange(data, count, timeout)
+            self._end_cycle()
+            if self.metrics is not None:
+                self._record_cycle(data, responses)
+        res = [response.text if response is not None else "" for response in responses]
+        for temp in res:
             print(temp)
-            res.append(temp)
+        return res
+
+    def send(self, data: Dict[str, Any]) -> bool:
+        """
+        opens port and writes data without waiting for reply, e.g. command which starts long jig action.
+        its reply is dropped with stale replies before next request
+        :param data: data dict to send
+        :return: False on error
+        """
+        self._sending(data)
+        with self.lock:
+            self._begin_cycle()
+            if self.is_open:
+                try:
+                    self.write(dicttobyte(data), False, False)
+                except serial.SerialException:
+                    self.reconnect()
+                    self.error = "Serial port error"
             if self.error:
                 print(self.error)
-        self.close()
-        return res
+            ok = not self.error
+            self._end_cycle()
+        return ok
 
-    def full_one_cycle(self, data: Dict[str, Any], timeout: int = 1) -> str:
+    def _request(self, data: Dict[str, Any], timeout: float) -> Optional[JsonResponse]:
         """
-        opens port, writes data, gets json correct strings and returns it
+        opens port, writes data, gets one json response
+        :param data: data dict to send
         :param timeout: time for json waiting
+        :return: response or None
+        """
+        with self.lock:
+            self._begin_cycle()
+            response = self._exchange(data, 1, timeout)[0]
+            self._end_cycle()
+            if self.metrics is not None:
+                self._record_cycle(data, [response])
+        return response
+
+    def request(self, data: Dict[str, Any], timeout: float = None) -> Optional[JsonResponse]:
+        """
+        opens port, writes data, gets one json response.
+        with latency profile timeout is learned for every command and idempotent request is retried with backoff,
+        with cache idempotent requests may be answered without port
+        :param data: data dict to send
+        :param timeout: time for json waiting, explicit timeout is never replaced by learned one.
+        learned or DEFAULT_TIMEOUT if None
+        :return: response or None
+        """
+        if self.cache is not None:
+            response = self.cache.get(data)
+            if response is None:
+                response = self._learned_request(data, timeout)
+                if response is not None:
+                    self.cache.put(data, response)
+            return response
+        return self._learned_request(data, timeout)
+
+    def _learned_request(self, data: Dict[str, Any], timeout: Optional[float]) -> Optional[JsonResponse]:
+        """
+        sends request with timeout from latency profile if it is set and timeout is not given
+        :param data: data dict to send
+        :param timeout: time for json waiting, learned or DEFAULT_TIMEOUT if None
+        :return: response or None
+        """
+        profile = self.latency_profile
+        if profile is None:
+            return self._request(data, DEFAULT_TIMEOUT if timeout is None else timeout)
+        cmd = str(data.get("Cmd", ""))
+        if timeout is not None:
+            current = timeout
+            retries = 0
+        elif profile.is_idempotent(cmd):
+            current = profile.timeout(cmd, DEFAULT_TIMEOUT)
+            retries = profile.retries if profile.is_learned(cmd) else 0
+        else:
+            # command with side effects (e.g. encoder cycle) must not run twice on DUT,
+            # so it is sent once and learned latency may only make its timeout longer
+            current = max(profile.timeout(cmd, DEFAULT_TIMEOUT), DEFAULT_TIMEOUT)
+            retries = 0
+        for attempt in range(retries + 1):
+            response = self._request(data, current)
+            if response is not None:
+                # measured from write, port open time is not jig latency
+                profile.observe(cmd, response.timestamp - self._written)
+                return response
+            current = min(current * profile.backoff, profile.max_timeout)
+        return None
+
+    def full_one_cycle(self, data: Dict[str, Any], timeout: float = None) -> str:
+        """
+        opens port, writes data, gets json correct strings and returns it
+        :param timeout: time for json waiting, learned or DEFAULT_TIMEOUT if None
         :param data: data to send (in bytes with eol)
         :return:
         """
-        self.open()
-        if self.error:
-            print(self.error)
-        data_bytes = dicttobyte(data)
-        self.write(data_bytes, False, False)
-        if self.error:
-            print(self.error)
-        temp = self.get_next_json(timeout)
-        if self.error:
-            print(self.error)
-        self.close()
-        return temp
+        response = self.request(data, timeout)
+        return response.text if response is not None else ""
+
+    def iter_json(self, until: Callable[[JsonResponse], bool] = None, max_items: int = None,
+                  idle_timeout: float = 1, timeout: float = None,
+                  subscription: Subscription = None) -> Iterator[JsonResponse]:
+        """
+        yields jsons as they arrive until one of stop conditions
+        :param until: stop after json for which until is True (this json is yielded)
+        :param max_items: stop after this number of jsons
+        :param idle_timeout: stop if there is no json during this time in s
+        :param timeout: stop after this time in s from start, no limit if None
+        :param subscription: subscription to read from when background reader is running, removed at the end
+        :return:
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if subscription is None and self.reader_running:
+            subscription = self.subscribe()
+        count = 0
+        try:
+            while max_items is None or count < max_items:
+                wait = idle_timeout
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return
+                if subscription is not None:
+                    response = subscription.get(wait)
+                else:
+                    response = self.get_next_response(wait)
+                if response is None:
+                    return
+                count += 1
+                yield response
+                if until is not None and until(response):
+                    return
+        finally:
+            if subscription is not None:
+                self.unsubscribe(subscription)
+
+    def stream(self, data: Dict[str, Any], until: Callable[[JsonResponse], bool] = None, max_items: int = None,
+               idle_timeout: float = 1, timeout: float = None) -> Iterator[JsonResponse]:
+        """
+        opens port, writes data and yields jsons as they arrive, see iter_json for stop conditions
+        :param data: data dict to send
+        :param until: stop after json for which until is True
+        :param max_items: stop after this number of jsons
+        :param idle_timeout: stop if there is no json during this time in s
+        :param timeout: stop after this time in s from start
+        :return:
+        """
+        self._begin_cycle()
+        try:
+            # subscribe before write so that first jsons are not missed
+            subscription = self.subscribe() if self.reader_running else None
+            self._sending(data)
+            self.write(dicttobyte(data), False, False)
+            if self.error:
+                print(self.error)
+            yield from self.iter_json(until, max_items, idle_timeout, timeout, subscription)
+        finally:
+            self._end_cycle()
 
-    def full_one_cycle_with_key(self, data: Dict[str, Any], key='result', timeout: int = 1):
+    def full_one_cycle_with_key(self, data: Dict[str, Any], key='result', timeout: float = None):
         """
         opens serial port, gets data and gets data for given key
         :param data: data dict
-        :param timeout:timeout in s
-        :param key: key to get in response
+        :param timeout: timeout in s, learned or DEFAULT_TIMEOUT if None
+        :param key: key to get in response, case insensitive
         :return: responce data fo key
         """
-        json_str = self.full_one_cycle(data, timeout)
-        if json_str:
-            data = json.loads(json_str.lower(), encoding='utf')
-            if key.lower() in data.keys():
-                return data[key]
+        response = self.request(data, timeout)
+        if response is not None and key in response:
+            return response[key]
         self.error = "No result for %s key" % key
         print(self.error)
         return ""
 
+    def get_many(self, keys: Iterable[str], timeout: float = None) -> Dict[str, Any]:
+        """
+        gets values for several keys with one Get command
+        :param keys: keys to get, e.g. voltage rails names
+        :param timeout: timeout in s, learned or DEFAULT_TIMEOUT if None
+        :return: dict key: value for received keys
+        """
+        keys = list(keys)
+        response = self.request({"Cmd": "Get", "Params": keys}, timeout)
+        if response is None:
+            return dict()
+        res = {key: response[key] for key in keys if key in response}
+        missing = [key for key in keys if key not in res]
+        if missing:
+            self.error = "No result for %s keys" % ', '.join(missing)
+            print(self.error)
+        return res
+
+
+class BatchedGet:
+    """
+    values for several keys fetched with one Get command and shared by several test phases
+    """
+
+    def __init__(self, port: JsonSerialPort, keys: Iterable[str], timeout: float = None):
+        """
+        :param port: port to send Get command to
+        :param keys: all keys to fetch at once
+        :param timeout: timeout in s, learned or DEFAULT_TIMEOUT if None
+        """
+        self.port = port
+        self.keys = list(keys)
+        self.timeout = timeout
+        self.values: Optional[Dict[str, Any]] = None
+
+    def reset(self):
+        """
+        forgets fetched values, next get will send new Get command (e.g. for next DUT)
+        :return:
+        """
+        self.values = None
+
+    def get(self, key: str) -> Any:
+        """
+        gets value for key, fetches all keys on first call
+        :param key: key to get
+        :return: value or empty string if there is no value
+        """
+        if self.values is None:
+            self.values = self.port.get_many(self.keys, self.timeout)
+        return self.values.get(key, "")
+
+
+_ports: Dict[Tuple[str, int], JsonSerialPort] = dict()
+_ports_lock = threading.Lock()
+
+
+def get_port(port_id: str = DEFAULT_PORT, baudrate: int = 115200, timeout: float = 0.5) -> JsonSerialPort:
+    """
+    returns process-wide persistent port for given port id and baudrate, creates it on first call
+    :param port_id: serial port name
+    :param baudrate: baudrate
+    :param timeout: port timeout for new port
+    :return: shared JsonSerialPort
+    """
+    with _ports_lock:
+        port = _ports.get((port_id, baudrate))
+        if port is None:
+            broker = os.environ.get("JSON_SERIAL_BROKER")
+            if broker and os.path.exists(broker):
+                import serial_broker
+                # port is owned by serial_broker daemon, requests go through it; other slots open their own ports
+                if serial_broker.serves(broker, port_id):
+                    port = serial_broker.BrokerPort(broker, timeout)
+            if port is None:
+                port = JsonSerialPort(port_id, baudrate, timeout, persistent=True)
+            _ports[(port_id, baudrate)] = port
+        return port
+
+
+def close_all():
+    """
+    closes all shared ports and clears registry
+    :return:
+    """
+    with _ports_lock:
+        for port in _ports.values():
+            port.close()
+        _ports.clear()
+
 
 # simple test
 if __name__ == "__main__":
-    port = JsonSerialPort('COM7')
+    port = JsonSerialPort()
     print(port.full_one_cycle_with_key({"Test": 1}, 'test'))
@@ -0,0 +1,301 @@
+"""
+vectorized microphone analysis: level, SNR and spectrum correlation to reference of all channels in one numpy pass,
+reference features are computed once and kept in memory-mapped .npy cache keyed by file mtime and hash.
+not used for MIC plan verdict until its limits are calibrated against micstest
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import wave
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np
+
+REFERENCE = '/home/yandex/elenchus/hwtest/Example.wav'
+CACHE_DIR = os.environ.get("MIC_ANALYSIS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "mic_analysis"))
+FULL_SCALE = 32768.0
+FRAME = 1024
+HOP = 512
+# reference bins within this range from reference peak are signal, other bins are noise
+SIGNAL_DB = 20
+# spectra are compared within this range from their peak, so noise floor does not dominate correlation
+DYNAMIC_DB = 40
+EPS = 1e-12
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    """
+    reads 16 bit WAV file
+    :param path: file path
+    :return: frames x channels int16 array and sample rate
+    """
+    with wave.open(path, 'rb') as file:
+        channels = file.getnchannels()
+        rate = file.getframerate()
+        data = file.readframes(file.getnframes())
+    return np.frombuffer(data, dtype='<i2').reshape(-1, channels), rate
+
+
+def spectra(samples: np.ndarray, frame: int = FRAME, hop: int = HOP) -> np.ndarray:
+    """
+    averaged power spectrum of every channel: all windows of all channels go to one batched FFT
+    :param samples: frames x channels int16 array
+    :param frame: FFT length
+    :param hop: window step
+    :return: channels x (frame // 2 + 1) array
+    """
+    # channels x frames, float64: numpy FFT of float32 is several times slower
+    x = samples.T / FULL_SCALE
+    if x.shape[1] < frame:
+        x = np.concatenate((x, np.zeros((x.shape[0], frame - x.shape[1]))), axis=1)
+    # channels x windows x frame view without copy
+    windows = np.lib.stride_tricks.sliding_window_view(x, frame, axis=1)[:, ::hop]
+    spectrum = np.fft.rfft(windows * np.hanning(frame), axis=-1)
+    # sum of squares without complex abs temporaries
+    power = np.einsum('cwf,cwf->cf', spectrum.real, spectrum.real)
+    power += np.einsum('cwf,cwf->cf', spectrum.imag, spectrum.imag)
+    return power / spectrum.shape[1]
+
+
+def levels(samples: np.ndarray) -> np.ndarray:
+    """
+    RMS level of every channel
+    :param samples: frames x channels int16 array
+    :return: dB full scale per channel
+    """
+    rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64), axis=0))
+    return 20 * np.log10(np.maximum(rms, EPS) / FULL_SCALE)
+
+
+def _normalized_log(power: np.ndarray) -> np.ndarray:
+    log = np.log10(power + EPS)
+    log = np.maximum(log, log.max(axis=-1, keepdims=True) - DYNAMIC_DB / 10)
+    log = log - log.mean(axis=-1, keepdims=True)
+    return log / np.maximum(np.linalg.norm(log, axis=-1, keepdims=True), EPS)
+
+
+def reference_features(samples: np.ndarray, frame: int = FRAME, hop: int = HOP) -> np.ndarray:
+    """
+    features of reference recording as one array for .npy cache
+    :param samples: frames x channels int16 array
+    :param frame: FFT length
+    :param hop: window step
+    :return: 3 x bins array: mean power spectrum, signal bin mask, normalized log spectrum
+    """
+    power = spectra(samples, frame, hop).mean(axis=0)
+    mask = power >= power[1:].max() * 10 ** (-SIGNAL_DB / 10)
+    mask[0] = False
+    return np.stack((power, mask.astype(power.dtype), _normalized_log(power)))
+
+
+def file_hash(path: str) -> str:
+    """
+    sha1 of file content
+    :param path: file path
+    :return: hex digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ReferenceCache:
+    """
+    reference features in <cache_dir>/<sha1>-<frame>-<hop>.npy, opened with mmap, features of reference start for
+    shorter recordings in <sha1>-<frame>-<hop>-<frames>.npy. index.json keeps mtime, size and hash of every reference,
+    so file is hashed again only after it is changed
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, frame: int = FRAME, hop: int = HOP):
+        """
+        :param cache_dir: cache directory
+        :param frame: FFT length
+        :param hop: window step
+        """
+        self.cache_dir = cache_dir
+        self.frame = frame
+        self.hop = hop
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.error = ""
+        self._loaded: Dict[Tuple[str, Optional[int]], Tuple[int, int, np.ndarray]] = dict()
+
+    def _read_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return dict()
+
+    def _write_atomic(self, path: str, write):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                write(file)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def key(self, path: str) -> str:
+        """
+        gets content hash of reference, hashes file only if its mtime or size differs from index
+        :param path: reference WAV path
+        :return: hex digest
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        index = self._read_index()
+        entry = index.get(path)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["sha1"]
+        index[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": file_hash(path)}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write_atomic(self.index_path, lambda file: file.write(json.dumps(index, indent=1).encode()))
+        return index[path]["sha1"]
+
+    def load(self, path: str, frames: int = None) -> Optional[np.ndarray]:
+        """
+        gets features of reference from memory, cache file or computes them
+        :param path: reference WAV path
+        :param frames: use only this number of frames from reference start, whole reference if None
+        :return: read-only features array or None on error
+        """
+        self.error = ""
+        try:
+            stat = os.stat(path)
+            loaded = self._loaded.get((path, frames))
+            if loaded and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+                return loaded[2]
+            cache_path = os.path.join(self.cache_dir, "%s-%d-%d%s.npy" % (self.key(path), self.frame, self.hop,
+                                                                          "" if frames is None else "-%d" % frames))
+            if not os.path.isfile(cache_path):
+                samples, rate = read_wav(path)
+                features = reference_features(samples[:frames], self.frame, self.hop)
+                self._write_atomic(cache_path, lambda file: np.save(file, features))
+            features = np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError, EOFError, wave.Error):
+            self.error = "reference %s is not available" % path
+            print(self.error)
+            return None
+        self._loaded[(path, frames)] = (stat.st_mtime_ns, stat.st_size, features)
+        return features
+
+
+class Analysis:
+    """
+    per channel results of one recording
+    """
+
+    def __init__(self, levels: np.ndarray, snr: np.ndarray, correlation: np.ndarray, passed: np.ndarray):
+        self.levels = levels
+        self.snr = snr
+        self.correlation = correlation
+        self.passed = passed
+
+    @property
+    def ok(self) -> bool:
+        return bool(np.all(self.passed))
+
+    def measurement(self) -> List[str]:
+        """
+        gets result in micstest.process_file format: status first, details second
+        :return:
+        """
+        details = ', '.join('mic%d %s %.1f dBFS snr %.1f dB corr %.2f' % (
+            i + 1, 'ok' if passed else 'fail', level, snr, corr)
+                            for i, (passed, level, snr, corr) in
+                            enumerate(zip(self.passed, self.levels, self.snr, self.correlation)))
+        return ['OK' if self.ok else 'FAIL', details]
+
+
+class MicAnalyzer:
+    """
+    checks all channels of recording against reference, recording shorter than reference is compared with the same
+    length from reference start. min_snr and min_correlation are not calibrated on jig recordings yet
+    """
+
+    def __init__(self, reference: str = REFERENCE, cache: ReferenceCache = None, min_dbfs: float = -50,
+                 max_dbfs: float = -1, min_snr: float = 10, min_correlation: float = 0.8):
+        """
+        :param reference: reference WAV path
+        :param cache: reference features cache, default cache directory if None
+        :param min_dbfs: min RMS level in dB full scale
+        :param max_dbfs: max RMS level, louder is clipping
+        :param min_snr: min signal to noise ratio in dB
+        :param min_correlation: min correlation of log spectrum to reference
+        """
+        self.reference = reference
+        self.cache = ReferenceCache() if cache is None else cache
+        self.min_dbfs = min_dbfs
+        self.max_dbfs = max_dbfs
+        self.min_snr = min_snr
+        self.min_correlation = min_correlation
+        self.error = ""
+
+    def analyse(self, samples: np.ndarray) -> Optional[Analysis]:
+        """
+        analyses recording, e.g. mic_capture result samples
+        :param samples: frames x channels int16 array
+        :return: analysis or None if reference is not available
+        """
+        try:
+            with wave.open(self.reference, 'rb') as file:
+                # shorter recording is compared with the same length from reference start
+                frames = len(samples) if len(samples) < file.getnframes() else None
+        except (OSError, EOFError, wave.Error):
+            frames = None
+        features = self.cache.load(self.reference, frames)
+        self.error = self.cache.error
+        if features is None:
+            return None
+        mask = features[1] > 0
+        power = spectra(samples, self.cache.frame, self.cache.hop)
+        signal = power[:, mask].sum(axis=1)
+        noise = power[:, 1:][:, ~mask[1:]].sum(axis=1)
+        snr = 10 * np.log10((signal + EPS) / (noise + EPS))
+        correlation = _normalized_log(power) @ features[2]
+        level = levels(samples)
+        passed = (level >= self.min_dbfs) & (level <= self.max_dbfs) & (snr >= self.min_snr) & \
+                 (correlation >= self.min_correlation)
+        return Analysis(level, snr, correlation, passed)
+
+    def process_file(self, directory: str, filename: str) -> List[str]:
+        """
+        analyses WAV file, drop-in for micstest.process_file
+        :param directory: directory with trailing slash
+        :param filename: file name
+        :return: status first, details second
+        """
+        samples, rate = read_wav(directory + filename)
+        analysis = self.analyse(samples)
+        if analysis is None:
+            return ['No example file', self.error]
+        return analysis.measurement()
+
+
+# simple test
+if __name__ == "__main__":
+    import time
+
+    t = np.arange(16000 * 12) / 16000
+    rng = np.random.default_rng(1)
+    tone = 3000 * (np.sin(2 * np.pi * 1000 * t) + 0.5 * np.sin(2 * np.pi * 3000 * t))
+    recording = np.repeat(tone[:, None], 8, axis=1) + rng.normal(0, 30, (len(t), 8))
+    recording[:, 7] = rng.normal(0, 300, len(t))
+    recording = recording.astype('<i2')
+    with tempfile.TemporaryDirectory() as tmp:
+        example = os.path.join(tmp, 'Example.wav')
+        with wave.open(example, 'wb') as out:
+            out.setnchannels(8)
+            out.setsampwidth(2)
+            out.setframerate(16000)
+            out.writeframes(np.repeat(tone[:, None], 8, axis=1).astype('<i2').tobytes())
+        analyzer = MicAnalyzer(example, ReferenceCache(os.path.join(tmp, 'cache')))
+        for attempt in ("cold", "warm"):
+            start = time.perf_counter()
+            result = analyzer.analyse(recording).measurement()
+            print(attempt, "%.1f ms" % ((time.perf_counter() - start) * 1000), result)
@@ -0,0 +1,349 @@
+"""
+streaming microphone capture: raw PCM from arecord stdout (or any byte source) goes to preallocated numpy ring buffer,
+every block is analysed while recording continues, WAV file is written in background for archive only
+"""
+
+import functools
+import queue
+import re
+import subprocess
+import threading
+import time
+import wave
+from typing import List, Optional, BinaryIO, Callable
+
+import numpy as np
+
+CHANNELS = 8
+RATE = 16000
+SAMPLE_WIDTH = 2
+FULL_SCALE = 32768.0
+UNDECIDED = 0
+PASS = 1
+FAIL = -1
+
+
+@functools.lru_cache(maxsize=1)
+def find_card() -> Optional[str]:
+    """
+    finds first capture card with arecord -l, result is kept for next DUTs
+    :return: card number or None
+    """
+    try:
+        output = subprocess.run(['arecord', '-l'], stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.decode()
+    except OSError:
+        return None
+    match = re.search(r'card (\d+)', output)
+    return match.group(1) if match else None
+
+
+def arecord_command(card: str, channels: int = CHANNELS, rate: int = RATE) -> List[str]:
+    """
+    gets arecord command writing raw S16_LE PCM to stdout until it is stopped
+    :param card: card number
+    :param channels: number of channels
+    :param rate: sample rate
+    :return:
+    """
+    return ['arecord', '-q', '-D', 'hw:%s,0' % card, '-c', str(channels), '-f', 'S16_LE', '-r', str(rate),
+            '-t', 'raw']
+
+
+class RingBuffer:
+    """
+    preallocated int16 frames x channels buffer, the oldest frames are overwritten when it is full
+    """
+
+    def __init__(self, frames: int, channels: int = CHANNELS):
+        """
+        :param frames: capacity in frames
+        :param channels: number of channels
+        """
+        self.data = np.zeros((frames, channels), dtype=np.int16)
+        self.pos = 0
+        self.total = 0
+
+    def write(self, block: np.ndarray):
+        """
+        copies block of frames into buffer
+        :param block: frames x channels int16 array
+        :return:
+        """
+        capacity = len(self.data)
+        if len(block) >= capacity:
+            block = block[-capacity:]
+        end = self.pos + len(block)
+        if end <= capacity:
+            self.data[self.pos:end] = block
+        else:
+            first = capacity - self.pos
+            self.data[self.pos:] = block[:first]
+            self.data[:end - capacity] = block[first:]
+        self.pos = end % capacity
+        self.total += len(block)
+
+    def latest(self, frames: int = None) -> np.ndarray:
+        """
+        gets copy of the last frames in order of arrival
+        :param frames: number of frames, all stored frames if None
+        :return: frames x channels array
+        """
+        stored = min(self.total, len(self.data))
+        frames = stored if frames is None else min(frames, stored)
+        start = self.pos - frames
+        if start >= 0:
+            return self.data[start:self.pos].copy()
+        return np.concatenate((self.data[start:], self.data[:self.pos]))
+
+
+class LevelAnalyzer:
+    """
+    per block, per channel level check: channel passes after several consecutive blocks with level in range,
+    fails if it has no such run in fail_blocks blocks
+    """
+
+    def __init__(self, channels: int = CHANNELS, min_dbfs: float = -50, max_dbfs: float = -1,
+                 confirm_blocks: int = 5, fail_blocks: int = 30):
+        """
+        :param channels: number of channels
+        :param min_dbfs: min RMS level of working microphone in dB full scale
+        :param max_dbfs: max RMS level, louder is clipping
+        :param confirm_blocks: consecutive good blocks for pass
+        :param fail_blocks: blocks after which undecided channel fails
+        """
+        self.min_dbfs = min_dbfs
+        self.max_dbfs = max_dbfs
+        self.confirm_blocks = confirm_blocks
+        self.fail_blocks = fail_blocks
+        self.states = np.full(channels, UNDECIDED, dtype=np.int8)
+        self.good_run = np.zeros(channels, dtype=np.int32)
+        self.levels = np.full(channels, -np.inf)
+        self.blocks = 0
+
+    def feed(self, block: np.ndarray) -> np.ndarray:
+        """
+        analyses one block of all channels at once
+        :param block: frames x channels int16 array
+        :return: channel states: PASS, FAIL or UNDECIDED
+        """
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float64), axis=0))
+        self.levels = 20 * np.log10(np.maximum(rms, 1e-9) / FULL_SCALE)
+        good = (self.levels >= self.min_dbfs) & (self.levels <= self.max_dbfs)
+        self.good_run = np.where(good, self.good_run + 1, 0)
+        self.blocks += 1
+        undecided = self.states == UNDECIDED
+        self.states[undecided & (self.good_run >= self.confirm_blocks)] = PASS
+        if self.blocks >= self.fail_blocks:
+            self.states[self.states == UNDECIDED] = FAIL
+        return self.states
+
+    @property
+    def done(self) -> bool:
+        return bool(np.all(self.states != UNDECIDED))
+
+    @property
+    def failed(self) -> bool:
+        return bool(np.any(self.states == FAIL))
+
+
+class WavWriter:
+    """
+    background thread writing blocks to WAV file
+    """
+
+    def __init__(self, path: str, channels: int = CHANNELS, rate: int = RATE):
+        """
+        :param path: WAV file path
+        :param channels: number of channels
+        :param rate: sample rate
+        """
+        self.path = path
+        self.error = ""
+        self.blocks = queue.Queue()
+        self.closed = False
+        self.file = wave.open(path, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(SAMPLE_WIDTH)
+        self.file.setframerate(rate)
+        self.thread = threading.Thread(target=self._run, name="wav %s" % path, daemon=True)
+        self.thread.start()
+
+    def put(self, data: bytes):
+        self.blocks.put(data)
+
+    def _run(self):
+        try:
+            while True:
+                data = self.blocks.get()
+                if data is None:
+                    break
+                self.file.writeframesraw(data)
+        except OSError:
+            self.error = "WAV write error"
+        finally:
+            self.file.close()
+
+    def close(self, wait: bool = False):
+        """
+        finishes file after queued blocks
+        :param wait: wait until file is written
+        :return:
+        """
+        if not self.closed:
+            self.closed = True
+            self.blocks.put(None)
+        if wait:
+            self.thread.join()
+
+
+class CaptureResult:
+    """
+    result of capture: channel states and levels, captured samples, error if recording is shorter than expected
+    """
+
+    def __init__(self, states: np.ndarray, levels: np.ndarray, samples: np.ndarray, elapsed: float,
+                 stopped_early: bool, wav: Optional[WavWriter], error: str = ""):
+        self.error = error
+        self.states = states
+        self.levels = levels
+        self.samples = samples
+        self.elapsed = elapsed
+        self.stopped_early = stopped_early
+        self.wav = wav
+
+    @property
+    def passed(self) -> bool:
+        return bool(np.all(self.states == PASS))
+
+    def measurement(self) -> List[str]:
+        """
+        gets result in micstest.process_file format: status first, details second
+        :return:
+        """
+        details = ', '.join('mic%d %s %.1f dBFS' % (i + 1, {PASS: 'ok', FAIL: 'fail'}.get(int(state), '?'), level)
+                            for i, (state, level) in enumerate(zip(self.states, self.levels)))
+        return ['OK' if self.passed else 'FAIL', details]
+
+
+class MicCapture:
+    """
+    reads PCM blocks from source, keeps them in ring buffer, analyses every block and stops at duration
+    or as soon as analyzer has failed a channel. passing recording runs for the whole duration, so reference
+    comparison gets as much data as reference has
+    """
+
+    def __init__(self, channels: int = CHANNELS, rate: int = RATE, block_ms: int = 100, duration: float = 12,
+                 min_duration: float = 1, analyzer=None):
+        """
+        :param channels: number of channels
+        :param rate: sample rate
+        :param block_ms: analysis block length in ms
+        :param duration: max recording time in s
+        :param min_duration: recording is not stopped early before this time in s
+        :param analyzer: object with feed(block) and failed, LevelAnalyzer if None
+        """
+        self.channels = channels
+        self.rate = rate
+        self.block_frames = rate * block_ms // 1000
+        self.max_blocks = int(duration * 1000) // block_ms
+        self.min_blocks = int(min_duration * 1000) // block_ms
+        self.ring = RingBuffer(self.max_blocks * self.block_frames, channels)
+        self.analyzer = LevelAnalyzer(channels) if analyzer is None else analyzer
+        self.buffer = bytearray(self.block_frames * channels * SAMPLE_WIDTH)
+        self.error = ""
+
+    def _read_block(self, source: BinaryIO) -> int:
+        """
+        fills block buffer from source
+        :param source: object with readinto
+        :return: number of bytes read, less than block size at end of data
+        """
+        view = memoryview(self.buffer)
+        received = 0
+        while received < len(view):
+            size = source.readinto(view[received:])
+            if not size:
+                break
+            received += size
+        return received
+
+    def run(self, source: BinaryIO, wav_path: str = None,
+            on_block: Callable[[np.ndarray], None] = None) -> CaptureResult:
+        """
+        captures from source until duration, failed channel or end of data
+        :param source: raw S16_LE interleaved PCM with readinto, e.g. arecord stdout
+        :param wav_path: WAV archive path, not written if None
+        :param on_block: called for every block, e.g. for live display
+        :return:
+        """
+        self.error = ""
+        wav = WavWriter(wav_path, self.channels, self.rate) if wav_path else None
+        frame_bytes = self.channels * SAMPLE_WIDTH
+        start = time.monotonic()
+        stopped_early = False
+        for i in range(self.max_blocks):
+            received = self._read_block(source) // frame_bytes * frame_bytes
+            if not received:
+                break
+            block = np.frombuffer(self.buffer, dtype='<i2', count=received // SAMPLE_WIDTH).reshape(-1, self.channels)
+            self.ring.write(block)
+            if wav is not None:
+                wav.put(bytes(self.buffer[:received]))
+            self.analyzer.feed(block)
+            if on_block is not None:
+                on_block(block)
+            if received < len(self.buffer):
+                break
+            # failed channel does not pass later, passed one still needs full recording for reference comparison
+            if i + 1 >= self.min_blocks and self.analyzer.failed:
+                stopped_early = i + 1 < self.max_blocks
+                break
+        if wav is not None:
+            wav.close()
+        if self.ring.total < self.max_blocks * self.block_frames and not stopped_early:
+            self.error = "recording is shorter than expected"
+        return CaptureResult(self.analyzer.states.copy(), np.array(self.analyzer.levels), self.ring.latest(),
+                             time.monotonic() - start, stopped_early, wav, self.error)
+
+
+def record(card: str, wav_path: str = None, duration: float = 12, analyzer=None,
+           channels: int = CHANNELS, rate: int = RATE) -> CaptureResult:
+    """
+    records from ALSA card with arecord and analyses while recording
+    :param card: card number
+    :param wav_path: WAV archive path
+    :param duration: max recording time in s
+    :param analyzer: block analyzer, LevelAnalyzer if None
+    :param channels: number of channels
+    :param rate: sample rate
+    :return: result, its error is set if arecord stopped before duration
+    """
+    capture = MicCapture(channels, rate, duration=duration, analyzer=analyzer)
+    process = subprocess.Popen(arecord_command(card, channels, rate), stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, bufsize=0)
+    try:
+        result = capture.run(process.stdout, wav_path)
+    finally:
+        process.terminate()
+        stderr = process.communicate()[1]
+    if result.error:
+        # e.g. card is busy or missing: arecord exits at once and no channel is decided
+        result.error = "%s, arecord: %s" % (result.error, stderr.decode(errors='replace').strip() or
+                                            "exit code %s" % process.returncode)
+        print(result.error)
+    return result
+
+
+# simple test
+if __name__ == "__main__":
+    import io
+    import tempfile
+
+    t = np.arange(RATE * 12) / RATE
+    tone = (3000 * np.sin(2 * np.pi * 1000 * t)).astype('<i2')
+    pcm = np.repeat(tone[:, None], CHANNELS, axis=1)
+    pcm[:, 7] = 0
+    with tempfile.NamedTemporaryFile(suffix='.wav') as archive:
+        res = MicCapture().run(io.BytesIO(pcm.tobytes()), archive.name)
+        res.wav.close(wait=True)
+        print(res.measurement(), "%.3f s" % res.elapsed, "early" if res.stopped_early else "full")
@@ -0,0 +1,253 @@
+"""
+concurrent phase groups: members of group run in threads at the same time when they use different resources
+(serial jig, camera, ALSA card, GPIO), resource locks, dependencies and signals between members decide the order.
+group runs inside one openhtf phase, members return their results and thin phases after it publish them with
+result(), so every member has its own phase outcome and measurements in ordinary test record
+"""
+
+import contextlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Any, Optional
+
+RESOURCES = ("serial", "camera", "audio", "gpio")
+
+
+class Member:
+    """
+    one phase function of group
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], resources: Iterable[str], after: Iterable[str],
+                 signals: Iterable[str] = (), after_signals: Iterable[str] = ()):
+        """
+        :param name: name for log
+        :param func: function(test) returning member result
+        :param resources: resources held for the whole run of function
+        :param after: names of members which must finish first
+        :param signals: names of signals set by function, they are set at the end of member if function does not
+        :param after_signals: signals which must be set before resources are taken
+        """
+        self.name = name
+        self.func = func
+        self.resources = tuple(sorted(set(resources)))
+        self.after = tuple(after)
+        self.signals = tuple(signals)
+        self.after_signals = tuple(after_signals)
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.result: Any = None
+        self.skipped = False
+        self.wait = 0.0
+        self.start = 0.0
+        self.end = 0.0
+
+    def reset(self):
+        self.done.clear()
+        self.error = None
+        self.result = None
+        self.skipped = False
+        self.wait = self.start = self.end = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.skipped
+
+
+class PhaseGroup:
+    """
+    members declared with member() decorator, run(test) is called from openhtf phase, result(name) from phase
+    which declares measurements of member
+    """
+
+    def __init__(self, name: str, resources: Iterable[str] = RESOURCES):
+        """
+        :param name: group name for log
+        :param resources: names of resources members may use
+        """
+        self.name = name
+        # reentrant, so member can hold its own resource again, e.g. in helper
+        self.locks = {resource: threading.RLock() for resource in resources}
+        self.members: Dict[str, Member] = dict()
+        self.signals: Dict[str, threading.Event] = dict()
+        self.error = ""
+        self.elapsed = 0.0
+        self.started = 0.0
+        # member run by current thread, its wait time includes waits in hold()
+        self._local = threading.local()
+
+    def member(self, name: str, resources: Iterable[str] = (), after: Iterable[str] = (), signals: Iterable[str] = (),
+               after_signals: Iterable[str] = ()):
+        """
+        decorator adding function(test) returning member result to group. dependencies and signals must be declared before, so they have
+        no cycles
+        :param name: member name
+        :param resources: resources held for the whole run of member
+        :param after: members which must finish successfully first, member is skipped if one of them fails
+        :param signals: signals member sets with signal(), e.g. when it has used shared resource and others may start
+        :param after_signals: signals of other members to wait for before resources are taken
+        :return:
+        """
+        resources = tuple(resources)
+        after = tuple(after)
+        signals = tuple(signals)
+        after_signals = tuple(after_signals)
+        unknown = [resource for resource in resources if resource not in self.locks]
+        if unknown:
+            raise ValueError("unknown resources %s" % unknown)
+        missing = [dependency for dependency in after if dependency not in self.members]
+        if missing:
+            raise ValueError("%s depends on undeclared members %s" % (name, missing))
+        missing = [signal for signal in after_signals if signal not in self.signals]
+        if missing:
+            raise ValueError("%s waits for undeclared signals %s" % (name, missing))
+        duplicate = [signal for signal in signals if signal in self.signals]
+        if duplicate:
+            raise ValueError("signals %s are already declared" % duplicate)
+
+        def decorator(func: Callable[[Any], Any]):
+            self.members[name] = Member(name, func, resources, after, signals, after_signals)
+            for signal in signals:
+                self.signals[signal] = threading.Event()
+            return func
+
+        return decorator
+
+    def signal(self, name: str):
+        """
+        sets signal, members waiting for it may take their resources
+        :param name: signal name
+        :return:
+        """
+        self.signals[name].set()
+
+    @contextlib.contextmanager
+    def hold(self, *resources: str):
+        """
+        holds resources for a part of member, e.g. serial port to start playback before recording.
+        resources are taken in sorted order, member must not wait for resource held by member which waits for its own.
+        time spent waiting for resources is added to wait of current member
+        :param resources: resource names
+        :return:
+        """
+        member = getattr(self._local, 'member', None)
+        start = time.monotonic()
+        with contextlib.ExitStack() as stack:
+            for resource in sorted(set(resources)):
+                stack.enter_context(self.locks[resource])
+            if member is not None:
+                member.wait += time.monotonic() - start
+            yield
+
+    def _run_member(self, member: Member, test: Any):
+        self._local.member = member
+        try:
+            for dependency in member.after:
+                self.members[dependency].done.wait()
+                if not self.members[dependency].ok:
+                    member.skipped = True
+                    return
+            start = time.monotonic()
+            for signal in member.after_signals:
+                self.signals[signal].wait()
+            member.wait = time.monotonic() - start
+            with self.hold(*member.resources):
+                member.start = time.monotonic()
+                try:
+                    member.result = member.func(test)
+                except BaseException as e:
+                    member.error = e
+                member.end = time.monotonic()
+        finally:
+            # waiting members are not blocked forever by member which failed before its signals
+            for signal in member.signals:
+                self.signals[signal].set()
+            self._local.member = None
+            member.done.set()
+
+    def run(self, test: Any, raise_error: bool = True):
+        """
+        runs all members and waits for them
+        :param test: openhtf test api of group phase
+        :param raise_error: raise the first member exception again, so group phase gets ERROR. member phases
+        get exceptions from result() if it is False
+        :return:
+        """
+        self.error = ""
+        for member in self.members.values():
+            member.reset()
+        for signal in self.signals.values():
+            signal.clear()
+        start = self.started = time.monotonic()
+        threads = [threading.Thread(target=self._run_member, args=(member, test), name="%s %s" % (self.name, name),
+                                    daemon=True) for name, member in self.members.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - start
+        logger = getattr(test, 'logger', None)
+        for line in self.report():
+            if logger is not None:
+                logger.info(line)
+        failed = [member for member in self.members.values() if member.error is not None]
+        if failed:
+            self.error = "; ".join("%s: %r" % (member.name, member.error) for member in failed)
+            if raise_error:
+                raise failed[0].error
+
+    def result(self, name: str) -> Any:
+        """
+        gets result of member from last run for phase which publishes it, member exception is raised again
+        :param name: member name
+        :return: value returned by member function
+        """
+        member = self.members[name]
+        if member.error is not None:
+            raise member.error
+        if member.skipped:
+            raise RuntimeError("%s is skipped, its dependency has failed" % name)
+        return member.result
+
+    def report(self) -> List[str]:
+        """
+        gets timing of last run: when every member started, how long it ran and waited for resources
+        :return: lines
+        """
+        origin = self.started
+        lines = list()
+        for member in self.members.values():
+            if member.skipped:
+                lines.append("%s: skipped" % member.name)
+                continue
+            lines.append("%s: start %.1f s, run %.1f s, wait %.1f s%s" % (
+                member.name, member.start - origin, member.end - member.start, member.wait,
+                ", error %r" % member.error if member.error is not None else ""))
+        serial = sum(member.end - member.start for member in self.members.values() if not member.skipped)
+        lines.append("%s: %.1f s, %.1f s sequentially" % (self.name, self.elapsed, serial))
+        return lines
+
+
+# simple test
+if __name__ == "__main__":
+    group = PhaseGroup("demo")
+
+    @group.member("Sound Test", resources=("audio",), signals=("playback started",))
+    def sound(test):
+        with group.hold("serial"):
+            time.sleep(0.05)
+            group.signal("playback started")
+        time.sleep(0.5)
+
+    @group.member("Encoder Test", resources=("serial",), after_signals=("playback started",))
+    def encoder(test):
+        time.sleep(0.2)
+        return "Ok"
+
+    @group.member("Light Sensor Test", resources=("serial",), after=("Encoder Test",))
+    def light(test):
+        time.sleep(0.2)
+
+    group.run(None)
+    print("\n".join(group.report()))
+    print("Encoder Test result", group.result("Encoder Test"))
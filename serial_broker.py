@@ -0,0 +1,777 @@
+"""
+local broker which owns jig serial port and shares it between processes over Unix domain socket.
+
+protocol is line based: client sends one json per request
+    {"op": "request", "seq": 1, "data": {"Cmd": "Ping"}, "count": 1, "timeout": 1}
+    {"op": "submit", "seq": 2, "data": {"Cmd": "Get", "Params": ["5vV"]}, "timeout": 1}
+    {"op": "send", "seq": 4, "data": {"Cmd": "TestMics", "a": 300}}
+    {"op": "stream", "seq": 3, "data": {"Cmd": "TestEncoder"}, "max_items": null, "idle_timeout": 1, "timeout": null}
+    {"op": "subscribe"}
+    {"op": "info"}
+broker answers with header json followed by raw jig frames, one per line, "null" for missing frame
+    {"seq": 1, "count": 1}
+    {"Result":"Ok"}
+stream frames come one by one with "more" in header, header without "more" ends stream
+    {"seq": 3, "count": 1, "more": 1}
+    {"Encoder":0}
+    {"seq": 3, "count": 0}
+send is answered with header only when data is written, jig reply is not waited for
+    {"seq": 4, "count": 0}
+invalid or failed request is answered with error
+    {"seq": 4, "count": 0, "error": "no seq in request"}
+info is answered with served port
+    {"info": 1, "count": 0, "port_id": "/dev/ttyS0"}
+and broker broadcasts unsolicited jig events to subscribed clients
+    {"event": 1, "count": 1}
+    {"Buttons":"Changed","KeyFunc":0}
+"""
+
+import argparse
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Union, List, Dict, Any, Optional, Iterable, Callable, Iterator
+
+import serial
+
+import json_serial
+from json_serial import JsonSerialPort, JsonResponse, PendingRequest, Subscription
+
+# per-user runtime directory is not accessible by other users, unlike /tmp
+DEFAULT_SOCKET = os.environ.get("JSON_SERIAL_BROKER", os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()), "json_serial_broker.sock"))
+NULL = b'null'
+QUEUED_OPS = ("request", "submit", "stream", "send")
+
+
+def check_message(message: Any) -> str:
+    """
+    validates client message
+    :param message: decoded message
+    :return: error text, empty if message is valid
+    """
+    if not isinstance(message, dict):
+        return "request is not json object"
+    op = message.get("op")
+    if op in ("subscribe", "unsubscribe", "info"):
+        return ""
+    if op not in QUEUED_OPS:
+        return "unknown op %r" % op
+    if not isinstance(message.get("seq"), int):
+        return "no seq in request"
+    if not isinstance(message.get("data", dict()), dict):
+        return "data is not json object"
+    count = message.get("count", 1)
+    if not isinstance(count, int) or count < 1:
+        return "count must be positive integer"
+    for name in ("timeout", "idle_timeout"):
+        value = message.get(name)
+        if value is not None and (not isinstance(value, (int, float)) or value < 0):
+            return "%s must be non-negative number" % name
+    max_items = message.get("max_items")
+    if max_items is not None and (not isinstance(max_items, int) or max_items < 1):
+        return "max_items must be positive integer"
+    return ""
+
+
+class _Client:
+    """
+    connected client: socket, queued requests and event subscription flag
+    """
+
+    def __init__(self, sock: socket.socket, number: int):
+        self.sock = sock
+        self.number = number
+        self.requests = deque()
+        self.events = False
+        self.closed = False
+        self.send_lock = threading.Lock()
+
+    def send(self, header: Dict[str, Any], frames: Iterable[Optional[bytes]]) -> bool:
+        """
+        sends header and raw frames
+        :param header: header dict
+        :param frames: raw jig frames, None for missing frame
+        :return: False if client is gone
+        """
+        data = json_serial.dicttobyte(header) + b''.join((NULL if frame is None else frame) + b'\n'
+                                                         for frame in frames)
+        with self.send_lock:
+            if self.closed:
+                return False
+            try:
+                self.sock.sendall(data)
+                return True
+            except OSError:
+                self.closed = True
+                return False
+
+
+class SerialBroker:
+    """
+    owns JsonSerialPort, executes requests of connected clients one by one in round robin order,
+    optionally pipelines "submit" requests with ids, broadcasts jig events to subscribed clients
+    """
+
+    def __init__(self, port: JsonSerialPort, path: str = DEFAULT_SOCKET, pipeline_depth: int = 0,
+                 send_timeout: float = 1, mode: int = 0o600):
+        """
+        :param port: jig port, it is kept open while broker is running
+        :param path: Unix domain socket path
+        :param pipeline_depth: max number of submitted requests in flight, 0 to serialize them as well
+        :param send_timeout: slow client is disconnected if it does not read for this time in s
+        :param mode: socket file permissions, only owner may connect by default
+        """
+        self.port = port
+        self.path = path
+        self.mode = mode
+        self.pipeline_depth = pipeline_depth
+        self.send_timeout = send_timeout
+        self.error = ""
+        self.clients: List[_Client] = list()
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.in_flight = deque()
+        self.slots = threading.Semaphore(max(pipeline_depth, 1))
+        self.served = 0
+        self._numbers = 0
+        self._server: Optional[socket.socket] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = list()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        opens port, starts port reader and binds socket, fails if other broker listens on socket
+        :return:
+        """
+        self.error = ""
+        if is_listening(self.path):
+            self.error = "Serial broker is already running on %s" % self.path
+            print(self.error)
+            return
+        if os.path.exists(self.path):
+            # socket of broker which was killed
+            os.unlink(self.path)
+        self._stop.clear()
+        self.port.persistent = True
+        self.port.start_reader()
+        if self.port.error:
+            self.error = self.port.error
+            print(self.error)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # socket file is created without access for others, there is no window before chmod
+        umask = os.umask(0o177)
+        try:
+            self._server.bind(self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, self.mode)
+        self._server.listen()
+        self._server.settimeout(0.1)
+        for target, name in ((self._accept_loop, "accept"), (self._worker_loop, "worker"),
+                             (self._event_loop, "events"), (self._completion_loop, "completion")):
+            thread = threading.Thread(target=target, name="broker %s" % name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        disconnects clients, removes socket and closes port
+        :return:
+        """
+        self._stop.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = list()
+        for client in list(self.clients):
+            self._drop(client)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        self.port.close()
+
+    def serve_forever(self):
+        """
+        runs broker until KeyboardInterrupt
+        :return:
+        """
+        self.start()
+        if self._server is None:
+            return
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                sock, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            sock.settimeout(self.send_timeout)
+            self._numbers += 1
+            client = _Client(sock, self._numbers)
+            with self.condition:
+                self.clients.append(client)
+            threading.Thread(target=self._client_loop, args=(client,), name="broker client %d" % client.number,
+                             daemon=True).start()
+
+    def _client_loop(self, client: _Client):
+        """
+        reads requests of one client and queues them for worker
+        :param client: connected client
+        :return:
+        """
+        buf = b''
+        while not self._stop.is_set() and not client.closed:
+            try:
+                chunk = client.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not chunk:
+                break
+            buf += chunk
+            *lines, buf = buf.split(b'\n')
+            for line in lines:
+                try:
+                    message = json_serial.decode(line)
+                except ValueError:
+                    continue
+                error = check_message(message)
+                if error:
+                    seq = message.get("seq") if isinstance(message, dict) else None
+                    client.send({"seq": seq, "count": 0, "error": error}, [])
+                    continue
+                op = message.get("op")
+                if op == "subscribe":
+                    client.events = True
+                elif op == "unsubscribe":
+                    client.events = False
+                elif op == "info":
+                    client.send({"info": 1, "count": 0, "port_id": self.port.port_id}, [])
+                else:
+                    with self.condition:
+                        if not client.requests:
+                            self.ready.append(client)
+                        client.requests.append(message)
+                        self.condition.notify()
+        self._drop(client)
+
+    def _drop(self, client: _Client):
+        with self.condition:
+            client.closed = True
+            client.requests.clear()
+            if client in self.clients:
+                self.clients.remove(client)
+            if client in self.ready:
+                self.ready.remove(client)
+        try:
+            client.sock.close()
+        except OSError:
+            pass
+
+    def _next_request(self) -> Optional[tuple]:
+        """
+        takes one request of the next client in round robin order
+        :return: (client, request) or None when broker is stopped
+        """
+        with self.condition:
+            while not self.ready:
+                if self._stop.is_set():
+                    return None
+                self.condition.wait(0.1)
+            client = self.ready.popleft()
+            message = client.requests.popleft()
+            if client.requests:
+                self.ready.append(client)
+            return client, message
+
+    def _worker_loop(self):
+        while True:
+            item = self._next_request()
+            if item is None:
+                return
+            client, message = item
+            try:
+                self._serve(client, message)
+            except Exception as e:
+                # one bad request must not stop worker for all clients
+                self.error = "request %s failed: %r" % (message.get("seq"), e)
+                print(self.error)
+                client.send({"seq": message.get("seq"), "count": 0, "error": self.error}, [])
+
+    def _serve(self, client: _Client, message: Dict[str, Any]):
+        """
+        executes one validated request of client
+        :param client: client
+        :param message: request message
+        :return:
+        """
+        data = message.get("data", dict())
+        timeout = message.get("timeout")
+        seq = message["seq"]
+        if message["op"] == "send":
+            if not self.port.send(data):
+                raise serial.SerialException(self.port.error)
+            self.served += 1
+            client.send({"seq": seq, "count": 0}, [])
+            return
+        if message["op"] == "stream":
+            for response in self.port.stream(data, None, message.get("max_items"), message.get("idle_timeout", 1),
+                                             timeout):
+                if not client.send({"seq": seq, "count": 1, "more": 1}, [response.raw]):
+                    break
+            self.served += 1
+            client.send({"seq": seq, "count": 0}, [])
+            return
+        if message["op"] == "submit" and self.pipeline_depth:
+            self.slots.acquire()
+            try:
+                pending = self.port.submit(data, json_serial.DEFAULT_TIMEOUT if timeout is None else timeout)
+            except BaseException:
+                self.slots.release()
+                raise
+            with self.condition:
+                self.in_flight.append((client, seq, pending))
+                self.condition.notify_all()
+            return
+        count = message.get("count", 1)
+        if count == 1:
+            responses = [self.port.request(data, timeout)]
+        else:
+            responses = self.port.several_responses(data, count,
+                                                    json_serial.DEFAULT_TIMEOUT if timeout is None else timeout)
+        self.served += 1
+        client.send({"seq": seq, "count": count},
+                    [None if response is None else response.raw for response in responses] +
+                    [None] * (count - len(responses)))
+
+    def _completion_loop(self):
+        """
+        sends replies of pipelined requests in order of submission
+        :return:
+        """
+        while True:
+            with self.condition:
+                while not self.in_flight:
+                    if self._stop.is_set():
+                        return
+                    self.condition.wait(0.1)
+                client, seq, pending = self.in_flight.popleft()
+            response = pending.result()
+            self.slots.release()
+            self.served += 1
+            # reply is matched to client request by seq, id added by broker is left in frame
+            client.send({"seq": seq, "count": 1}, [None if response is None else response.raw])
+
+    def _event_loop(self):
+        subscription = self.port.subscribe(predicate=self.port.is_event, maxsize=1000)
+        try:
+            while not self._stop.is_set():
+                response = subscription.get(0.1)
+                if response is None:
+                    continue
+                for client in list(self.clients):
+                    if client.events:
+                        client.send({"event": 1, "count": 1}, [response.raw])
+        finally:
+            self.port.unsubscribe(subscription)
+
+
+class BrokerPort(JsonSerialPort):
+    """
+    JsonSerialPort compatible client of SerialBroker: request, several_cycles, full_one_cycle_with_key, get_many,
+    submit, pipeline, send, stream, subscribe and iter_json work through broker, connection is kept open between cycles
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, timeout: float = 0.5, event_keys: Iterable[str] = ("Buttons",),
+                 id_key: str = "Id"):
+        """
+        :param path: broker socket path
+        :param timeout: connection timeout in s
+        :param event_keys: keys of unsolicited jig events
+        :param id_key: key of request id, see JsonSerialPort.submit
+        """
+        super().__init__("broker:%s" % path, timeout=timeout, persistent=True, event_keys=event_keys,
+                         id_key=id_key)
+        self.path = path
+        self.sock: Optional[socket.socket] = None
+        self._events = False
+        self._send_lock = threading.Lock()
+        # seq -> queue of streamed jsons, None ends stream
+        self._streams: Dict[int, queue.Queue] = dict()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        checks if broker is connected
+        :return:
+        """
+        return self.sock is not None
+
+    @property
+    def reader_running(self) -> bool:
+        # replies and events always come from connection reader, subscriptions are served by it
+        return self.sock is not None
+
+    def open(self):
+        """
+        connects to broker
+        :return:
+        """
+        self.error = ""
+        self.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            self.error = "Broker connection error"
+            return
+        sock.settimeout(None)
+        self.sock = sock
+        self._events = False
+        self._reader = threading.Thread(target=self._reader_loop, args=(sock,), name="broker reader", daemon=True)
+        self._reader.start()
+
+    def close(self):
+        """
+        disconnects from broker, pending requests get no reply
+        :return:
+        """
+        self.error = ""
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join()
+        self._reader = None
+        self._fail_requests()
+
+    def start_reader(self):
+        self.ensure_open()
+
+    def stop_reader(self):
+        pass
+
+    def _fail_requests(self):
+        requests, self._requests = self._requests, dict()
+        for pending in requests.values():
+            if not pending.future.done():
+                pending.future.set_exception(serial.SerialException("broker connection is closed"))
+        for stream in list(self._streams.values()):
+            stream.put(None)
+
+    def _reader_loop(self, sock: socket.socket):
+        """
+        connection reader thread: resolves requests by seq and dispatches events to subscriptions
+        :param sock: connection
+        :return:
+        """
+        try:
+            with sock.makefile('rb') as lines:
+                self._read_headers(lines)
+        except (OSError, ValueError, StopIteration):
+            pass
+        if self.sock is sock:
+            self.error = "Broker connection is lost"
+            self.sock = None
+            sock.close()
+        self._fail_requests()
+
+    def _read_headers(self, lines: Iterator[bytes]):
+        """
+        reads broker messages until connection is closed
+        :param lines: connection file
+        :return:
+        """
+        for line in lines:
+            header = json_serial.decode(line)
+            frames = [next(lines) for i in range(header.get("count", 0))]
+            responses = [JsonResponse.parse(frame.rstrip(b'\n')) for frame in frames]
+            if "event" in header:
+                for response in responses:
+                    if response is not None:
+                        for subscription in self.subscriptions:
+                            if subscription.predicate(response):
+                                subscription.put(response)
+                continue
+            stream = self._streams.get(header.get("seq"))
+            if stream is not None:
+                for response in responses:
+                    stream.put(response)
+                if not header.get("more"):
+                    if "error" in header:
+                        self.error = header["error"]
+                    stream.put(None)
+                continue
+            pending = self._requests.pop(header.get("seq"), None)
+            if pending is None or pending.future.cancelled():
+                continue
+            if "error" in header:
+                pending.future.set_exception(serial.SerialException(header["error"]))
+            else:
+                pending.future.set_result(responses)
+
+    def _send(self, message: Dict[str, Any]) -> bool:
+        """
+        sends one message to broker
+        :param message: message dict
+        :return: False on error
+        """
+        self.ensure_open()
+        if self.error:
+            return False
+        try:
+            with self._send_lock:
+                self.sock.sendall(json_serial.dicttobyte(message))
+        except (OSError, AttributeError):
+            self.error = "Cannot write data\n"
+            return False
+        return True
+
+    def _call(self, op: str, data: Dict[str, Any], count: int, timeout: float) -> PendingRequest:
+        """
+        sends request to broker
+        :param op: request or submit
+        :param data: data dict for jig
+        :param count: number of jsons to get
+        :param timeout: time for json waiting in s
+        :return: pending request resolved with list of responses
+        """
+        self._sending(data)
+        # connection is made before request is registered, reconnect fails requests of old connection
+        self.ensure_open()
+        # broker may wait for other clients' requests, deadline is checked by broker for jig replies
+        pending = PendingRequest(self, next(self._ids), timeout * count + 5)
+        self._requests[pending.request_id] = pending
+        message = {"op": op, "seq": pending.request_id, "data": data, "count": count, "timeout": timeout}
+        if not self._send(message):
+            self.forget_request(pending.request_id)
+            pending.future.set_exception(serial.SerialException(self.error))
+        return pending
+
+    def _exchange(self, data: Dict[str, Any], count: int, timeout: float) -> List[Optional[JsonResponse]]:
+        """
+        sends data to broker and gets count number of json responses
+        :param data: data dict to send
+        :param count: number of jsons to get
+        :param timeout: time for json waiting
+        :return:
+        """
+        self._written = time.monotonic()
+        pending = self._call("request", data, count, timeout)
+        res = pending.result()
+        if res is None:
+            error = pending.future.exception() if pending.future.done() else None
+            self.error = str(error) if error is not None else self.error or "no json found"
+            print(self.error)
+            return [None] * count
+        if self.metrics is not None and res and res[0] is not None:
+            self._first_byte = res[0].timestamp
+        for response in res:
+            if response is None:
+                self.error = "no json found"
+                print(self.error)
+        return res
+
+    def submit(self, data: Dict[str, Any], timeout: float = 1) -> PendingRequest:
+        """
+        sends request to broker without waiting for reply, broker pipelines it if it is configured so
+        :param data: data dict to send
+        :param timeout: time for reply waiting in s
+        :return: pending request to get reply from
+        """
+        pending = PendingRequest(self, next(self._ids), timeout)
+        call = self._call("submit", data, 1, timeout)
+
+        def resolve(future: Future):
+            if pending.future.cancelled():
+                return
+            try:
+                pending.future.set_result(future.result()[0])
+            except Exception as e:
+                pending.future.set_exception(e)
+
+        call.future.add_done_callback(resolve)
+        return pending
+
+    def send(self, data: Dict[str, Any]) -> bool:
+        """
+        sends data through broker without waiting for jig reply, waits only until broker has written it
+        :param data: data dict to send
+        :return: False on error
+        """
+        pending = self._call("send", data, 1, json_serial.DEFAULT_TIMEOUT)
+        if pending.result() is None:
+            error = pending.future.exception() if pending.future.done() else None
+            self.error = str(error) if error is not None else self.error or "no reply from broker"
+            print(self.error)
+            return False
+        return True
+
+    def subscribe(self, key: str = None, predicate: Callable[[JsonResponse], bool] = None,
+                  maxsize: int = 100) -> Subscription:
+        """
+        subscribes to jig events broadcast by broker
+        :param key: get jsons with this key (case insensitive)
+        :param predicate: get jsons for which predicate is True
+        :param maxsize: max number of queued jsons
+        :return: subscription to get jsons from
+        """
+        subscription = super().subscribe(key, predicate, maxsize)
+        if not self._events and self._send({"op": "subscribe"}):
+            self._events = True
+        return subscription
+
+    def write(self, data: Union[bytes, str], encode: bool = True, eol: bool = True):
+        """
+        raw writes are not shared through broker, use request methods
+        """
+        self.error = "raw write is not supported by broker client"
+        print(self.error)
+
+    def stream(self, data: Dict[str, Any], until: Callable[[JsonResponse], bool] = None, max_items: int = None,
+               idle_timeout: float = 1, timeout: float = None) -> Iterator[JsonResponse]:
+        """
+        sends data and yields jsons as broker forwards them, see iter_json for stop conditions
+        :param data: data dict to send
+        :param until: stop after json for which until is True
+        :param max_items: stop after this number of jsons
+        :param idle_timeout: stop if there is no json during this time in s
+        :param timeout: stop after this time in s from start
+        :return:
+        """
+        self.error = ""
+        self._sending(data)
+        seq = next(self._ids)
+        stream: queue.Queue = queue.Queue()
+        self._streams[seq] = stream
+        try:
+            if not self._send({"op": "stream", "seq": seq, "data": data, "max_items": max_items,
+                               "idle_timeout": idle_timeout, "timeout": timeout}):
+                print(self.error)
+                return
+            while True:
+                try:
+                    # broker ends stream by idle_timeout, margin covers other clients' requests before this one
+                    response = stream.get(timeout=idle_timeout + 5 if timeout is None else timeout + 5)
+                except queue.Empty:
+                    self.error = "no json found"
+                    return
+                if response is None:
+                    if self.error:
+                        print(self.error)
+                    return
+                yield response
+                if until is not None and until(response):
+                    return
+        finally:
+            self._streams.pop(seq, None)
+
+
+def is_listening(path: str) -> bool:
+    """
+    checks if some process accepts connections on socket, stale socket file of killed broker refuses them
+    :param path: broker socket path
+    :return:
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def served_port(path: str = DEFAULT_SOCKET, timeout: float = 1) -> Optional[str]:
+    """
+    asks broker which jig port it serves
+    :param path: broker socket path
+    :param timeout: connection timeout in s
+    :return: port id or None if broker is not running
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json_serial.dicttobyte({"op": "info"}))
+            with sock.makefile('rb') as lines:
+                for line in lines:
+                    header = json_serial.decode(line)
+                    if "info" in header:
+                        return header.get("port_id")
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def serves(path: str, port_id: str) -> bool:
+    """
+    checks if broker serves given jig port, so clients of other ports do not share its jig
+    :param path: broker socket path
+    :param port_id: serial port name
+    :return:
+    """
+    served = served_port(path)
+    return served is not None and os.path.realpath(served) == os.path.realpath(port_id)
+
+
+def connect(path: str = DEFAULT_SOCKET) -> Optional[BrokerPort]:
+    """
+    connects to running broker
+    :param path: broker socket path
+    :return: connected client or None if broker is not running
+    """
+    port = BrokerPort(path)
+    port.open()
+    if port.error:
+        return None
+    return port
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="shares jig serial port between processes")
+    parser.add_argument('--port', default=json_serial.DEFAULT_PORT, help="jig serial port")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix domain socket path")
+    parser.add_argument('--pipeline', type=int, default=0,
+                        help="max number of submitted requests in flight, jig must echo request id")
+    args = parser.parse_args(args)
+    port = JsonSerialPort(args.port, args.baudrate, persistent=True)
+    broker = SerialBroker(port, args.socket, args.pipeline)
+    print("serial broker for %s on %s" % (args.port, args.socket))
+    broker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
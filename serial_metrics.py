@@ -0,0 +1,173 @@
+"""
+counters and latency histograms for JsonSerialPort, export to Prometheus text file or json
+"""
+
+import json
+import os
+import threading
+from typing import List, Dict, Any, Tuple, Optional
+
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float('inf'))
+
+
+class Histogram:
+    """
+    cumulative histogram with fixed buckets in s
+    """
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        adds one value
+        :param value: value in s
+        :return:
+        """
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+
+    def cumulative(self) -> List[int]:
+        """
+        gets counts of values less or equal to every bucket bound
+        :return:
+        """
+        res = list()
+        running = 0
+        for count in self.counts:
+            running += count
+            res.append(running)
+        return res
+
+
+class SerialMetrics:
+    """
+    per command timings (open, write, first byte, frame complete) and port counters.
+    assign to JsonSerialPort.metrics to enable, port does nothing extra while it is None
+    """
+
+    def __init__(self, prefix: str = "json_serial"):
+        """
+        :param prefix: prefix for exported metric names
+        """
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], int] = dict()
+        self.histograms: Dict[Tuple[str, str], Histogram] = dict()
+
+    def count(self, name: str, value: int = 1, cmd: str = ""):
+        """
+        adds value to counter
+        :param name: counter name, e.g. timeouts, decode_errors, bytes_in, bytes_out
+        :param value: value to add
+        :param cmd: command name label
+        :return:
+        """
+        with self.lock:
+            self.counters[(name, cmd)] = self.counters.get((name, cmd), 0) + value
+
+    def observe(self, stage: str, cmd: str, value: float):
+        """
+        adds duration to stage histogram
+        :param stage: stage name
+        :param cmd: command name
+        :param value: duration in s
+        :return:
+        """
+        with self.lock:
+            histogram = self.histograms.get((stage, cmd))
+            if histogram is None:
+                histogram = self.histograms[(stage, cmd)] = Histogram()
+            histogram.observe(value)
+
+    def command(self, cmd: str, start: float, opened: float, written: float, first_byte: Optional[float],
+                frame: Optional[float], end: float):
+        """
+        records timestamps of one command, missing first byte or frame means timeout
+        :param cmd: command name
+        :param start: cycle start
+        :param opened: port is open
+        :param written: request is written
+        :param first_byte: first byte of reply is received
+        :param frame: reply json is complete
+        :param end: cycle end
+        :return:
+        """
+        self.count("commands", 1, cmd)
+        self.observe("open", cmd, opened - start)
+        self.observe("write", cmd, written - opened)
+        if first_byte is not None:
+            self.observe("first_byte", cmd, max(first_byte - written, 0))
+        if frame is not None:
+            self.observe("frame", cmd, max(frame - written, 0))
+        else:
+            self.count("timeouts", 1, cmd)
+        self.observe("total", cmd, end - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        gets all metrics as json compatible dict
+        :return:
+        """
+        with self.lock:
+            counters = [{"name": name, "cmd": cmd, "value": value} for (name, cmd), value in self.counters.items()]
+            histograms = [{"stage": stage, "cmd": cmd, "count": h.count, "sum": h.total,
+                           "buckets": dict(zip((str(b) for b in BUCKETS), h.cumulative()))}
+                          for (stage, cmd), h in self.histograms.items()]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """
+        gets all metrics in Prometheus text exposition format
+        :return:
+        """
+        lines = list()
+        with self.lock:
+            names = sorted({name for name, cmd in self.counters})
+            for name in names:
+                lines.append("# TYPE %s_%s_total counter" % (self.prefix, name))
+                for (counter, cmd), value in sorted(self.counters.items()):
+                    if counter == name:
+                        labels = '{cmd="%s"}' % cmd if cmd else ''
+                        lines.append('%s_%s_total%s %d' % (self.prefix, name, labels, value))
+            if self.histograms:
+                metric = "%s_stage_seconds" % self.prefix
+                lines.append("# TYPE %s histogram" % metric)
+                for (stage, cmd), h in sorted(self.histograms.items()):
+                    labels = 'stage="%s",cmd="%s"' % (stage, cmd)
+                    for bound, count in zip(BUCKETS, h.cumulative()):
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, le, count))
+                    lines.append('%s_sum{%s} %f' % (metric, labels, h.total))
+                    lines.append('%s_count{%s} %d' % (metric, labels, h.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """
+        writes metrics to Prometheus textfile collector file atomically
+        :param path: file path, usually *.prom
+        :return:
+        """
+        self._write(path, self.to_prometheus())
+
+    def write_json(self, path: str):
+        """
+        writes metrics snapshot to json file atomically
+        :param path: file path
+        :return:
+        """
+        self._write(path, json.dumps(self.snapshot(), indent=2))
+
+    @staticmethod
+    def _write(path: str, text: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
@@ -0,0 +1,313 @@
+"""
+append-only serial traffic recorder on memory-mapped ring file and replay of recorded sessions
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import List, Iterator, Tuple, Union, Optional
+
+import json_serial
+
+MAGIC = b'JSRC'
+VERSION = 1
+# magic, version, capacity, head, tail, number of records
+HEADER = struct.Struct('<4sHxxQQQQ')
+# monotonic timestamp, direction, length
+RECORD = struct.Struct('<dBI')
+TX = 0
+RX = 1
+WRAP = 0xFF
+
+Record = Tuple[float, int, bytes]
+
+
+class SerialRecorder:
+    """
+    writes every TX/RX chunk with monotonic timestamp to ring file, the oldest records are overwritten when it is full.
+    assign to JsonSerialPort.recorder to enable
+    """
+
+    def __init__(self, path: str, capacity: int = 4 * 1024 * 1024):
+        """
+        :param path: ring file path, existing file with the same capacity is continued
+        :param capacity: size of records area in bytes
+        """
+        self.path = path
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        size = HEADER.size + capacity
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        existing = os.path.getsize(path)
+        if existing != size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        magic, version, stored_capacity, head, tail, records = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or stored_capacity != capacity:
+            head = tail = records = 0
+        self.head = head
+        self.tail = tail
+        self.records = records
+        self._store_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _store_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.capacity, self.head, self.tail, self.records)
+
+    def _consume(self):
+        """
+        drops the oldest record
+        :return:
+        """
+        if self.capacity - self.tail < RECORD.size:
+            self.tail = 0
+            return
+        ts, direction, length = RECORD.unpack_from(self.map, HEADER.size + self.tail)
+        if direction == WRAP:
+            self.tail = 0
+            return
+        self.tail += RECORD.size + length
+        self.records -= 1
+        if self.tail >= self.capacity:
+            self.tail = 0
+
+    def record(self, direction: int, data: Union[bytes, bytearray, memoryview], timestamp: float = None):
+        """
+        appends chunk
+        :param direction: TX or RX
+        :param data: chunk
+        :param timestamp: monotonic time, now if None
+        :return:
+        """
+        data = data[:self.capacity - RECORD.size]
+        need = RECORD.size + len(data)
+        ts = time.monotonic() if timestamp is None else timestamp
+        with self.lock:
+            if self.head + need > self.capacity:
+                # not enough space till the end: skip it and go on from the beginning
+                while self.records and self.tail >= self.head:
+                    self._consume()
+                if self.capacity - self.head >= RECORD.size:
+                    RECORD.pack_into(self.map, HEADER.size + self.head, 0.0, WRAP, 0)
+                self.head = 0
+            while self.records and self.head <= self.tail < self.head + need:
+                self._consume()
+            if not self.records:
+                self.tail = self.head
+            offset = HEADER.size + self.head
+            RECORD.pack_into(self.map, offset, ts, direction, len(data))
+            self.map[offset + RECORD.size:offset + need] = data
+            self.head += need
+            self.records += 1
+            self._store_header()
+
+    def tx(self, data: Union[bytes, bytearray, memoryview]):
+        """
+        appends written chunk
+        :param data: chunk
+        :return:
+        """
+        self.record(TX, data)
+
+    def rx(self, data: Union[bytes, bytearray, memoryview]):
+        """
+        appends received chunk
+        :param data: chunk
+        :return:
+        """
+        self.record(RX, data)
+
+    def flush(self):
+        """
+        flushes mapped file to disk
+        :return:
+        """
+        self.map.flush()
+
+    def close(self):
+        """
+        flushes and closes ring file
+        :return:
+        """
+        if self.map.closed:
+            return
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """
+    reads records of ring file from the oldest one
+    :param path: ring file path
+    :return: (monotonic timestamp, direction, data)
+    """
+    with open(path, 'rb') as file:
+        buf = file.read()
+    magic, version, capacity, head, tail, records = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not serial recorder file" % path)
+    pos = tail
+    for i in range(records):
+        if capacity - pos < RECORD.size:
+            pos = 0
+        ts, direction, length = RECORD.unpack_from(buf, HEADER.size + pos)
+        if direction == WRAP:
+            pos = 0
+            ts, direction, length = RECORD.unpack_from(buf, HEADER.size + pos)
+        start = HEADER.size + pos + RECORD.size
+        yield ts, direction, buf[start:start + length]
+        pos += RECORD.size + length
+
+
+class ReplaySerial:
+    """
+    stand-in for serial.Serial which answers every write with RX chunks recorded after the same TX,
+    at original timing multiplied by speed or at once if speed is None
+    """
+
+    def __init__(self, records: List[Record], speed: Optional[float] = 1.0, timeout: float = 0.5):
+        """
+        :param records: recorded session
+        :param speed: replay speed factor, None for max speed
+        :param timeout: read timeout in s
+        """
+        self.records = records
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self.pos = 0
+        self.rx = bytearray()
+        self.scheduled: List[Tuple[float, bytes]] = list()
+        self.unmatched_writes = 0
+        self._schedule(time.monotonic(), self.records[0][0] if self.records else 0.0)
+
+    def _schedule(self, now: float, origin: float):
+        """
+        schedules RX records from current position till next TX
+        :param now: replay time of origin
+        :param origin: recorded time matching now
+        :return:
+        """
+        while self.pos < len(self.records) and self.records[self.pos][1] != TX:
+            ts, direction, data = self.records[self.pos]
+            due = now if self.speed is None else now + (ts - origin) / self.speed
+            self.scheduled.append((due, data))
+            self.pos += 1
+
+    def _pump(self) -> Optional[float]:
+        """
+        moves due chunks to input buffer
+        :return: time of next scheduled chunk or None
+        """
+        now = time.monotonic()
+        while self.scheduled and self.scheduled[0][0] <= now:
+            self.rx += self.scheduled.pop(0)[1]
+        return self.scheduled[0][0] if self.scheduled else None
+
+    @property
+    def in_waiting(self) -> int:
+        self._pump()
+        return len(self.rx)
+
+    def fileno(self):
+        raise NotImplementedError("replay has no file descriptor")
+
+    def write(self, data: bytes) -> int:
+        if self.pos < len(self.records) and self.records[self.pos][1] == TX:
+            origin = self.records[self.pos][0]
+            self.pos += 1
+            self._schedule(time.monotonic(), origin)
+        else:
+            self.unmatched_writes += 1
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            next_due = self._pump()
+            if self.rx or size == 0:
+                data = bytes(self.rx[:size])
+                del self.rx[:size]
+                return data
+            now = time.monotonic()
+            if now >= deadline:
+                return b""
+            time.sleep(max(min(deadline, next_due if next_due is not None else deadline) - now, 0))
+
+    def readinto(self, view: memoryview) -> int:
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class ReplayPort(json_serial.JsonSerialPort):
+    """
+    JsonSerialPort on recorded session: test phases and framer run on recorded replies without jig
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0, **kwargs):
+        """
+        :param path: ring file path
+        :param speed: replay speed factor, None for max speed
+        :param kwargs: JsonSerialPort arguments
+        """
+        kwargs.setdefault("persistent", True)
+        super().__init__("replay:%s" % path, **kwargs)
+        self.records = list(read_records(path))
+        self.speed = speed
+
+    def open(self):
+        """
+        starts replay from the beginning of the session
+        :return:
+        """
+        self.error = ""
+        self.ser = ReplaySerial(self.records, self.speed, self.timeout)
+
+
+def replay_frames(path: str, speed: Optional[float] = None) -> Iterator[Tuple[int, json_serial.JsonResponse]]:
+    """
+    feeds recorded chunks through framer
+    :param path: ring file path
+    :param speed: replay speed factor, None for max speed
+    :return: (direction, json) for every complete json
+    """
+    framers = {TX: json_serial.JsonFramer(), RX: json_serial.JsonFramer()}
+    start = time.monotonic()
+    origin = None
+    for ts, direction, data in read_records(path):
+        if origin is None:
+            origin = ts
+        if speed is not None:
+            delay = start + (ts - origin) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        for frame in framers[direction].feed(data):
+            response = json_serial.JsonResponse.parse(frame)
+            if response is not None:
+                yield direction, response
+
+
+# simple test
+if __name__ == "__main__":
+    import sys
+
+    for direction, response in replay_frames(sys.argv[1]):
+        print("TX" if direction == TX else "RX", response.text)
@@ -0,0 +1,343 @@
+"""
+multi-slot test station: every slot (jig) has its own serial port, GPIO pins and DUT id and runs its test plan
+in separate process, station-wide resources (audio card, camera) are used by one slot at a time
+"""
+
+import contextlib
+import json
+import multiprocessing
+import queue
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Callable, Iterable, Optional
+
+import json_serial
+
+# pins of the single jig station: yellow, red and green LEDs and start button
+DEFAULT_GPIO = {"yellow": 25, "red": 24, "green": 22, "button": 27}
+DEFAULT_RESOURCES = ("audio", "camera")
+
+
+class Slot:
+    """
+    one jig of the station
+    """
+
+    def __init__(self, name: str, port_id: str = json_serial.DEFAULT_PORT, gpio: Dict[str, int] = None,
+                 dut_id: str = None):
+        """
+        :param name: slot name for reports
+        :param port_id: jig serial port
+        :param gpio: pin numbers by function, DEFAULT_GPIO if None
+        :param dut_id: DUT id, generated by test plan if None
+        """
+        self.name = name
+        self.port_id = port_id
+        self.gpio = dict(DEFAULT_GPIO if gpio is None else gpio)
+        self.dut_id = dut_id
+
+    def __repr__(self):
+        return 'Slot(%s, %s)' % (self.name, self.port_id)
+
+
+def load_slots(path: str) -> List[Slot]:
+    """
+    reads slots from json file: [{"name": "A", "port_id": "/dev/ttyUSB0", "gpio": {"yellow": 25, ...}}, ...]
+    :param path: file path
+    :return:
+    """
+    with open(path) as file:
+        return [Slot(**item) for item in json.load(file)]
+
+
+# state of slot worker process, set by pool initializer and _run_slot
+_resources: Dict[str, Any] = dict()
+_results = None
+_slot: Optional[Slot] = None
+
+
+def _init_worker(resources: Dict[str, Any], results):
+    global _resources, _results
+    _resources = resources
+    _results = results
+
+
+def current_slot() -> Optional[Slot]:
+    """
+    gets slot of current worker process
+    :return: slot or None outside station
+    """
+    return _slot
+
+
+@contextlib.contextmanager
+def resource(name: str):
+    """
+    holds station-wide resource while slot uses it, other slots wait. does nothing outside station
+    :param name: resource name, e.g. audio or camera
+    :return:
+    """
+    lock = _resources.get(name)
+    if lock is None:
+        yield
+        return
+    start = time.monotonic()
+    with lock:
+        if _results is not None:
+            _results.put({"slot": _slot.name, "resource": name, "wait": time.monotonic() - start})
+        yield
+
+
+def report(dut_id: str, outcome: str, start: float, end: float):
+    """
+    reports finished DUT test of current slot to station
+    :param dut_id: DUT id
+    :param outcome: PASS, FAIL, ERROR...
+    :param start: start time in s
+    :param end: end time in s
+    :return:
+    """
+    if _results is None:
+        return
+    _results.put({"slot": _slot.name, "dut_id": dut_id, "outcome": outcome, "start": start, "end": end})
+
+
+def record_callback(record):
+    """
+    openhtf output callback which reports test record to station
+    :param record: openhtf test record
+    :return:
+    """
+    report(record.dut_id, getattr(record.outcome, 'name', str(record.outcome)),
+           record.start_time_millis / 1000, record.end_time_millis / 1000)
+
+
+def _run_slot(test: Callable[[Slot], Any], slot: Slot) -> Any:
+    global _slot
+    _slot = slot
+    return test(slot)
+
+
+class SlotStats:
+    """
+    results and cycle times of one slot
+    """
+
+    def __init__(self, slot: Slot):
+        self.slot = slot
+        self.outcomes: Dict[str, int] = dict()
+        self.durations: List[float] = list()
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+        self.resource_wait = 0.0
+        self.error = ""
+
+    def add(self, result: Dict[str, Any]):
+        """
+        adds result reported by slot process
+        :param result: DUT result or resource wait
+        :return:
+        """
+        if "resource" in result:
+            self.resource_wait += result["wait"]
+            return
+        self.outcomes[result["outcome"]] = self.outcomes.get(result["outcome"], 0) + 1
+        self.durations.append(result["end"] - result["start"])
+        if self.first_start is None or result["start"] < self.first_start:
+            self.first_start = result["start"]
+        if self.last_end is None or result["end"] > self.last_end:
+            self.last_end = result["end"]
+
+    @property
+    def count(self) -> int:
+        return len(self.durations)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        gets slot statistics
+        :return:
+        """
+        res = {"slot": self.slot.name, "port_id": self.slot.port_id, "count": self.count,
+               "outcomes": dict(self.outcomes), "resource_wait_s": self.resource_wait}
+        if self.durations:
+            res.update({"cycle_mean_s": statistics.mean(self.durations), "cycle_min_s": min(self.durations),
+                        "cycle_max_s": max(self.durations)})
+        if self.error:
+            res["error"] = self.error
+        return res
+
+
+class CycleStats:
+    """
+    per DUT cycle time, idle time between DUTs and throughput of continuous test plan run.
+    keeps only recent cycle times, test records are not stored
+    """
+
+    def __init__(self, name: str = "", window: int = 100, verbose: bool = True):
+        """
+        :param name: plan name for printed lines
+        :param window: number of recent cycles for rolling statistics
+        :param verbose: print line for every DUT
+        """
+        self.name = name
+        self.verbose = verbose
+        self.cycles = deque(maxlen=window)
+        self.idles = deque(maxlen=window)
+        self.outcomes: Dict[str, int] = dict()
+        self.count = 0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+        self.busy = 0.0
+
+    def add(self, dut_id: str, outcome: str, start: float, end: float):
+        """
+        adds finished DUT test
+        :param dut_id: DUT id
+        :param outcome: PASS, FAIL, ERROR...
+        :param start: start time in s
+        :param end: end time in s
+        :return:
+        """
+        cycle = end - start
+        idle = start - self.last_end if self.last_end is not None else 0.0
+        self.count += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.cycles.append(cycle)
+        self.idles.append(max(idle, 0.0))
+        self.busy += cycle
+        if self.first_start is None:
+            self.first_start = start
+        self.last_end = end
+        if self.verbose:
+            print("%s DUT %s %s: cycle %.1f s, idle %.1f s, %.1f UPH" % (self.name, dut_id, outcome, cycle, idle,
+                                                                        self.uph))
+
+    def record(self, record):
+        """
+        openhtf output callback
+        :param record: openhtf test record
+        :return:
+        """
+        self.add(record.dut_id, getattr(record.outcome, 'name', str(record.outcome)),
+                 record.start_time_millis / 1000, record.end_time_millis / 1000)
+
+    @property
+    def uph(self) -> float:
+        """
+        units per hour over recent window: cycles and idle time between them
+        :return:
+        """
+        elapsed = sum(self.cycles) + sum(list(self.idles)[1:])
+        return len(self.cycles) / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        gets statistics since start and over recent window
+        :return:
+        """
+        res: Dict[str, Any] = {"name": self.name, "count": self.count, "outcomes": dict(self.outcomes),
+                               "uph": self.uph}
+        if self.cycles:
+            total = self.last_end - self.first_start
+            res.update({"cycle_mean_s": statistics.mean(self.cycles), "cycle_max_s": max(self.cycles),
+                        "idle_mean_s": statistics.mean(list(self.idles)[1:] or [0.0]),
+                        "utilization": self.busy / total if total > 0 else 1.0,
+                        "uph_total": self.count / total * 3600 if total > 0 else 0.0})
+        return res
+
+
+class Station:
+    """
+    runs test plan for every slot in process pool and collects per slot results
+    """
+
+    def __init__(self, slots: Iterable[Slot], resources: Iterable[str] = DEFAULT_RESOURCES):
+        """
+        :param slots: station slots
+        :param resources: names of station-wide resources used by one slot at a time
+        """
+        self.slots = list(slots)
+        self.resources = list(resources)
+        self.stats = {slot.name: SlotStats(slot) for slot in self.slots}
+        self.start = 0.0
+        self.end = 0.0
+
+    def _collect(self, results, timeout: float) -> bool:
+        try:
+            result = results.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        stats = self.stats[result["slot"]]
+        stats.add(result)
+        if "outcome" in result:
+            print("%s: DUT %s %s in %.1f s" % (result["slot"], result["dut_id"], result["outcome"],
+                                             result["end"] - result["start"]))
+        return True
+
+    def run(self, test: Callable[[Slot], Any]) -> Dict[str, Any]:
+        """
+        runs test(slot) for all slots in parallel until all of them finish
+        :param test: picklable function running test plan for slot, e.g. NewWorld.mic_board_test
+        :return: station summary
+        """
+        context = multiprocessing.get_context()
+        locks = {name: context.Lock() for name in self.resources}
+        results = context.Queue()
+        self.start = time.time()
+        with ProcessPoolExecutor(max_workers=len(self.slots), mp_context=context, initializer=_init_worker,
+                                 initargs=(locks, results)) as pool:
+            futures = {pool.submit(_run_slot, test, slot): slot for slot in self.slots}
+            while not all(future.done() for future in futures):
+                self._collect(results, 0.5)
+            for future, slot in futures.items():
+                error = future.exception()
+                if error is not None:
+                    self.stats[slot.name].error = repr(error)
+                    print("%s: %r" % (slot.name, error))
+        while self._collect(results, 0.1):
+            pass
+        self.end = time.time()
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        gets per slot statistics and station throughput
+        :return:
+        """
+        elapsed = max(self.end - self.start, 1e-9)
+        count = sum(stats.count for stats in self.stats.values())
+        return {"elapsed_s": elapsed, "count": count, "uph": count / elapsed * 3600,
+                "slots": [stats.summary() for stats in self.stats.values()]}
+
+    def report(self) -> str:
+        """
+        gets summary as text table
+        :return:
+        """
+        summary = self.summary()
+        lines = ["%-10s %-20s %6s %8s %8s  %s" % ("slot", "port", "DUTs", "mean s", "wait s", "outcomes")]
+        for slot in summary["slots"]:
+            outcomes = ', '.join('%s: %d' % item for item in sorted(slot["outcomes"].items()))
+            lines.append("%-10s %-20s %6d %8.1f %8.1f  %s" % (
+                slot["slot"], slot["port_id"], slot["count"], slot.get("cycle_mean_s", 0),
+                slot["resource_wait_s"], outcomes or slot.get("error", "")))
+        lines.append("%d DUTs in %.0f s, %.1f UPH" % (summary["count"], summary["elapsed_s"], summary["uph"]))
+        return "\n".join(lines)
+
+
+# simple test
+if __name__ == "__main__":
+    import random
+
+    def fake_test(slot: Slot):
+        for i in range(3):
+            start = time.time()
+            with resource("audio"):
+                time.sleep(random.uniform(0.05, 0.1))
+            report("%s-%d" % (slot.name, i), "PASS", start, time.time())
+
+    station = Station([Slot("A", "/dev/ttyUSB0"), Slot("B", "/dev/ttyUSB1")])
+    station.run(fake_test)
+    print(station.report())
@@ -0,0 +1,123 @@
+"""
+terminal summary of DUT test built from openhtf test record in memory and written at once
+"""
+
+import sys
+from typing import List, Any, Iterable, TextIO
+
+GREEN = 32
+RED = 31
+YELLOW = 33
+CYAN = 36
+# phases with these prefixes are shown as one group, e.g. all power rails
+GROUPS = (("Power circuit ", "Power measurements"),)
+# trigger phases, DUT id is shown in header instead
+SKIP = ("DUT ID", "Get DUT ID")
+MAX_VALUE = 24
+
+
+def paint(text: str, code: int, color: bool = True) -> str:
+    """
+    wraps text into bold ANSI color
+    :param text: text
+    :param code: ANSI color code
+    :param color: False to get plain text
+    :return:
+    """
+    return '\x1b[%d;1m%s\x1b[0m' % (code, text) if color else text
+
+
+def _name(outcome: Any) -> str:
+    return getattr(outcome, 'name', str(outcome))
+
+
+def outcome_color(outcome: Any) -> int:
+    """
+    gets color for phase or measurement outcome
+    :param outcome: openhtf outcome enum or its name
+    :return:
+    """
+    name = _name(outcome)
+    if name == 'PASS':
+        return GREEN
+    if name in ('FAIL', 'ERROR', 'TIMEOUT'):
+        return RED
+    return YELLOW
+
+
+def status(phases: Iterable[Any]) -> str:
+    """
+    gets overall status of finished phases
+    :param phases: openhtf phase records
+    :return: PASS, FAIL or NOT STARTED
+    """
+    outcomes = {_name(phase.outcome) for phase in phases}
+    if outcomes & {'FAIL', 'ERROR', 'TIMEOUT'}:
+        return 'FAIL'
+    if 'PASS' in outcomes:
+        return 'PASS'
+    return 'NOT STARTED'
+
+
+def phase_value(phase: Any) -> str:
+    """
+    gets short text for phase: measured value if it is short, otherwise outcome
+    :param phase: openhtf phase record
+    :return:
+    """
+    values = list()
+    for measurement in (phase.measurements or dict()).values():
+        measured = getattr(measurement, 'measured_value', None)
+        if measured is not None and getattr(measured, 'is_value_set', True):
+            values.append(getattr(measured, 'value', measured))
+    if len(values) == 1 and isinstance(values[0], (int, float, str)) and len(str(values[0])) <= MAX_VALUE:
+        return str(values[0])
+    return _name(phase.outcome).capitalize()
+
+
+def render(record: Any, title: str = "DUT Power Off", color: bool = True) -> str:
+    """
+    builds summary of all finished phases
+    :param record: openhtf test record (test.test_record inside phase)
+    :param title: first line
+    :param color: use ANSI colors
+    :return: summary text with trailing new line
+    """
+    phases = [phase for phase in record.phases if phase.name not in SKIP]
+    state = status(phases)
+    lines: List[str] = [paint(title, CYAN, color),
+                        paint("DUT ID:", CYAN, color) + " " + str(record.dut_id),
+                        paint("Test Status:", CYAN, color) + " " +
+                        paint(state, GREEN if state == 'PASS' else RED, color)]
+    width = max([len(phase.name) for phase in phases] + [0]) + 2
+    shown = set()
+    for phase in phases:
+        if phase.name in shown:
+            continue
+        group = next(((prefix, title) for prefix, title in GROUPS if phase.name.startswith(prefix)), None)
+        if group is None:
+            shown.add(phase.name)
+            lines.append(paint("- %-*s %s" % (width, phase.name + ":", phase_value(phase)),
+                               outcome_color(phase.outcome), color))
+            continue
+        prefix, group_title = group
+        members = [member for member in phases if member.name.startswith(prefix)]
+        shown.update(member.name for member in members)
+        lines.append(paint("- %s:" % group_title, GREEN if status(members) == 'PASS' else RED, color))
+        for member in members:
+            lines.append(paint("  - %-*s %s" % (width - 2, member.name[len(prefix):] + ":", phase_value(member)),
+                               outcome_color(member.outcome), color))
+    return "\n".join(lines) + "\n"
+
+
+def print_summary(record: Any, title: str = "DUT Power Off", stream: TextIO = None):
+    """
+    writes summary to terminal with one write
+    :param record: openhtf test record
+    :param title: first line
+    :param stream: output stream, stdout if None
+    :return:
+    """
+    stream = sys.stdout if stream is None else stream
+    stream.write(render(record, title))
+    stream.flush()
@@ -0,0 +1,358 @@
+"""
+in-process GPIO access through Linux sysfs: value files are kept open, LEDs are written without shell,
+buttons are waited for with edge interrupts and poll() instead of reading value in a loop
+"""
+
+import os
+import select
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterable, Optional
+
+SYSFS_ROOT = os.environ.get("GPIO_SYSFS_ROOT", "/sys/class/gpio")
+EDGES = ("none", "rising", "falling", "both")
+
+
+class Sysfs:
+    """
+    kernel gpio sysfs tree
+    """
+    # sysfs value file signals edge with POLLPRI
+    edge_events = select.POLLPRI | select.POLLERR
+
+    def __init__(self, root: str = SYSFS_ROOT, export_timeout: float = 1):
+        """
+        :param root: sysfs gpio directory
+        :param export_timeout: max time for pin attributes to appear after export in s
+        """
+        self.root = root
+        self.export_timeout = export_timeout
+
+    def path(self, number: int, name: str = None) -> str:
+        """
+        gets path of pin directory or pin attribute
+        :param number: pin number
+        :param name: attribute name, e.g. value, direction, edge
+        :return:
+        """
+        pin_dir = os.path.join(self.root, "gpio%d" % number)
+        return pin_dir if name is None else os.path.join(pin_dir, name)
+
+    @staticmethod
+    def write(path: str, text: str):
+        with open(path, 'w') as file:
+            file.write(text)
+
+    def is_exported(self, number: int) -> bool:
+        return os.path.exists(self.path(number, "value"))
+
+    def export(self, number: int) -> bool:
+        """
+        exports pin if it is not exported yet and waits until its attributes are writable
+        :param number: pin number
+        :return: False if pin is not available
+        """
+        if not self.is_exported(number):
+            self.write(os.path.join(self.root, "export"), str(number))
+        # udev sets attribute permissions shortly after export
+        deadline = time.monotonic() + self.export_timeout
+        while not os.access(self.path(number, "direction"), os.W_OK):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def unexport(self, number: int):
+        if self.is_exported(number):
+            self.write(os.path.join(self.root, "unexport"), str(number))
+
+    def edge_fd(self, number: int, value_fd: int) -> int:
+        """
+        gets descriptor to poll for edges of pin
+        :param number: pin number
+        :param value_fd: open value file
+        :return:
+        """
+        return value_fd
+
+    def ack_edge(self, fd: int):
+        """
+        clears pending edge on descriptor from edge_fd, reading value does it for sysfs
+        :param fd: descriptor
+        :return:
+        """
+        os.pread(fd, 16, 0)
+
+    def close(self):
+        pass
+
+
+class FakeSysfs(Sysfs):
+    """
+    gpio sysfs tree in temporary directory for tests on any Linux box: pins are exported with the same calls,
+    inputs are driven with set_input, edges are signalled through pipe per pin
+    """
+    edge_events = select.POLLIN
+
+    def __init__(self, root: str = None):
+        """
+        :param root: directory for tree, new temporary directory if None
+        """
+        super().__init__(root or tempfile.mkdtemp(prefix="gpio"), export_timeout=0)
+        self._own_root = root is None
+        self._pipes: Dict[int, tuple] = dict()
+        for name in ("export", "unexport"):
+            self.write(os.path.join(self.root, name), "")
+
+    def export(self, number: int) -> bool:
+        if not self.is_exported(number):
+            os.makedirs(self.path(number), exist_ok=True)
+            for name, text in (("direction", "in\n"), ("edge", "none\n"), ("value", "0\n"), ("active_low", "0\n")):
+                self.write(self.path(number, name), text)
+        return True
+
+    def unexport(self, number: int):
+        shutil.rmtree(self.path(number), ignore_errors=True)
+        for fd in self._pipes.pop(number, ()):
+            os.close(fd)
+
+    def edge_fd(self, number: int, value_fd: int) -> int:
+        if number not in self._pipes:
+            self._pipes[number] = os.pipe()
+            os.set_blocking(self._pipes[number][0], False)
+        return self._pipes[number][0]
+
+    def ack_edge(self, fd: int):
+        try:
+            while os.read(fd, 64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def get(self, number: int) -> int:
+        """
+        gets value written to pin, e.g. LED state
+        :param number: pin number
+        :return:
+        """
+        with open(self.path(number, "value")) as file:
+            return int(file.read().strip() or 0)
+
+    def set_input(self, number: int, value: int):
+        """
+        drives input pin like external signal: changes value and signals edge if pin is configured for it
+        :param number: pin number
+        :param value: 0 or 1
+        :return:
+        """
+        old = self.get(number)
+        self.write(self.path(number, "value"), "%d\n" % value)
+        with open(self.path(number, "edge")) as file:
+            edge = file.read().strip()
+        rising = old == 0 and value == 1
+        falling = old == 1 and value == 0
+        if (edge == "both" and (rising or falling)) or (edge == "rising" and rising) or \
+                (edge == "falling" and falling):
+            if number in self._pipes:
+                os.write(self._pipes[number][1], b'1')
+
+    def close(self):
+        for number in list(self._pipes):
+            for fd in self._pipes.pop(number):
+                os.close(fd)
+        if self._own_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Pin:
+    """
+    one exported pin with open value file
+    """
+
+    def __init__(self, number: int, direction: str = "in", edge: str = "none", sysfs: Sysfs = None):
+        """
+        :param number: pin number
+        :param direction: in or out
+        :param edge: none, rising, falling or both, edge is used by wait_edge
+        :param sysfs: sysfs tree, kernel one if None
+        """
+        self.number = number
+        self.direction = direction
+        self.edge = edge
+        self.sysfs = Sysfs() if sysfs is None else sysfs
+        self.error = ""
+        self.fd: Optional[int] = None
+        self._edge_fd: Optional[int] = None
+        self._poll = None
+        self.open()
+
+    def open(self):
+        """
+        exports pin, configures direction and edge, opens value file
+        :return:
+        """
+        self.error = ""
+        try:
+            if not self.sysfs.export(self.number):
+                self.error = "GPIO %d export error" % self.number
+                print(self.error)
+                return
+            self.sysfs.write(self.sysfs.path(self.number, "direction"), self.direction)
+            if self.direction == "in":
+                self.sysfs.write(self.sysfs.path(self.number, "edge"), self.edge)
+            self.fd = os.open(self.sysfs.path(self.number, "value"),
+                              os.O_RDWR if self.direction == "out" else os.O_RDONLY)
+        except OSError:
+            self.error = "GPIO %d open error" % self.number
+            print(self.error)
+            return
+        if self.direction == "in" and self.edge != "none":
+            self._edge_fd = self.sysfs.edge_fd(self.number, self.fd)
+            self._poll = select.poll()
+            self._poll.register(self._edge_fd, self.sysfs.edge_events)
+
+    @property
+    def is_open(self) -> bool:
+        return self.fd is not None
+
+    def read(self) -> Optional[int]:
+        """
+        reads pin value
+        :return: 0, 1 or None on error
+        """
+        self.error = ""
+        try:
+            return int(os.pread(self.fd, 16, 0).strip() or 0)
+        except (OSError, TypeError, ValueError):
+            self.error = "GPIO %d read error" % self.number
+            print(self.error)
+            return None
+
+    def write(self, value: int):
+        """
+        writes output value
+        :param value: 0 or 1
+        :return:
+        """
+        self.error = ""
+        try:
+            os.pwrite(self.fd, b'1\n' if value else b'0\n', 0)
+        except (OSError, TypeError):
+            self.error = "GPIO %d write error" % self.number
+            print(self.error)
+
+    def wait_edge(self, timeout: float = None) -> Optional[int]:
+        """
+        sleeps in poll() until configured edge or timeout
+        :param timeout: max time to wait in s, forever if None
+        :return: value after edge or None on timeout
+        """
+        if self._poll is None:
+            self.error = "GPIO %d has no edge configured" % self.number
+            print(self.error)
+            return None
+        events = self._poll.poll(None if timeout is None else max(timeout, 0) * 1000)
+        if not events:
+            return None
+        self.sysfs.ack_edge(self._edge_fd)
+        return self.read()
+
+    def wait_for(self, value: int, timeout: float = None) -> bool:
+        """
+        waits until pin has value, e.g. until button is pressed
+        :param value: value to wait for
+        :param timeout: max time to wait in s, forever if None
+        :return: False on timeout or error
+        """
+        self.error = ""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._poll is not None:
+            # edge which happened before this call is not a new one
+            self.sysfs.ack_edge(self._edge_fd)
+        while self.read() != value:
+            if self.error:
+                return False
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self._poll is not None:
+                self.wait_edge(remaining)
+            else:
+                time.sleep(0.01 if remaining is None else min(0.01, remaining))
+        return True
+
+    def close(self, unexport: bool = False):
+        """
+        closes value file
+        :param unexport: unexport pin as well
+        :return:
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._poll = None
+        self._edge_fd = None
+        if unexport:
+            try:
+                self.sysfs.unexport(self.number)
+            except OSError:
+                self.error = "GPIO %d unexport error" % self.number
+
+
+class GpioBank:
+    """
+    named pins of jig: outputs (LEDs) and inputs with edge detection (buttons)
+    """
+
+    def __init__(self, pins: Dict[str, int], inputs: Iterable[str] = ("button",), edge: str = "both",
+                 sysfs: Sysfs = None):
+        """
+        :param pins: pin numbers by name
+        :param inputs: names of input pins, other pins are outputs
+        :param edge: edge to detect on inputs
+        :param sysfs: sysfs tree, kernel one if None
+        """
+        self.sysfs = Sysfs() if sysfs is None else sysfs
+        inputs = set(inputs)
+        self.pins = {name: Pin(number, "in" if name in inputs else "out", edge if name in inputs else "none",
+                               self.sysfs)
+                     for name, number in pins.items()}
+
+    def __getitem__(self, name: str) -> Pin:
+        return self.pins[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def error(self) -> str:
+        return "; ".join(pin.error for pin in self.pins.values() if pin.error)
+
+    def close(self, unexport: bool = True):
+        """
+        closes all pins
+        :param unexport: unexport pins as well
+        :return:
+        """
+        for pin in self.pins.values():
+            pin.close(unexport)
+
+
+# simple test
+if __name__ == "__main__":
+    import threading
+
+    fake = FakeSysfs()
+    with GpioBank({"yellow": 25, "button": 27}, sysfs=fake) as bank:
+        bank["yellow"].write(1)
+        print("yellow", fake.get(25))
+        fake.set_input(27, 1)
+        threading.Timer(0.2, fake.set_input, (27, 0)).start()
+        start = time.monotonic()
+        print("pressed", bank["button"].wait_for(0, timeout=1), "in %.3f s" % (time.monotonic() - start))
+        print("timeout", bank["button"].wait_for(1, timeout=0.1))
+    fake.close()